@@ -0,0 +1,322 @@
+import threading
+import time
+from collections import namedtuple
+
+import MySQLdb
+import numpy as np
+
+import metrics
+
+# Platform-wide reports for users whose users.role is 'admin', in place of
+# hand-run SELECTs across everyone's rows. Like analytics.py this imports
+# numpy, so the views import it on first use.
+#
+# Each report reads one or two queries through an unbuffered (SSDictCursor)
+# cursor CHUNK_ROWS rows at a time and folds every chunk into fixed-size
+# NumPy arrays (bincount into per-month counters, log-spaced histograms for
+# percentiles), so memory depends on the number of months and categories,
+# never on the number of rows or users. Only the amount distribution has
+# to read transactions itself; the rest read the monthly_category_totals
+# rollup, which also keeps archived years. As GET requests the reports run
+# on a replica when MYSQL_REPLICAS is set (db.py).
+#
+# A report streams a progress event after each chunk and the result at the
+# end, and has `seconds` in all: the budget is checked between chunks and
+# passed to MySQL as a MAX_EXECUTION_TIME hint for the time before the first
+# row. A report that runs out of time, or whose client goes away, is
+# stopped by dropping its connection rather than reading the rest of the
+# result. At most max_running reports run at once per process; past that
+# callers get AdminBusy. A report's slot is freed when its events finish or,
+# for a response that is never read (HEAD, or a client gone before the
+# first chunk), by the release() the view registers with call_on_close.
+CHUNK_ROWS = 10000
+DEFAULT_MONTHS = 12
+MAX_MONTHS = 120
+TOP_CATEGORIES = 20
+PERCENTILES = (50, 75, 90, 95, 99)
+# Histogram buckets for amounts from 1 to 10^10, each about 2.3% wide, so
+# the percentiles are within that of the exact value
+DECADES = 10
+BUCKETS_PER_DECADE = 100
+EDGES = np.logspace(0, DECADES, DECADES * BUCKETS_PER_DECADE + 1)
+# MySQL's error for a statement stopped by MAX_EXECUTION_TIME
+ER_QUERY_TIMEOUT = 3024
+
+# month_key is year * 12 + month; a window covers keys first..last
+Window = namedtuple('Window', ['first', 'last'])
+
+ROLLUP_WINDOW = "year * 12 + month BETWEEN %s AND %s"
+USERS = "SELECT COUNT(*) AS users FROM users"
+# In primary key order, so a user's rows are contiguous and a (user, month)
+# pair's rows (one per category) are adjacent
+ACTIVE_USERS = ("SELECT {hint} user_id, year * 12 + month - %s AS month FROM monthly_category_totals "
+                "WHERE txn_count > 0 AND " + ROLLUP_WINDOW + " ORDER BY user_id, year, month")
+CATEGORY_SPEND = ("SELECT {hint} year * 12 + month - %s AS month, category, spending FROM monthly_category_totals "
+                  "WHERE spending > 0 AND " + ROLLUP_WINDOW)
+# Budgets as they stand now: category_budgets keeps no history of limits
+BUDGETS_CREATED = "SELECT {hint} YEAR(created_at) * 12 + MONTH(created_at) - %s AS month FROM category_budgets"
+BUDGET_SPENDING = """
+    SELECT {hint} r.year * 12 + r.month - %s AS month, r.total AS spent, b.budget_limit
+    FROM category_budgets b
+    JOIN monthly_category_totals r ON r.user_id = b.user_id AND r.category = b.category
+    WHERE r.year * 12 + r.month BETWEEN %s AND %s
+      AND r.year * 12 + r.month >= YEAR(b.created_at) * 12 + MONTH(b.created_at)
+"""
+TRANSACTION_AMOUNTS = "SELECT {hint} amount FROM transactions WHERE amount > 0 AND date >= %s AND date < %s"
+USER_MONTHLY_SPEND = ("SELECT {hint} SUM(spending) AS spent FROM monthly_category_totals WHERE " + ROLLUP_WINDOW
+                      + " GROUP BY user_id, year, month HAVING SUM(spending) > 0")
+
+# Created on the first run(), with that call's max_running
+_slots = None
+_slots_lock = threading.Lock()
+
+
+class AdminBusy(Exception):
+    pass
+
+
+class ReportTimeout(Exception):
+    pass
+
+
+def window(today, months):
+    last = today.year * 12 + today.month
+    return Window(last - months + 1, last)
+
+
+def labels(window):
+    return [f'{(key - 1) // 12}-{(key - 1) % 12 + 1:02d}' for key in range(window.first, window.last + 1)]
+
+
+def _month_start(key):
+    return f'{(key - 1) // 12}-{(key - 1) % 12 + 1:02d}-01 00:00:00'
+
+
+class Scan:
+    def __init__(self, cur, seconds):
+        self.cur = cur
+        self.started = time.monotonic()
+        self.deadline = self.started + seconds
+        self.rows = 0
+
+    def chunks(self, query, args):
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise ReportTimeout(self.rows)
+        try:
+            self.cur.execute(query.format(hint=f'/*+ MAX_EXECUTION_TIME({int(remaining * 1000)}) */'), args)
+            while True:
+                if time.monotonic() > self.deadline:
+                    raise ReportTimeout(self.rows)
+                rows = self.cur.fetchmany(CHUNK_ROWS)
+                if not rows:
+                    return
+                self.rows += len(rows)
+                yield rows
+        except MySQLdb.OperationalError as error:
+            if error.args and error.args[0] == ER_QUERY_TIMEOUT:
+                raise ReportTimeout(self.rows) from error
+            raise
+
+    def progress(self):
+        return {'progress': {'rows': self.rows, 'seconds': round(time.monotonic() - self.started, 3)}}
+
+
+def _column(rows, name, dtype):
+    return np.fromiter((row[name] for row in rows), dtype, len(rows))
+
+
+class Distribution:
+    # Counts per EDGES bucket, plus the exact count, sum and maximum
+    def __init__(self):
+        self.counts = np.zeros(len(EDGES) - 1, np.int64)
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def add(self, values):
+        if not len(values):
+            return
+        buckets = np.clip(np.searchsorted(EDGES, values, side='right') - 1, 0, len(self.counts) - 1)
+        self.counts += np.bincount(buckets, minlength=len(self.counts))
+        self.total += float(values.sum())
+        self.maximum = max(self.maximum, float(values.max()))
+
+    def summary(self):
+        count = int(self.counts.sum())
+        if not count:
+            return {'count': 0}
+        cumulative = np.cumsum(self.counts)
+        summary = {'count': count, 'mean': round(self.total / count, 2), 'max': self.maximum}
+        for percentile in PERCENTILES:
+            rank = percentile / 100 * count
+            bucket = int(np.searchsorted(cumulative, rank))
+            below = cumulative[bucket - 1] if bucket else 0
+            # Spread the bucket's values evenly on the log scale
+            fraction = (rank - below) / self.counts[bucket]
+            value = EDGES[bucket] * (EDGES[bucket + 1] / EDGES[bucket]) ** fraction
+            summary[f'p{percentile}'] = round(min(float(value), self.maximum), 2)
+        return summary
+
+
+def active_users(scan, window):
+    # Each chunk is reduced to its distinct (user, month) pairs and distinct
+    # users with np.unique. The scan's ordering means the only duplicates
+    # across chunks are the last pair and user of the chunk before, which
+    # are carried over and dropped.
+    months = window.last - window.first + 1
+    scan.cur.execute(USERS)
+    users = scan.cur.fetchall()[0]['users']
+    active = np.zeros(months, np.int64)
+    active_in_window = 0
+    last_pair = last_user = -1
+    for rows in scan.chunks(ACTIVE_USERS, [window.first, window.first, window.last]):
+        user_ids = _column(rows, 'user_id', np.int64)
+        pairs = np.unique(user_ids * months + _column(rows, 'month', np.int64))
+        pairs = pairs[pairs != last_pair]
+        distinct = np.unique(user_ids)
+        active += np.bincount(pairs % months, minlength=months)
+        active_in_window += len(distinct) - int(distinct[0] == last_user)
+        if len(pairs):
+            last_pair = int(pairs[-1])
+        last_user = int(distinct[-1])
+        yield scan.progress()
+    return {
+        'users': users,
+        'active_in_window': active_in_window,
+        'months': [{'month': label, 'active_users': int(count)} for label, count in zip(labels(window), active)],
+    }
+
+
+def category_spend(scan, window):
+    months = window.last - window.first + 1
+    codes = {}
+    spend = np.zeros((months, 64))
+    for rows in scan.chunks(CATEGORY_SPEND, [window.first, window.first, window.last]):
+        category = np.fromiter((codes.setdefault(row['category'], len(codes)) for row in rows), np.int64, len(rows))
+        if len(codes) > spend.shape[1]:
+            spend = np.pad(spend, ((0, 0), (0, max(len(codes), spend.shape[1] * 2) - spend.shape[1])))
+        flat = _column(rows, 'month', np.int64) * spend.shape[1] + category
+        spend += np.bincount(flat, weights=_column(rows, 'spending', np.float64),
+                             minlength=spend.size).reshape(spend.shape)
+        yield scan.progress()
+
+    names = list(codes)
+    spend = spend[:, :len(names)]
+    order = np.argsort(-spend.sum(axis=0), kind='stable')
+    top, rest = order[:TOP_CATEGORIES], order[TOP_CATEGORIES:]
+    categories = [{'category': names[code] or 'Uncategorised', 'total': round(float(spend[:, code].sum()), 2),
+                   'months': [round(float(value), 2) for value in spend[:, code]]} for code in top]
+    if len(rest):
+        other = spend[:, rest].sum(axis=1)
+        categories.append({'category': 'Other', 'categories': len(rest), 'total': round(float(other.sum()), 2),
+                           'months': [round(float(value), 2) for value in other]})
+    return {'months': labels(window), 'categories': categories}
+
+
+def budget_overruns(scan, window):
+    # A budget counts in every month from the one it was created in; it is
+    # overrun in a month whose rollup total is over its limit, the same
+    # comparison track_budget shows
+    months = window.last - window.first + 1
+    created = np.zeros(months + 1, np.int64)
+    for rows in scan.chunks(BUDGETS_CREATED, [window.first]):
+        # Budgets from before the window count from its first month, ones
+        # created after it (index months) not at all
+        month = np.clip(_column(rows, 'month', np.int64), 0, months)
+        created += np.bincount(month, minlength=months + 1)
+        yield scan.progress()
+    budgets = np.cumsum(created[:months])
+
+    overrun = np.zeros(months, np.int64)
+    overspend = Distribution()
+    for rows in scan.chunks(BUDGET_SPENDING, [window.first, window.first, window.last]):
+        spent = _column(rows, 'spent', np.float64)
+        limit = _column(rows, 'budget_limit', np.float64)
+        over = spent > limit
+        overrun += np.bincount(_column(rows, 'month', np.int64)[over], minlength=months)
+        # Percent of the limit spent, for budgets that were overrun
+        overspend.add(100 * spent[over & (limit > 0)] / limit[over & (limit > 0)])
+        yield scan.progress()
+
+    total = int(budgets.sum())
+    return {
+        'overrun_rate': round(int(overrun.sum()) / total, 4) if total else None,
+        'percent_of_limit_when_overrun': overspend.summary(),
+        'months': [{'month': label, 'budgets': int(count), 'overrun': int(over),
+                    'rate': round(int(over) / int(count), 4) if count else None}
+                   for label, count, over in zip(labels(window), budgets, overrun)],
+    }
+
+
+def distribution(scan, window):
+    amounts = Distribution()
+    for rows in scan.chunks(TRANSACTION_AMOUNTS, [_month_start(window.first), _month_start(window.last + 1)]):
+        amounts.add(_column(rows, 'amount', np.float64))
+        yield scan.progress()
+    monthly = Distribution()
+    for rows in scan.chunks(USER_MONTHLY_SPEND, [window.first, window.last]):
+        monthly.add(_column(rows, 'spent', np.float64))
+        yield scan.progress()
+    # Archived years are out of the transactions table, so transaction
+    # amounts only cover the months still in it
+    return {'months': labels(window), 'transaction_amount': amounts.summary(), 'user_monthly_spend': monthly.summary()}
+
+
+REPORTS = {
+    'active_users': active_users,
+    'category_spend': category_spend,
+    'budget_overruns': budget_overruns,
+    'distribution': distribution,
+}
+
+
+def _slot(max_running):
+    global _slots
+    with _slots_lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(max_running)
+    return _slots.acquire(blocking=False)
+
+
+def run(name, cursor_factory, abandon, window, seconds, max_running=1):
+    # Returns (events, release). abandon() is called to drop the connection
+    # if the report does not finish. release() frees the slot and may be
+    # called any number of times; the events call it when they end, but a
+    # generator that is never started cannot, so the caller must call it
+    # too once the response is closed.
+    if not _slot(max_running):
+        metrics.counter('admin_reports_rejected_total', 'Admin reports rejected because too many were running').inc()
+        raise AdminBusy(name)
+    released = False
+
+    def release():
+        nonlocal released
+        if not released:
+            released = True
+            _slots.release()
+
+    try:
+        cur = cursor_factory()
+    except BaseException:
+        release()
+        raise
+    return _events(name, Scan(cur, seconds), abandon, window, release), release
+
+
+def _events(name, scan, abandon, window, release):
+    finished = False
+    try:
+        result = yield from REPORTS[name](scan, window)
+        finished = True
+        yield {'result': result, 'rows': scan.rows, 'seconds': round(time.monotonic() - scan.started, 3)}
+    except ReportTimeout:
+        metrics.counter('admin_reports_timed_out_total', 'Admin reports stopped by their time budget').inc()
+        yield {'error': f'stopped after {round(scan.deadline - scan.started)}s', 'rows': scan.rows}
+    finally:
+        release()
+        if finished:
+            scan.cur.close()
+        else:
+            abandon()
+        metrics.histogram('admin_report_seconds', 'Admin report run time', buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300),
+                          report=name).observe(time.monotonic() - scan.started)
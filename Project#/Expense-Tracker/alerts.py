@@ -0,0 +1,100 @@
+from collections import namedtuple
+
+# Budget alerts are evaluated when a write changes a user's spending, using
+# the running (user, year, month, category) totals in monthly_category_totals
+# rather than re-summing transactions. Each threshold fires once per month
+# and scope: the alert row is inserted with INSERT IGNORE, and removed again
+# if spending falls back below the threshold so a later crossing re-fires.
+Alert = namedtuple('Alert', ['kind', 'category', 'threshold', 'spent', 'limit'])
+
+MONTHLY = 'monthly'
+CATEGORY = 'category'
+
+
+def transaction_key(cur, transaction_id, user_id=None):
+    # With user_id, None unless the transaction is that user's
+    owner = " AND user_id = %s" if user_id is not None else ""
+    cur.execute("""
+        SELECT user_id, date, YEAR(date) AS year, MONTH(date) AS month, COALESCE(category, '') AS category
+        FROM transactions WHERE id = %s""" + owner, [transaction_id] + ([user_id] if user_id is not None else []))
+    return cur.fetchone()
+
+
+def evaluate(cur, user_id, year, month, category, thresholds):
+    # After a transaction write touching one category
+    return (_evaluate_category(cur, user_id, year, month, category, thresholds)
+            + _evaluate_monthly(cur, user_id, year, month, thresholds))
+
+
+def evaluate_month(cur, user_id, year, month, thresholds):
+    # After a budget changes: re-check every category with a limit
+    cur.execute("SELECT category FROM category_budgets WHERE user_id = %s", [user_id])
+    events = []
+    for row in cur.fetchall():
+        events += _evaluate_category(cur, user_id, year, month, row['category'], thresholds)
+    return events + _evaluate_monthly(cur, user_id, year, month, thresholds)
+
+
+def _evaluate_category(cur, user_id, year, month, category, thresholds):
+    cur.execute("""
+        SELECT cb.budget_limit, COALESCE(r.total, 0) AS spent
+        FROM category_budgets cb
+        LEFT JOIN monthly_category_totals r ON r.user_id = cb.user_id AND r.category = cb.category
+            AND r.year = %s AND r.month = %s
+        WHERE cb.user_id = %s AND cb.category = %s
+    """, (year, month, user_id, category))
+    row = cur.fetchone()
+    if not row:
+        return []
+    return _apply(cur, user_id, year, month, CATEGORY, category, row['spent'], row['budget_limit'], thresholds)
+
+
+def _evaluate_monthly(cur, user_id, year, month, thresholds):
+    cur.execute("""
+        SELECT ub.monthly_budget,
+               (SELECT COALESCE(SUM(total), 0) FROM monthly_category_totals
+                WHERE user_id = ub.user_id AND year = %s AND month = %s) AS spent
+        FROM user_budget ub
+        WHERE ub.user_id = %s
+    """, (year, month, user_id))
+    row = cur.fetchone()
+    if not row:
+        return []
+    return _apply(cur, user_id, year, month, MONTHLY, '', row['spent'], row['monthly_budget'], thresholds)
+
+
+def _apply(cur, user_id, year, month, kind, category, spent, limit, thresholds):
+    events = []
+    if not limit or limit <= 0:
+        return events
+    for threshold in thresholds:
+        if float(spent) >= float(limit) * threshold:
+            cur.execute("""
+                INSERT IGNORE INTO budget_alerts (user_id, year, month, kind, category, threshold, spent, budget_limit)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            """, (user_id, year, month, kind, category, int(threshold * 100), spent, limit))
+            if cur.rowcount == 1:
+                events.append(Alert(kind, category, threshold, spent, limit))
+        else:
+            cur.execute("""
+                DELETE FROM budget_alerts
+                WHERE user_id = %s AND year = %s AND month = %s AND kind = %s AND category = %s AND threshold = %s
+            """, (user_id, year, month, kind, category, int(threshold * 100)))
+    return events
+
+
+def message(alert):
+    scope = f"your {alert.category} budget" if alert.kind == CATEGORY else 'your monthly budget'
+    if alert.threshold >= 1:
+        return f"You have gone over {scope}: ₹{alert.spent} spent of ₹{alert.limit}."
+    return f"You have used {int(alert.threshold * 100)}% of {scope}: ₹{alert.spent} spent of ₹{alert.limit}."
+
+
+def for_month(cur, user_id, year, month):
+    cur.execute("""
+        SELECT kind, category, threshold, spent, budget_limit, created_at
+        FROM budget_alerts
+        WHERE user_id = %s AND year = %s AND month = %s
+        ORDER BY created_at DESC
+    """, (user_id, year, month))
+    return cur.fetchall()
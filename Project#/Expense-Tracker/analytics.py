@@ -0,0 +1,149 @@
+# Analytics live here rather than in app.py. pandas and numpy cost hundreds
+# of milliseconds and tens of MB per worker, so the web app only imports
+# this module inside the routes that need it (`import analytics` in the view
+# body). bench/startup.py fails if the core web path starts importing them
+# again. Report charts are drawn by charts.py, in the report pool only, so
+# matplotlib stays out of here.
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import periods
+
+# A user's transactions as parallel arrays: day is days since 1970-01-01 in
+# the DB session's time zone (TO_DAYS, so it agrees with DATE(date)), and
+# category holds codes into names. Everything in insights() works on these
+# with bincount/cumsum, never looping over rows in Python.
+Columns = namedtuple('Columns', ['day', 'amount', 'category', 'names'])
+
+EPOCH_TO_DAYS = 719528  # TO_DAYS('1970-01-01')
+HISTORY_MONTHS = 13     # this month plus a year back, for year-over-year
+WEEKDAY_WINDOW = 84     # 12 of each weekday
+
+
+def history_start(today):
+    first = today.replace(day=1)
+    months = first.year * 12 + first.month - 1 - (HISTORY_MONTHS - 1)
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def load(cur, user_id, today):
+    # One range scan on idx_user_date for the whole window
+    start, end = history_start(today), today + timedelta(days=1)
+    window = periods.Period(datetime(start.year, start.month, 1), datetime(end.year, end.month, end.day))
+    cur.execute("SELECT TO_DAYS(date) - %s AS day, amount, COALESCE(category, '') AS category FROM transactions "
+                "WHERE user_id = %s AND " + periods.condition(), [EPOCH_TO_DAYS, user_id] + periods.params(window))
+    return columns(cur.fetchall())
+
+
+def columns(rows):
+    count = len(rows)
+    day = np.fromiter((row['day'] for row in rows), np.int64, count)
+    amount = np.fromiter((row['amount'] for row in rows), np.float64, count)
+    codes, names = pd.factorize(np.array([row['category'] for row in rows], dtype=object))
+    return Columns(day, amount, codes, list(names))
+
+
+def _day_number(when):
+    return (when - date(1970, 1, 1)).days
+
+
+def daily_totals(data, start, end):
+    # Spend per calendar day from start to end inclusive, zero-filled
+    first, last = _day_number(start), _day_number(end)
+    keep = (data.day >= first) & (data.day <= last)
+    return np.bincount(data.day[keep] - first, weights=data.amount[keep], minlength=last - first + 1)
+
+
+def rolling_mean(daily, window):
+    # Trailing mean over up to `window` days, via one cumulative sum
+    sums = np.concatenate(([0.0], np.cumsum(daily)))
+    ends = np.arange(1, len(daily) + 1)
+    starts = np.maximum(ends - window, 0)
+    return (sums[ends] - sums[starts]) / (ends - starts)
+
+
+def category_deltas(data, today):
+    # Month-to-date spend per category against the same days of last month
+    # and of this month last year, so a partial month compares like for like
+    start = history_start(today)
+    first = _day_number(start)
+    days = np.datetime64(start, 'D') + np.arange(_day_number(today) - first + 1)
+    month_index = (days.astype('datetime64[M]') - np.datetime64(start, 'M')).astype(np.int64)
+    day_of_month = (days - days.astype('datetime64[M]')).astype(np.int64) + 1
+
+    offset = data.day - first
+    keep = (offset >= 0) & (offset < len(days))
+    offset, amount, codes = offset[keep], data.amount[keep], data.category[keep]
+    to_date = day_of_month[offset] <= today.day
+
+    width = len(data.names)
+    table = np.bincount(month_index[offset[to_date]] * width + codes[to_date], weights=amount[to_date],
+                        minlength=HISTORY_MONTHS * width).reshape(HISTORY_MONTHS, width)
+    this_month, last_month, last_year = table[-1], table[-2], table[0]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mom_pct = np.where(last_month > 0, (this_month - last_month) / last_month * 100, np.nan)
+        yoy_pct = np.where(last_year > 0, (this_month - last_year) / last_year * 100, np.nan)
+
+    order = np.argsort(-this_month, kind='stable')
+    return [{
+        'category': data.names[i],
+        'month_to_date': _number(this_month[i]),
+        'last_month_to_date': _number(last_month[i]),
+        'last_year_to_date': _number(last_year[i]),
+        'mom_delta': _number(this_month[i] - last_month[i]),
+        'mom_pct': _number(mom_pct[i]),
+        'yoy_delta': _number(this_month[i] - last_year[i]),
+        'yoy_pct': _number(yoy_pct[i]),
+    } for i in order if this_month[i] or last_month[i] or last_year[i]]
+
+
+def weekday_means(daily, end):
+    # Average spend per weekday over the trailing WEEKDAY_WINDOW days
+    recent = daily[-WEEKDAY_WINDOW:]
+    weekdays = (_day_number(end) - np.arange(len(recent))[::-1] + 3) % 7  # 1970-01-01 was a Thursday
+    counts = np.bincount(weekdays, minlength=7)
+    return np.bincount(weekdays, weights=recent, minlength=7) / np.maximum(counts, 1)
+
+
+def month_end_forecast(daily, today, by_weekday, monthly_budget=None, savings_goal=None):
+    # Month-to-date spend plus the weekday averages for the days still to come
+    month_end = periods.month(today.year, today.month).end.date()
+    spent = float(daily[-today.day:].sum())
+    remaining = (_day_number(today) + 1 + np.arange((month_end - today).days - 1) + 3) % 7
+    projected = spent + float(by_weekday[remaining].sum())
+
+    forecast = {'spent': _number(spent), 'projected': _number(projected), 'days_left': len(remaining)}
+    if monthly_budget:
+        budget = float(monthly_budget)
+        forecast.update(budget=_number(budget), projected_vs_budget=_number(projected - budget),
+                        projected_pct_of_budget=_number(projected / budget * 100), over_budget=projected > budget)
+        if savings_goal is not None:
+            forecast.update(savings_goal=_number(savings_goal),
+                            meets_savings_goal=budget - projected >= float(savings_goal))
+    return forecast
+
+
+def insights(data, today, monthly_budget=None, savings_goal=None, days=30):
+    daily = daily_totals(data, history_start(today), today)
+    average_7 = rolling_mean(daily, 7)
+    average_30 = rolling_mean(daily, 30)
+    by_weekday = weekday_means(daily, today)
+
+    recent = np.datetime64(today, 'D') - np.arange(days)[::-1]
+    return {
+        'date': today.isoformat(),
+        'rolling': [{'date': str(day), 'total': _number(total), 'avg_7d': _number(a7), 'avg_30d': _number(a30)}
+                    for day, total, a7, a30 in zip(recent, daily[-days:], average_7[-days:], average_30[-days:])],
+        'categories': category_deltas(data, today),
+        'weekdays': [{'day': name, 'average': _number(value)} for name, value in zip(periods.WEEKDAY_LABELS, by_weekday)],
+        'forecast': month_end_forecast(daily, today, by_weekday, monthly_budget, savings_goal),
+    }
+
+
+def _number(value):
+    value = float(value)
+    return None if np.isnan(value) else round(value, 2)
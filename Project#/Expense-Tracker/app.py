@@ -1,25 +1,129 @@
-from flask import Flask, render_template, request, flash, redirect, url_for, session, jsonify
-from flask_mysqldb import MySQL
+from flask import Flask, Response, abort, current_app, g, render_template, stream_template, stream_with_context, request, flash, redirect, url_for, session, jsonify, make_response
+import click
+from flask.cli import AppGroup, with_appcontext
+from werkzeug.local import LocalProxy
+from db import PooledMySQL
+import MySQLdb.cursors
 from wtforms import Form, StringField, PasswordField, IntegerField, EmailField, validators
-from passlib.hash import sha256_crypt
 from functools import wraps
+from contextlib import closing
 import timeago
-from datetime import datetime, timedelta
-from flask_mail import Mail, Message
-import plotly.graph_objects as go
-import pandas as pd
-
-import seaborn as sns
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
+from datetime import datetime, timedelta, timezone
+from flask_mail import Mail
+from itsdangerous import URLSafeTimedSerializer as Serializer
 import os
-app = Flask(__name__, static_url_path='/static',
-           )
-app.config.from_pyfile('config.py')
-
-mysql = MySQL(app)
-mail = Mail(app)
+import hmac
+import json
+import pickle
+import time
+import zlib
+import periods
+import history
+import rollup
+import versions
+import hashing
+import metrics
+import outbox
+import bulk
+import cache
+import alerts
+import delta
+import instrumentation
+import repository
+import idempotency
+import archive
+import partitions
+import search
+import assets
+import reports
+# The app is built by create_app(), once per process by wsgi.py and the
+# flask CLI (which finds the factory here) and once per run by the tests.
+# Views, error handlers and CLI commands are collected below as the module
+# is imported and attached to each app by register_routes() and
+# register_commands() under their function names, so endpoints and
+# url_for() stay as they were. mysql, the caches and report_cache are the
+# current app's, set up by create_app().
+_views = []
+_error_handlers = []
+_commands = []
+
+def _extension(name):
+    return LocalProxy(lambda: current_app.extensions[name])
+
+mysql = _extension('mysql')
+mail = Mail()
+dashboard_cache = _extension('dashboard_cache')
+insights_cache = _extension('insights_cache')
+# Recent series snapshots per (user, sync token), for /api/dashboard deltas
+dashboard_snapshots = _extension('dashboard_snapshots')
+report_cache = _extension('report_cache')
+
+def create_app(config=None):
+    # config, a mapping, is applied over config.py
+    app = Flask(__name__, static_url_path='/static')
+    app.config.from_pyfile('config.py')
+    if config:
+        app.config.update(config)
+
+    if app.config.get('DATABASE_BACKEND') == 'sqlite':
+        import sqlite_backend
+        app.extensions['mysql'] = sqlite_backend.SQLiteDB(app)
+    else:
+        app.extensions['mysql'] = PooledMySQL(app)
+    mail.init_app(app)
+    # The hashing and report pools are per process, not per app
+    hashing.service.configure(app.config)
+    reports.service.configure(app.config)
+    instrumentation.init_app(app)
+    assets.init_app(app)
+    app.extensions['dashboard_cache'] = cache.UserCache(
+        'dashboard', cache.LocalCache(app.config['DASHBOARD_CACHE_ENTRIES'], app.config['DASHBOARD_CACHE_BYTES']),
+        cache.shared_client(app.config.get('CACHE_REDIS_URL')))
+    app.extensions['insights_cache'] = cache.UserCache(
+        'insights', cache.LocalCache(app.config['DASHBOARD_CACHE_ENTRIES'], app.config['DASHBOARD_CACHE_BYTES']))
+    app.extensions['dashboard_snapshots'] = cache.LocalCache(app.config['DASHBOARD_CACHE_ENTRIES'] * 4,
+                                                             app.config['DASHBOARD_CACHE_BYTES'])
+    app.extensions['report_cache'] = reports.DiskCache(app.config['REPORT_CACHE_DIR'], app.config['REPORT_CACHE_BYTES'])
+
+    register_routes(app)
+    register_commands(app)
+    return app
+
+def register_routes(app):
+    for rule, view, options in _views:
+        app.add_url_rule(rule, view_func=view, **options)
+    for exception, handler in _error_handlers:
+        app.register_error_handler(exception, handler)
+    app.teardown_appcontext(invalidate_written_users)
+
+def register_commands(app):
+    for command in _commands:
+        app.cli.add_command(command)
+
+def route(rule, **options):
+    def register(view):
+        _views.append((rule, view, options))
+        return view
+    return register
+
+def errorhandler(exception):
+    def register(handler):
+        _error_handlers.append((exception, handler))
+        return handler
+    return register
+
+def cli_command(name):
+    # A top-level `flask <name>` command, run in an app context
+    def register(f):
+        command = click.command(name)(with_appcontext(f))
+        _commands.append(command)
+        return command
+    return register
+
+def cli_group(name, help):
+    group = AppGroup(name, help=help)
+    _commands.append(group)
+    return group
 
 class TransactionForm(Form):
     amount = IntegerField('Amount', [validators.NumberRange(min=1, max=1000000)])
@@ -62,15 +166,123 @@ def is_logged_in(f):
             return redirect(url_for('login'))
     return wrap
 
-@app.route('/')
+def is_admin(f):
+    # users.role is read on every request, so revoking it takes effect at once
+    @wraps(f)
+    @is_logged_in
+    def wrap(*args, **kwargs):
+        with mysql.connection.cursor() as cur:
+            role = repository.user_role(cur, session['userID'])
+        if role != 'admin':
+            abort(403)
+        return f(*args, **kwargs)
+    return wrap
+
+def record_write(cur, user_id):
+    # Call on the write's cursor before committing. Cached aggregates for
+    # the user are dropped once the app context ends, after the commit.
+    session['data_version'] = versions.bump(cur, user_id)[0]
+    g.setdefault('written_users', set()).add(user_id)
+
+def evaluate_budgets(cur, user_id, year, month, category=None):
+    # Call after the rollup is updated; returns any budget threshold crossed
+    thresholds = current_app.config['BUDGET_ALERT_THRESHOLDS']
+    if category is None:
+        return alerts.evaluate_month(cur, user_id, year, month, thresholds)
+    return alerts.evaluate(cur, user_id, year, month, category, thresholds)
+
+def check_budgets(cur, user_id, year, month, category=None):
+    # As evaluate_budgets, flashing the alerts for the next page
+    for alert in evaluate_budgets(cur, user_id, year, month, category):
+        flash(alerts.message(alert), 'danger' if alert.threshold >= 1 else 'warning')
+
+def invalidate_written_users(exception):
+    for user_id in g.pop('written_users', ()):
+        dashboard_cache.invalidate(user_id)
+        insights_cache.invalidate(user_id)
+
+def current_version(user_id):
+    return versions.current(lambda: mysql.connection.cursor(), user_id,
+                            session.get('data_version', 0), current_app.config['DATA_VERSION_TTL'])
+
+def conditional_on_writes(f=None, since=None):
+    # Answers If-None-Match/If-Modified-Since from the user's write version
+    # before the view runs, so unchanged data never reaches MySQL. A view
+    # whose answer also depends on the date passes since(**view_args): the
+    # local time its current answer started to apply (e.g. the start of this
+    # year), or None. It goes into the ETag and is a floor for
+    # Last-Modified, so a validator from before it is not honoured. The
+    # query string is part of the ETag as well.
+    if f is None:
+        return lambda f: conditional_on_writes(f, since)
+
+    @wraps(f)
+    def wrap(*args, **kwargs):
+        user_id = session['userID']
+        version, modified = current_version(user_id)
+        etag = f"{request.endpoint}-{user_id}-{version}"
+        started = since(**kwargs) if since else None
+        if started is not None:
+            started = started.astimezone(timezone.utc)
+            etag += f"-{started:%Y%m%d%H}"
+            modified = max(modified, started)
+        if request.query_string:
+            etag += f"-{zlib.crc32(request.query_string):08x}"
+
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains(etag)
+        else:
+            not_modified = request.if_modified_since is not None and request.if_modified_since >= modified
+
+        response = make_response('', 304) if not_modified else make_response(f(*args, **kwargs))
+        response.set_etag(etag)
+        response.last_modified = modified
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+    return wrap
+
+def _start_of_year(**view_args):
+    return datetime(datetime.now().year, 1, 1)
+
+def _start_of_report_day(year, month, **view_args):
+    day = reports.running_day(year, month, datetime.now().date())
+    return datetime(day.year, day.month, day.day) if day else None
+
+@errorhandler(hashing.HashingBusy)
+def hashing_busy(error):
+    flash('The server is busy right now. Please try again in a moment.', 'warning')
+    response = redirect(request.url)
+    response.headers['Retry-After'] = '1'
+    return response
+
+@errorhandler(reports.ReportsBusy)
+def reports_busy(error):
+    return 'Report rendering is busy right now. Please try again in a moment.', 503, {'Retry-After': '5'}
+
+@route('/metrics')
+def metrics_endpoint():
+    # Scrapers send METRICS_TOKEN as a bearer token; admins can look from a
+    # logged-in browser
+    token = current_app.config.get('METRICS_TOKEN')
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not (token and hmac.compare_digest(supplied.encode(), token.encode())):
+        if 'logged_in' not in session:
+            abort(403)
+        with mysql.connection.cursor() as cur:
+            if repository.user_role(cur, session['userID']) != 'admin':
+                abort(403)
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4'}
+
+@route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/about')
+@route('/about')
 def about():
     return render_template('about.html')
 
-@app.route('/signup', methods=['GET', 'POST'])
+@route('/signup', methods=['GET', 'POST'])
 def signup():
     if 'logged_in' in session:
         flash('You are already logged in', 'info')
@@ -82,23 +294,21 @@ def signup():
         last_name = form.last_name.data
         email = form.email.data
         username = form.username.data
-        password = sha256_crypt.encrypt(str(form.password.data))
+        password = hashing.service.hash(form.password.data)
 
         with mysql.connection.cursor() as cur:
-            result = cur.execute("SELECT * FROM users WHERE email=%s", [email])
-            if result > 0:
+            if repository.user_by_email(cur, email):
                 flash('The entered email address has already been taken. Please try using or creating another one.', 'info')
                 return redirect(url_for('signup'))
             else:
-                cur.execute("INSERT INTO users(first_name, last_name, email, username, password) VALUES(%s, %s, %s, %s, %s)",
-                            (first_name, last_name, email, username, password))
+                repository.create_user(cur, first_name, last_name, email, username, password)
                 mysql.connection.commit()
                 flash('You are now registered and can log in', 'success')
                 return redirect(url_for('login'))
 
     return render_template('signUp.html', form=form)
 
-@app.route('/login', methods=['GET', 'POST'])
+@route('/login', methods=['GET', 'POST'])
 def login():
     if 'logged_in' in session:
         flash('You are already logged in', 'info')
@@ -110,11 +320,12 @@ def login():
         password_input = form.password.data
 
         with mysql.connection.cursor() as cur:
-            result = cur.execute("SELECT * FROM users WHERE username = %s", [username])
-            if result > 0:
-                data = cur.fetchone()
+            data = repository.user_by_username(cur, username)
+            if data:
                 password = data['password']
-                if sha256_crypt.verify(password_input, password):
+                if hashing.service.verify(password_input, password):
+                    if hashing.service.needs_update(password):
+                        _upgrade_password(cur, data['id'], password_input)
                     session['logged_in'] = True
                     session['username'] = username
                     session['userID'] = data['id']
@@ -129,7 +340,16 @@ def login():
 
     return render_template('login.html', form=form)
 
-@app.route('/logout')
+def _upgrade_password(cur, user_id, password):
+    # Rehash with the configured HASH_ROUNDS; skipped if the pool is busy
+    try:
+        new_hash = hashing.service.hash(password)
+    except hashing.HashingBusy:
+        return
+    repository.set_password(cur, user_id, new_hash)
+    mysql.connection.commit()
+
+@route('/logout')
 @is_logged_in
 def logout():
     session.clear()
@@ -139,82 +359,261 @@ def logout():
 
 
 
-@app.route('/addTransactions', methods=['GET', 'POST'])
+@route('/addTransactions', methods=['GET', 'POST'])
 @is_logged_in
 def addTransactions():
     if request.method == 'POST':
         # Handle regular form submission
         if 'amount' in request.form:
-            amount = request.form['amount']
-            description = request.form['description']
-            category = request.form['category']
-            # Assuming you have a date input in your form
-
-            with mysql.connection.cursor() as cur:
-                cur.execute("INSERT INTO transactions(user_id, amount, description, category) VALUES(%s, %s, %s, %s)",
-                            (session['userID'], amount, description, category))
-                mysql.connection.commit()
-                with mysql.connection.cursor() as cur:
-                  cur.execute("SELECT SUM(amount) FROM transactions WHERE MONTH(date) = MONTH(CURRENT_DATE()) AND YEAR(date) = YEAR(CURRENT_DATE()) AND user_id = %s", [session['userID']])
-                  totalExpenses = cur.fetchone()['SUM(amount)'] or 0
+            # Dated here so the rollup and alerts need no read-back
+            now = datetime.now().replace(microsecond=0)
+            form = TransactionForm(request.form)
+            form.date.data = now.strftime('%Y-%m-%d %H:%M:%S')
 
-                  cur.execute("SELECT * FROM transactions WHERE MONTH(date) = MONTH(CURRENT_DATE()) AND YEAR(date) = YEAR(CURRENT_DATE()) AND user_id = %s ORDER BY date DESC", [session['userID']])
-                  transactions = cur.fetchall()
+            if form.validate():
+                amount = form.amount.data
+                description = form.description.data
+                category = form.category.data
+
+                with mysql.connection.cursor() as cur:
+                    transaction_id = repository.add_transaction(cur, session['userID'], amount, description, category, now)
+                    search.add(cur, session['userID'], [(transaction_id, description, category, now)])
+                    rollup.add_rows(cur, session['userID'], [(amount, category, now)])
+                    check_budgets(cur, session['userID'], now.year, now.month, category)
+                    record_write(cur, session['userID'])
+                    mysql.connection.commit()
 
-                for transaction in transactions:
-                   transaction['date'] = timeago.format(transaction['date'], datetime.now()) if datetime.now() - transaction['date'] < timedelta(days=0.5) else transaction['date'].strftime('%d %B, %Y')
-                   flash('Transaction Successfully Recorded', 'success')
+                flash('Transaction Successfully Recorded', 'success')
                 return redirect(url_for('addTransactions'))
 
+            flash('Enter an amount from 1 to 1000000, a category and a description', 'danger')
+
         
         
 
     # Fetch total expenses and transactions for rendering
+    month = periods.current_month()
     with mysql.connection.cursor() as cur:
-        cur.execute("SELECT SUM(amount) FROM transactions WHERE MONTH(date) = MONTH(CURRENT_DATE()) AND YEAR(date) = YEAR(CURRENT_DATE()) AND user_id = %s", [session['userID']])
-        totalExpenses = cur.fetchone()['SUM(amount)'] or 0
-
-        cur.execute("SELECT * FROM transactions WHERE MONTH(date) = MONTH(CURRENT_DATE()) AND YEAR(date) = YEAR(CURRENT_DATE()) AND user_id = %s ORDER BY date DESC", [session['userID']])
-        transactions = cur.fetchall()
+        totalExpenses = repository.period_spending(cur, session['userID'], month)
+        transactions = repository.period_transactions(cur, session['userID'], month)
 
         for transaction in transactions:
             transaction['date'] = timeago.format(transaction['date'], datetime.now()) if datetime.now() - transaction['date'] < timedelta(days=0.5) else transaction['date'].strftime('%d %B, %Y')
 
         return render_template('addTransactions.html', totalExpenses=totalExpenses, transactions=transactions)
-@app.route('/transactionHistory', methods=['GET', 'POST'])
+@route('/transactionHistory', methods=['GET', 'POST'])
 @is_logged_in
 def transactionHistory():
     user_id = session['userID']
     selected_category = request.args.get('category', default=None)
 
+    if request.method == 'POST':
+        filters = _period_filters(request.form.get('month'), request.form.get('year'))
+    else:
+        filters = {'category': selected_category}
+    category, period = _history_filters(filters)
+
     with mysql.connection.cursor() as cur:
-        cur.execute("SELECT DISTINCT category FROM transactions WHERE user_id = %s", [user_id])
-        categories = cur.fetchall()
+        categories = rollup.categories(cur, user_id)
 
-        if request.method == 'POST':
-            month = request.form['month']
-            year = request.form['year']
-            if month == "00":
-                cur.execute("SELECT SUM(amount) FROM transactions WHERE YEAR(date) = %s AND user_id = %s", [year, user_id])
+        if period:
+            month = int(filters['month']) or None
+            totalExpenses = rollup.period_total(cur, user_id, int(filters['year']), month) or 0
+        else:
+            totalExpenses = rollup.period_total(cur, user_id) or 0
+
+    # Only the first page is rendered; the rows are streamed straight from a
+    # server-side cursor and the table fetches further pages as it scrolls.
+    return stream_template('transactionHistory.html', totalExpenses=totalExpenses,
+                           transactions=_stream_history(user_id, category, period),
+                           categories=categories, selected_category=selected_category,
+                           page_url=url_for('transactionHistoryPage', **filters))
+
+@route('/transactionHistory/page')
+@is_logged_in
+def transactionHistoryPage():
+    category, period = _history_filters(request.args)
+    transactions = list(_stream_history(session['userID'], category, period, request.args.get('cursor')))
+    for transaction in transactions:
+        transaction['delete_url'] = url_for('deleteTransaction', id=transaction['id'])
+
+    next_cursor = transactions[-1]['cursor'] if len(transactions) == history.PAGE_SIZE else None
+    return jsonify(transactions=transactions, next_cursor=next_cursor)
+
+def _period_filters(month, year):
+    # The month/year filter as values periods.from_form() accepts: a month
+    # outside 1-12 falls back to the whole year, and a year that is not a
+    # number drops the filter
+    if not (year or '').isdigit() or not 1 <= int(year) < datetime.max.year:
+        return {}
+    if not (month or '').isdigit() or not 0 <= int(month) <= 12:
+        month = '00'
+    return {'month': month, 'year': year}
+
+def _history_filters(values):
+    period = None
+    filters = _period_filters(values.get('month', '00'), values.get('year'))
+    if filters:
+        period = periods.from_form(filters['month'], filters['year'])
+    return values.get('category') or None, period
+
+def _stream_history(user_id, category, period, cursor=None):
+    # Archived years are merged in once the table's rows reach them
+    with mysql.connection.cursor(MySQLdb.cursors.SSDictCursor) as cur:
+        rows = archive.history(repository.history_page(cur, user_id, category, period, cursor, history.PAGE_SIZE),
+                               current_app.config['ARCHIVE_DIR'], user_id, category, period,
+                               history.decode_cursor(cursor), history.PAGE_SIZE)
+        for row in rows:
+            yield history.format_row(row)
+
+@route('/api/transactions/search')
+@is_logged_in
+@conditional_on_writes
+def transactionSearch():
+    # Prefix search over descriptions and categories, in history order with
+    # keyset pages; facet counts come with the first page only
+    user_id = session['userID']
+    query = request.args.get('q', '').strip()
+    category = request.args.get('category') or None
+    period = search.parse_range(request.args.get('from'), request.args.get('to'))
+    cursor = request.args.get('cursor')
+
+    with mysql.connection.cursor() as cur:
+        found = search.match(cur, user_id, query)
+        transactions = [history.format_row(row) for row in search.search(cur, found, category, period, cursor)]
+        facets = None if cursor else search.facets(cur, found, category, period)
+
+    for transaction in transactions:
+        transaction['delete_url'] = url_for('deleteTransaction', id=transaction['id'])
+    next_cursor = transactions[-1]['cursor'] if len(transactions) == history.PAGE_SIZE else None
+    return jsonify(query=query, transactions=transactions, next_cursor=next_cursor, facets=facets)
+
+@route('/transactions/import', methods=['POST'])
+@is_logged_in
+def importTransactions():
+    upload = request.files.get('file')
+    if upload is None:
+        return jsonify(error='Attach the CSV as a "file" form field'), 400
+
+    user_id = session['userID']
+    imported = 0
+    failed = 0
+    errors = []
+
+    def valid_rows():
+        nonlocal failed
+        for line, values, row_errors in bulk.read_rows(upload.stream, TransactionForm):
+            if row_errors:
+                failed += 1
+                if len(errors) < bulk.MAX_REPORTED_ERRORS:
+                    errors.append({'line': line, 'errors': row_errors})
             else:
-                cur.execute("SELECT SUM(amount) FROM transactions WHERE MONTH(date) = %s AND YEAR(date) = %s AND user_id = %s", [month, year, user_id])
-            totalExpenses = cur.fetchone()['SUM(amount)'] or 0
+                yield values
 
-            cur.execute("SELECT * FROM transactions WHERE MONTH(date) = %s AND YEAR(date) = %s AND user_id = %s ORDER BY date DESC", [month, year, user_id])
-            transactions = cur.fetchall()
-        else:
-            cur.execute("SELECT SUM(amount) FROM transactions WHERE user_id = %s", [user_id])
-            totalExpenses = cur.fetchone()['SUM(amount)'] or 0
-            category_filter = f"AND category = '{selected_category}'" if selected_category else ''
-            cur.execute(f"SELECT * FROM transactions WHERE user_id = %s {category_filter} ORDER BY date DESC", [user_id])
-            transactions = cur.fetchall()
+    # Each chunk is one multi-row insert committed together with its rollup
+    # update, so a failure part way through keeps the chunks already stored.
+    with mysql.connection.cursor() as cur:
+        for chunk in bulk.chunks(valid_rows()):
+            ids = repository.insert_transactions(cur, user_id, chunk)
+            search.add(cur, user_id, [(transaction_id, description, category, when)
+                                      for transaction_id, (amount, description, category, when) in zip(ids, chunk)])
+            rollup.add_rows(cur, user_id, [(amount, category, when) for amount, description, category, when in chunk])
+            for year, month, category in {(when.year, when.month, category) for amount, description, category, when in chunk}:
+                check_budgets(cur, user_id, year, month, category)
+            record_write(cur, user_id)
+            mysql.connection.commit()
+            imported += len(chunk)
 
-        for transaction in transactions:
-            transaction['date'] = transaction['date'].strftime('%d %B, %Y')
+    return jsonify(imported=imported, failed=failed, errors=errors, errors_truncated=failed > len(errors))
+
+@route('/api/transactions/batch', methods=['POST'])
+@is_logged_in
+def transactionBatch():
+    # Creates, edits and deletes queued by an offline client, applied in one
+    # DB transaction. A retry carrying the same Idempotency-Key gets the
+    # first attempt's response instead of applying the batch twice.
+    user_id = session['userID']
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify(error='Expected a JSON object'), 400
+    key = request.headers.get('Idempotency-Key') or body.get('idempotency_key')
+    if not isinstance(key, str) or not 0 < len(key) <= idempotency.MAX_KEY_LENGTH:
+        return jsonify(error=f'Send an Idempotency-Key of 1 to {idempotency.MAX_KEY_LENGTH} characters'), 400
+
+    creates, updates, deletes, errors = bulk.read_batch(body, TransactionForm)
+    if errors:
+        return jsonify(errors=errors), 400
+
+    with mysql.connection.cursor() as cur:
+        state, replayed = idempotency.claim(cur, user_id, key)
+        if state != idempotency.CLAIMED:
+            mysql.connection.rollback()
+            if state == idempotency.IN_PROGRESS:
+                response = jsonify(error='A request with this Idempotency-Key is still being applied; retry later')
+                response.headers['Retry-After'] = '1'
+                return response, 409
+            response = jsonify(replayed)
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+
+        created = repository.insert_transactions(cur, user_id, creates)
+        search.add(cur, user_id, [(transaction_id, description, category, when)
+                                  for transaction_id, (amount, description, category, when) in zip(created, creates)])
+        rollup.add_rows(cur, user_id, [(amount, category, when) for amount, description, category, when in creates])
+        touched = {(when.year, when.month, category) for amount, description, category, when in creates}
+
+        updated, deleted, missing = [], [], []
+        for transaction_id, amount, description, category in updates:
+            row = alerts.transaction_key(cur, transaction_id)
+            if not row or row['user_id'] != user_id:
+                missing.append(transaction_id)
+                continue
+            rollup.remove(cur, transaction_id)
+            repository.update_own_transaction(cur, user_id, transaction_id, amount, description, category)
+            rollup.add(cur, transaction_id)
+            search.remove(cur, [transaction_id])
+            search.add(cur, user_id, [(transaction_id, description, category, row['date'])])
+            touched |= {(row['year'], row['month'], row['category']), (row['year'], row['month'], category)}
+            updated.append(transaction_id)
+
+        for transaction_id in deletes:
+            row = alerts.transaction_key(cur, transaction_id)
+            if not row or row['user_id'] != user_id:
+                missing.append(transaction_id)
+                continue
+            rollup.remove(cur, transaction_id)
+            repository.delete_own_transaction(cur, user_id, transaction_id)
+            search.remove(cur, [transaction_id])
+            touched.add((row['year'], row['month'], row['category']))
+            deleted.append(transaction_id)
+
+        events = []
+        for year, month, category in sorted(touched):
+            events += evaluate_budgets(cur, user_id, year, month, category)
+        if created or updated or deleted:
+            record_write(cur, user_id)
+
+        result = {'created': created, 'updated': updated, 'deleted': deleted, 'missing': missing,
+                  'alerts': [alerts.message(alert) for alert in events]}
+        idempotency.store(cur, user_id, key, result)
+        mysql.connection.commit()
 
-        return render_template('transactionHistory.html', totalExpenses=totalExpenses, transactions= transactions, categories=categories, selected_category=selected_category)
+    return jsonify(result)
 
-@app.route('/track_budget', methods=['GET', 'POST'])
+@route('/transactions/export.csv')
+@is_logged_in
+def exportTransactions():
+    user_id = session['userID']
+
+    def generate():
+        with mysql.connection.cursor(MySQLdb.cursors.SSDictCursor) as cur:
+            rows = repository.export_transactions(cur, user_id)
+            yield from bulk.write_rows(archive.export(rows, current_app.config['ARCHIVE_DIR'], user_id))
+
+    return Response(stream_with_context(generate()), mimetype='text/csv',
+                    headers={'Content-Disposition': 'attachment; filename=transactions.csv'})
+
+@route('/track_budget', methods=['GET', 'POST'])
 @is_logged_in
 def track_budget():
     user_id = session.get('userID')
@@ -224,19 +623,18 @@ def track_budget():
 
     with mysql.connection.cursor() as cur:
         # Check if the user has a budget password
-        cur.execute("SELECT budget_password FROM users WHERE id = %s", [user_id])
-        user = cur.fetchone()
+        budget_password = repository.budget_password(cur, user_id)
 
         if request.method == 'POST':
-            if user['budget_password'] is None:
+            if budget_password is None:
                 # If the user does not have a budget password, create one
                 new_password = request.form.get('new_password')
                 confirm_password = request.form.get('confirm_password')
 
                 if new_password and new_password == confirm_password:
                     # Hash the new password and update the database
-                    hashed_password = sha256_crypt.hash(new_password)
-                    cur.execute("UPDATE users SET budget_password = %s WHERE id = %s", (hashed_password, user_id))
+                    hashed_password = hashing.service.hash(new_password)
+                    repository.set_budget_password(cur, user_id, hashed_password)
                     mysql.connection.commit()
                     flash('Budget password created successfully. You can now update your budget.', 'success')
                     return redirect(url_for('track_budget'))  # Redirect to show budget options
@@ -249,32 +647,16 @@ def track_budget():
                 monthly_savings_goal = request.form.get('monthly_savings_goal')
 
                 # Check the user's password
-                if sha256_crypt.verify(password_input, user['budget_password']):
+                if hashing.service.verify(password_input, budget_password):
                     # Check how many times the user has updated their budget this month
-                    cur.execute("""
-                        SELECT COUNT(*) as update_count 
-                        FROM user_budget 
-                        WHERE user_id = %s AND MONTH(updated_at) = MONTH(CURRENT_DATE()) AND YEAR(updated_at) = YEAR(CURRENT_DATE())
-                    """, [user_id])
-                    update_count = cur.fetchone()['update_count']
+                    update_count = repository.budget_updates(cur, user_id, periods.current_month())
 
                     if update_count < 3:
                         # Proceed to update the budget
-                        cur.execute("SELECT * FROM user_budget WHERE user_id = %s", [user_id])
-                        exists = cur.fetchone()
-
-                        if exists:
-                            cur.execute("""
-                                UPDATE user_budget 
-                                SET monthly_budget = %s, monthly_savings_goal = %s, updated_at = CURRENT_TIMESTAMP
-                                WHERE user_id = %s
-                            """, (monthly_budget, monthly_savings_goal, user_id))
-                        else:
-                            cur.execute("""
-                                INSERT INTO user_budget (user_id, monthly_budget, monthly_savings_goal)
-                                VALUES (%s, %s, %s)
-                            """, (user_id, monthly_budget, monthly_savings_goal))
+                        repository.save_user_budget(cur, user_id, monthly_budget, monthly_savings_goal)
 
+                        check_budgets(cur, user_id, datetime.now().year, datetime.now().month)
+                        record_write(cur, user_id)
                         mysql.connection.commit()
                         flash('Budget updated successfully', 'success')
                     else:
@@ -283,46 +665,36 @@ def track_budget():
                     flash('Invalid password. Please try again.', 'danger')
 
         # Fetch current budget data
-        cur.execute("SELECT monthly_budget, monthly_savings_goal FROM user_budget WHERE user_id = %s", [user_id])
-        budget_data = cur.fetchone()
+        budget_data = repository.user_budget(cur, user_id)
 
         # Handle None by setting default values
         if not budget_data:
             budget_data = {'monthly_budget': 0, 'monthly_savings_goal': 0}
 
         # Fetch categories
-        cur.execute("SELECT DISTINCT category FROM transactions WHERE user_id = %s ORDER BY category", [user_id])
-        categories = [row['category'] for row in cur.fetchall()]
-
-        # Fetch category budgets
-        cur.execute("""
-            SELECT cb.category, cb.budget_limit,
-                   COALESCE(SUM(t.amount), 0) as current_spending,
-                   cb.budget_limit - COALESCE(SUM(t.amount), 0) as remaining
-            FROM category_budgets cb
-            LEFT JOIN transactions t ON cb.category = t.category 
-                AND cb.user_id = t.user_id 
-                AND MONTH(t.date) = MONTH(CURRENT_DATE())
-                AND YEAR(t.date) = YEAR(CURRENT_DATE())
-            WHERE cb.user_id = %s
-            GROUP BY cb.category, cb.budget_limit
-        """, [user_id])
-        category_budgets = cur.fetchall()
+        categories = rollup.categories(cur, user_id)
+
+        # Fetch category budgets from the precomputed monthly totals
+        now = datetime.now()
+        category_budgets = repository.category_budget_status(cur, user_id, now.year, now.month)
 
         # If no category budgets, set empty list
         if not category_budgets:
             category_budgets = []
 
+        budget_alerts = alerts.for_month(cur, user_id, now.year, now.month)
+
     return render_template(
         'track_budget.html',
         float=float,
         budget_data=budget_data,
         categories=categories,
         category_budgets=category_budgets,
-        user_has_password=user['budget_password'] is not None
+        budget_alerts=budget_alerts,
+        user_has_password=budget_password is not None
     )
       
-@app.route('/set_category_budget', methods=['POST'])
+@route('/set_category_budget', methods=['POST'])
 @is_logged_in
 def set_category_budget():
     user_id = session['userID']
@@ -330,23 +702,24 @@ def set_category_budget():
     budget_limit = request.form.get('budget_limit')
 
     with mysql.connection.cursor() as cur:
-        cur.execute("SELECT * FROM category_budgets WHERE user_id = %s AND category = %s", (user_id, category))
-        existing_budget = cur.fetchone()
+        existing_budget = repository.category_budget(cur, user_id, category)
 
         if existing_budget:
             flash('Budget limit already exists. Delete this current one to proceed.', 'danger')
         else:
             try:
                 # Insert the new budget limit if it doesn't exist
-                cur.execute("INSERT INTO category_budgets (user_id, category, budget_limit) VALUES (%s, %s, %s)", (user_id, category, budget_limit))
+                repository.create_category_budget(cur, user_id, category, budget_limit)
+                check_budgets(cur, user_id, datetime.now().year, datetime.now().month, category)
+                record_write(cur, user_id)
                 mysql.connection.commit()
                 flash('Category budget set successfully', 'success')
-            except IntegrityError:
+            except MySQLdb.IntegrityError:
                 mysql.connection.rollback()  # Rollback the transaction in case of an error
                 flash('An error occurred while setting the budget. Please try again.', 'danger')
 
     return redirect(url_for('track_budget'))
-@app.route('/category_budget/delete/<category>', methods=['POST'])
+@route('/category_budget/delete/<category>', methods=['POST'])
 @is_logged_in
 def delete_category_budget(category):
     user_id=session['userID']
@@ -356,7 +729,8 @@ def delete_category_budget(category):
 
     with mysql.connection.cursor() as cur:
         try:
-            cur.execute("DELETE FROM category_budgets WHERE user_id = %s AND category = %s", (user_id, category))
+            repository.delete_category_budget(cur, user_id, category)
+            record_write(cur, user_id)
             mysql.connection.commit()
             flash('Category budget deleted successfully', 'success')
         except Exception as e:
@@ -365,22 +739,35 @@ def delete_category_budget(category):
 
     return redirect(url_for('track_budget'))
 
-@app.route('/deleteTransaction/<string:id>', methods=['POST'])
+@route('/deleteTransaction/<string:id>', methods=['POST'])
 @is_logged_in
 def deleteTransaction(id):
-    with mysql.connection.cursor() as cur:
-        cur.execute("DELETE FROM transactions WHERE id = %s", [id])
-        mysql.connection.commit()
-
+    _delete_own_transaction(id)
     flash('Transaction Deleted', 'success')
     return redirect(url_for('transactionHistory'))
 
-@app.route('/editCurrentMonthTransaction/<string:id>', methods=['GET', 'POST'])
+def _delete_own_transaction(id):
+    # 404 unless the transaction belongs to the session's user
+    user_id = session['userID']
+    with mysql.connection.cursor() as cur:
+        key = alerts.transaction_key(cur, id, user_id)
+        if key is None:
+            abort(404)
+        rollup.remove(cur, id)
+        repository.delete_own_transaction(cur, user_id, id)
+        search.remove(cur, [id])
+        check_budgets(cur, user_id, key['year'], key['month'], key['category'])
+        record_write(cur, user_id)
+        mysql.connection.commit()
+
+@route('/editCurrentMonthTransaction/<string:id>', methods=['GET', 'POST'])
 @is_logged_in
 def editCurrentMonthTransaction(id):
+    user_id = session['userID']
     with mysql.connection.cursor() as cur:
-        cur.execute("SELECT * FROM transactions WHERE id = %s", [id])
-        transaction = cur.fetchone()
+        transaction = repository.own_transaction(cur, user_id, id)
+    if transaction is None:
+        abort(404)
 
     form = TransactionForm(request.form)
     form.amount.data = transaction['amount']
@@ -391,8 +778,14 @@ def editCurrentMonthTransaction(id):
         description = form.description.data
 
         with mysql.connection.cursor() as cur:
-            cur.execute("UPDATE transactions SET amount=%s, description=%s WHERE id = %s",
-                        (amount, description, id))
+            rollup.remove(cur, id)
+            repository.update_own_transaction(cur, user_id, id, amount, description, transaction['category'])
+            rollup.add(cur, id)
+            key = alerts.transaction_key(cur, id, user_id)
+            search.remove(cur, [id])
+            search.add(cur, user_id, [(id, description, key['category'], key['date'])])
+            check_budgets(cur, user_id, key['year'], key['month'], key['category'])
+            record_write(cur, user_id)
             mysql.connection.commit()
 
         flash('Transaction Updated', 'success')
@@ -400,17 +793,14 @@ def editCurrentMonthTransaction(id):
 
     return render_template('editTransaction.html', form=form)
 
-@app.route('/deleteCurrentMonthTransaction/<string:id>', methods=['POST'])
+@route('/deleteCurrentMonthTransaction/<string:id>', methods=['POST'])
 @is_logged_in
 def deleteCurrentMonthTransaction(id):
-    with mysql.connection.cursor() as cur:
-        cur.execute("DELETE FROM transactions WHERE id = %s", [id])
-        mysql.connection.commit()
-
+    _delete_own_transaction(id)
     flash('Transaction Deleted', 'success')
     return redirect(url_for('addTransactions'))
 
-@app.route("/reset_request", methods=['GET', 'POST'])
+@route("/reset_request", methods=['GET', 'POST'])
 def reset_request():
     if 'logged_in' in session:
         flash('You are already logged in', 'info')
@@ -420,111 +810,116 @@ def reset_request():
     if request.method == 'POST' and form.validate():
         email = form.email.data
         with mysql.connection.cursor() as cur:
-            result = cur.execute("SELECT id, username, email FROM users WHERE email = %s", [email])
-            if result == 0:
+            data = repository.user_by_email(cur, email)
+            if not data:
                 flash('There is no account with that email. You must register first.', 'warning')
                 return redirect(url_for('signup'))
             else:
-                data = cur.fetchone()
                 user_id = data['id']
                 user_email = data['email']
-                s = Serializer(app.config['SECRET_KEY'], 1800)
-                token = s.dumps({'user_id': user_id}).decode('utf-8')
-                msg = Message('Password Reset Request', sender='noreply@demo.com', recipients=[user_email])
-                msg.body = f'''To reset your password, visit the following link:
+                s = Serializer(current_app.config['SECRET_KEY'])
+                token = s.dumps({'user_id': user_id})
+                body = f'''To reset your password, visit the following link:
 {url_for('reset_token', token=token, _external=True)}
 If you did not make this request, simply ignore this email and no changes will be made.
 Note: This link is valid only for 30 minutes from the time you requested a password change.
 '''
-                mail.send(msg)
+                # Sent by `flask outbox run`, not inside the request
+                outbox.enqueue(cur, user_email, 'Password Reset Request', body, 'noreply@demo.com')
+                mysql.connection.commit()
                 flash('An email has been sent with instructions to reset your password.', 'info')
                 return redirect(url_for('login'))
 
     return render_template('reset_request.html', form=form)
 
-@app.route("/reset_password/<token>", methods=['GET', 'POST'])
+@route("/reset_password/<token>", methods=['GET', 'POST'])
 def reset_token(token):
     if 'logged_in' in session:
         flash('You are already logged in', 'info')
         return redirect(url_for('index'))
 
-    s = Serializer(app.config['SECRET_KEY'])
+    s = Serializer(current_app.config['SECRET_KEY'])
     try:
-        user_id = s.loads(token)['user_id']
+        user_id = s.loads(token, max_age=1800)['user_id']
     except:
         flash('That is an invalid or expired token', 'warning')
         return redirect(url_for('reset_request'))
 
     form = ResetPasswordForm(request.form)
     if request.method == 'POST' and form.validate():
-        password = sha256_crypt.encrypt(str(form.password.data))
+        password = hashing.service.hash(form.password.data)
         with mysql.connection.cursor() as cur:
-            cur.execute("UPDATE users SET password = %s WHERE id = %s", (password, user_id))
+            repository.set_password(cur, user_id, password)
             mysql.connection.commit()
         flash('Your password has been updated! You are now able to log in', 'success')
         return redirect(url_for('login'))
 
     return render_template('reset_token.html', title='Reset Password', form=form)
 
-@app.route('/category')
+@route('/category')
+@is_logged_in
+@conditional_on_writes(since=_start_of_year)
 def createBarCharts():
     with mysql.connection.cursor() as cur:
-        cur.execute("SELECT SUM(amount) AS amount, category FROM transactions WHERE YEAR(date) = YEAR(CURRENT_DATE()) AND user_id = %s GROUP BY category ORDER BY category", [session['userID']])
-        transactions = cur.fetchall()
-
-        values = [transaction['amount'] for transaction in transactions]
-        labels = [transaction['category'] for transaction in transactions]
+        transactions = rollup.category_totals(cur, session['userID'], datetime.now().year)
 
-        fig = go.Figure(data=[go.Pie(labels=labels, values=values)])
-        fig.update_traces(textinfo='label+value', hoverinfo='percent')
-        fig.update_layout(title_text='Category Wise Pie Chart For Current Year')
-        fig.show()
+    return jsonify(labels=[transaction['category'] for transaction in transactions],
+                   values=[float(transaction['amount']) for transaction in transactions])
 
-    return redirect(url_for('addTransactions'))
-
-@app.route('/yearly_bar')
+@route('/yearly_bar')
+@is_logged_in
+@conditional_on_writes(since=_start_of_year)
 def yearlyBar():
+    # Both years in a single grouped query instead of 24 round trips
+    this_year = datetime.now().year
+    year_data = [0.0] * 12
+    last_year_data = [0.0] * 12
     with mysql.connection.cursor() as cur:
-        year_data = []
-        for month in range(1, 13):
-            cur.execute("SELECT SUM(amount) FROM transactions WHERE MONTH(date ) = %s AND YEAR(date) = YEAR(CURRENT_DATE()) AND user_id = %s", (month, session['userID']))
-            year_data.append(cur.fetchone()['SUM(amount)'] or 0)
-
-        last_year_data = []
-        for month in range(1, 13):
-            cur.execute("SELECT SUM(amount) FROM transactions WHERE MONTH(date) = %s AND YEAR(date) = YEAR(DATE_SUB(CURDATE(), INTERVAL 1 YEAR)) AND user_id = %s", (month, session['userID']))
-            last_year_data.append(cur.fetchone()['SUM(amount)'] or 0)
-
-        year_labels = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
-        fig = go.Figure(data=[
-            go.Bar(name='Last Year', x=year_labels, y=last_year_data),
-            go.Bar(name='This Year', x=year_labels, y=year_data)
-        ])
-        fig.update_layout(barmode='group', title_text='Comparison Between This Year and Last Year')
-        fig.show()
+        for row in rollup.monthly_totals(cur, session['userID'], this_year - 1, this_year):
+            if row['year'] == this_year:
+                year_data[row['month'] - 1] = float(row['amount'] or 0)
+            else:
+                last_year_data[row['month'] - 1] = float(row['amount'] or 0)
 
-    return redirect(url_for('addTransactions'))
+    return jsonify(labels=periods.MONTH_LABELS, categories=['Last Year', 'This Year'],
+                   values={'Last Year': last_year_data, 'This Year': year_data})
 
-@app.route('/monthly_bar')
+@route('/monthly_bar')
+@is_logged_in
+@conditional_on_writes(since=_start_of_year)
 def monthlyBar():
+    this_year = datetime.now().year
     with mysql.connection.cursor() as cur:
-        cur.execute("SELECT SUM(amount) as amount, MONTH(date) as month FROM transactions WHERE YEAR(date) = YEAR(CURRENT_DATE()) AND user_id = %s GROUP BY MONTH(date) ORDER BY MONTH(date)", [session['userID']])
-        transactions = cur.fetchall()
+        transactions = rollup.monthly_totals(cur, session['userID'], this_year, this_year)
 
-        months = []
-        values = []
+    return jsonify(labels=[periods.MONTH_LABELS[transaction['month'] - 1] for transaction in transactions],
+                   values=[float(transaction['amount']) for transaction in transactions])
 
-        for transaction in transactions:
-            if 'month' in transaction and 'amount' in transaction:
-                months.append(transaction['month'])
-                values.append(transaction['amount'])
+@route('/reports/<int:year>/<int:month>/<chart>.<fmt>')
+@is_logged_in
+@conditional_on_writes(since=_start_of_report_day)
+def spendingReport(year, month, chart, fmt):
+    # A report chart for the month as PNG or SVG (?download=1 to save it),
+    # rendered in the report pool and then sent from the disk cache until
+    # the user's data changes
+    if (chart not in reports.CHARTS or fmt not in reports.FORMATS
+            or not 1 <= month <= 12 or not reports.MIN_YEAR <= year <= reports.MAX_YEAR):
+        abort(404)
+    user_id = session['userID']
+    key = reports.cache_key(user_id, current_version(user_id)[0], year, month, chart, fmt, datetime.now().date())
+    image = report_cache.get(key, fmt)
+    if image is None:
+        with mysql.connection.cursor() as cur:
+            data = reports.report_data(cur, user_id, year, month, datetime.now().date())
+        image = reports.service.render(chart, fmt, data)
+        report_cache.put(key, fmt, image)
 
-        fig = go.Figure([go.Bar(x=months, y=values)])
-        fig.update_layout(title_text='Monthly Bar Chart For Current Year')
-        fig.show()
+    response = Response(image, mimetype=reports.FORMATS[fmt])
+    if 'download' in request.args:
+        response.headers['Content-Disposition'] = f'attachment; filename=spending-{year}-{month:02d}-{chart}.{fmt}'
+    return response
 
-    return redirect(url_for('addTransactions'))
-@app.route('/dashboard', methods=['GET'])
+@route('/dashboard', methods=['GET'])
 @is_logged_in
 def dashboard():
     user_id = session['userID']
@@ -533,19 +928,97 @@ def dashboard():
         flash('User  ID not found in session. Please log in again.', 'danger')
         return redirect(url_for('login'))
 
+    version = _dashboard_version(user_id)
+    payload = _cached_dashboard(user_id, version)
+    now = datetime.now()
+    return render_template('dashboard.html', user_id=user_id, sync_token=delta.token(*version),
+                           report_year=now.year, report_month=now.month, **payload)
+
+@route('/api/dashboard')
+@is_logged_in
+def dashboardSeries():
+    # ?since=<sync token> returns only the points that changed since then,
+    # or 304 when the token is still current
+    user_id = session['userID']
+    version = _dashboard_version(user_id)
+    token = delta.token(*version)
+    since = request.args.get('since')
+    if since == token:
+        response = make_response('', 304)
+        response.set_etag(token)
+        return response
+
+    points = delta.series(_cached_dashboard(user_id, version))
+    dashboard_snapshots.set(f'{user_id}:{token}', points, len(pickle.dumps(points)))
+    previous = dashboard_snapshots.get(f'{user_id}:{since}') if since else None
+
+    if previous is None:
+        response = jsonify(version=token, full=True, series=points)
+    else:
+        response = jsonify(version=token, full=False, changes=delta.diff(previous, points))
+    response.set_etag(token)
+    return response
+
+@route('/api/insights')
+@is_logged_in
+def spendingInsights():
+    # Rolling averages, per-category deltas, weekday pattern and month-end
+    # forecast, computed from one columnar fetch of the last 13 months
+    user_id = session['userID']
+    version = _dashboard_version(user_id)
+    payload = insights_cache.get(user_id, version)
+    if payload is None:
+        import analytics
+        today = datetime.now().date()
+        with mysql.connection.cursor() as cur:
+            data = analytics.load(cur, user_id, today)
+            budget = repository.user_budget(cur, user_id) or {}
+        payload = analytics.insights(data, today, budget.get('monthly_budget'), budget.get('monthly_savings_goal'))
+        insights_cache.set(user_id, version, payload)
+    return jsonify(payload)
+
+@route('/admin/analytics/<report>')
+@is_admin
+def adminAnalytics(report):
+    # A platform-wide report streamed as JSON lines: progress events while
+    # it scans, then the result (or an error if it ran out of time). Closing
+    # the connection cancels it.
+    import admin
+    if report not in admin.REPORTS:
+        abort(404)
+    months = min(max(request.args.get('months', admin.DEFAULT_MONTHS, type=int), 1), admin.MAX_MONTHS)
+    try:
+        events, release = admin.run(report, lambda: mysql.connection.cursor(MySQLdb.cursors.SSDictCursor),
+                                    mysql.discard, admin.window(datetime.now().date(), months),
+                                    current_app.config['ADMIN_REPORT_SECONDS'], current_app.config['ADMIN_MAX_RUNNING'])
+    except admin.AdminBusy:
+        return 'Another admin report is running. Please try again in a moment.', 503, {'Retry-After': '10'}
+
+    def lines():
+        with closing(events):
+            for event in events:
+                yield json.dumps(event) + '\n'
+    response = Response(stream_with_context(lines()), mimetype='application/x-ndjson')
+    # lines() never runs for a HEAD request or a client that leaves before
+    # the first chunk; free the report's slot regardless
+    response.call_on_close(release)
+    return response
+
+def _dashboard_version(user_id):
+    # The 30-day window moves daily, so the day is part of the version
+    return current_version(user_id)[0], datetime.now().date().toordinal()
+
+def _cached_dashboard(user_id, version):
+    payload = dashboard_cache.get(user_id, version)
+    if payload is None:
+        payload = _dashboard_payload(user_id)
+        dashboard_cache.set(user_id, version, payload)
+    return payload
+
+def _dashboard_payload(user_id):
     with mysql.connection.cursor() as cur:
         # Get spending data for the last month
-        thirty_days_ago = datetime.now() - timedelta(days=30)
-        cur.execute('''
-            SELECT DATE(date) as date, SUM(amount) as amount
-            FROM transactions
-            WHERE user_id = %s AND date >= %s
-            GROUP BY DATE(date)
-            ORDER BY date
-        ''', (user_id, thirty_days_ago))
-
-        rows = cur.fetchall()
-        print("Rows fetched:", rows)
+        rows = repository.daily_spending(cur, user_id, periods.last_days(30))
 
         # Prepare data for the daily spending chart
         daily_spending = []
@@ -555,34 +1028,256 @@ def dashboard():
                 'amount': float(row['amount']) if row['amount'] is not None else 0.0
             })
 
-        print("Daily Spending Data:", daily_spending)
-
         # Get category-wise spending
-        cur.execute('''
-            SELECT category, SUM(amount) as amount
-            FROM transactions
-            WHERE user_id = %s
-            GROUP BY category
-        ''', (user_id,))
-        
-        category_spending = [{'category': row['category'], 'amount': float(row['amount'])} for row in cur.fetchall()]
+        category_spending = [{'category': row['category'], 'amount': float(row['amount'])} for row in rollup.category_totals(cur, user_id)]
 
         # Get total spending
-        cur.execute('''
-            SELECT 
-                SUM(CASE WHEN amount > 0 THEN amount ELSE 0 END) as total_spending
-            FROM transactions
-            WHERE user_id = %s
-        ''', (user_id,))
-        
-        financial_summary = cur.fetchone()
+        total_spending = rollup.total_spending(cur, user_id)
         financial_summary = {
-            'total_spending': float(financial_summary['total_spending']) if financial_summary['total_spending'] is not None else 0
+            'total_spending': float(total_spending) if total_spending is not None else 0
         }
 
-    return render_template('dashboard.html', user_id=user_id, 
-                           daily_spending=daily_spending,
-                           category_spending=category_spending, 
-                           financial_summary=financial_summary)
+    return {'daily_spending': daily_spending,
+            'category_spending': category_spending,
+            'financial_summary': financial_summary}
+
+@cli_command('check-indexes')
+@click.option('--user-id', default=1, help='User whose rows the plans are checked against.')
+def check_indexes(user_id):
+    """EXPLAIN the period-filtered reads and fail unless they range-scan idx_user_date."""
+    this_month = periods.params(periods.current_month())
+    checks = [
+        (repository.PERIOD_SPENDING, [user_id] + this_month),
+        (repository.PERIOD_TRANSACTIONS, [user_id] + this_month),
+        (repository.DAILY_SPENDING, [user_id] + periods.params(periods.last_days(30))),
+    ]
+
+    failures = 0
+    with mysql.connection.cursor() as cur:
+        for query, args in checks:
+            cur.execute("EXPLAIN " + query, args)
+            plan = cur.fetchone()
+            ok = plan['key'] == 'idx_user_date' and plan['type'] == 'range'
+            failures += not ok
+            click.echo(f"{'ok  ' if ok else 'FAIL'} key={plan['key']} type={plan['type']} rows={plan['rows']}  {query}")
+
+    if failures:
+        raise click.ClickException(f'{failures} queries do not range-scan idx_user_date')
+
+rollup_cli = cli_group('rollup', help='Maintain the monthly_category_totals rollup.')
+
+@rollup_cli.command('rebuild')
+@click.option('--user-id', type=int, default=None, help='Only rebuild this user.')
+def rollup_rebuild(user_id):
+    """Backfill the rollup from the transactions table."""
+    with mysql.connection.cursor() as cur:
+        rows = rollup.rebuild(cur, user_id)
+        mysql.connection.commit()
+    click.echo(f'Rebuilt {rows} rollup rows')
+
+@rollup_cli.command('verify')
+@click.option('--user-id', type=int, default=None, help='Only verify this user.')
+def rollup_verify(user_id):
+    """Compare the rollup against the transactions table and report drift."""
+    with mysql.connection.cursor() as cur:
+        mismatches = rollup.drift(cur, user_id)
+
+    for mismatch in mismatches:
+        click.echo(f"drift {mismatch['key']}: expected {mismatch['expected']} got {mismatch['actual']}")
+    if mismatches:
+        raise click.ClickException(f'{len(mismatches)} rollup rows have drifted; run `flask rollup rebuild`')
+    click.echo('Rollup matches transactions')
+
+archive_cli = cli_group('archive', help='Move closed years of transactions to the archive files.')
+
+@archive_cli.command('run')
+@click.option('--year', type=int, default=None, help='Archive this year (default: every closed year still in the table).')
+@click.option('--drop-partition', is_flag=True, help='Remove the rows with DROP PARTITION instead of DELETE.')
+def archive_run(year, drop_partition):
+    """Write closed years to per-user archive files and remove them from the table."""
+    last_closed = datetime.now().year - current_app.config['ARCHIVE_HOT_YEARS']
+    if year is not None and year > last_closed:
+        raise click.ClickException(f'{year} is not closed; the last {current_app.config["ARCHIVE_HOT_YEARS"]} years stay in the table')
+
+    if year is None:
+        with mysql.connection.cursor() as cur:
+            closed = range(partitions.first_year(cur), last_closed + 1)
+    else:
+        closed = [year]
+
+    for closed_year in closed:
+        try:
+            summary = archive.archive_year(mysql.connection, current_app.config['ARCHIVE_DIR'], closed_year, drop_partition)
+        except archive.ArchiveError as e:
+            raise click.ClickException(str(e))
+        click.echo(json.dumps(summary))
+
+@archive_cli.command('verify')
+@click.option('--user-id', type=int, default=None, help='Only verify this user.')
+def archive_verify(user_id):
+    """Check archive files against archived_years and the rollup, counting rows still in the table."""
+    with mysql.connection.cursor() as cur:
+        mismatches = archive.verify(cur, current_app.config['ARCHIVE_DIR'], user_id)
+
+    for mismatch in mismatches:
+        details = f": expected {mismatch['expected']} got {mismatch['actual']}" if 'expected' in mismatch else ''
+        click.echo(f"{mismatch['problem']} {mismatch['key']}{details}")
+    if mismatches:
+        raise click.ClickException(f'{len(mismatches)} archive mismatches')
+    click.echo('Archive matches the rollup and transactions')
+
+partitions_cli = cli_group('partitions', help='Range-partition transactions by year (MySQL only).')
+
+def _run_ddl(statements, dry_run):
+    with mysql.connection.cursor() as cur:
+        for statement in statements:
+            click.echo(statement + ';')
+            if not dry_run:
+                cur.execute(statement)
+        mysql.connection.commit()
+
+@partitions_cli.command('create')
+@click.option('--first-year', type=int, default=None, help='Oldest year with its own partition (default: oldest row).')
+@click.option('--years-ahead', default=1, help='Partitions to create past the current year.')
+@click.option('--dry-run', is_flag=True, help='Print the statements without running them.')
+def partitions_create(first_year, years_ahead, dry_run):
+    """Convert transactions to one partition per year."""
+    with mysql.connection.cursor() as cur:
+        if partitions.partitioned_years(cur):
+            raise click.ClickException('transactions is already partitioned; use `flask partitions extend`')
+        first_year = first_year or partitions.first_year(cur)
+        statements = partitions.create_statements(cur, first_year, datetime.now().year + years_ahead)
+    _run_ddl(statements, dry_run)
+
+@partitions_cli.command('extend')
+@click.option('--through', type=int, default=None, help='Last year to have its own partition (default: next year).')
+@click.option('--dry-run', is_flag=True, help='Print the statements without running them.')
+def partitions_extend(through, dry_run):
+    """Add yearly partitions ahead of time, splitting them off the catch-all partition."""
+    with mysql.connection.cursor() as cur:
+        existing = partitions.partitioned_years(cur)
+    if not existing:
+        raise click.ClickException('transactions is not partitioned; run `flask partitions create` first')
+    through = through or datetime.now().year + 1
+    _run_ddl([partitions.extend_statement(year) for year in range(existing[-1] + 1, through + 1)], dry_run)
+
+@partitions_cli.command('list')
+def partitions_list():
+    """Show each yearly partition and whether it has been archived."""
+    with mysql.connection.cursor() as cur:
+        existing = partitions.partitioned_years(cur)
+        archived = repository.archived_users_by_year(cur)
+    if not existing:
+        raise click.ClickException('transactions is not partitioned')
+    for year in existing:
+        click.echo(f"{partitions.name(year)}  archived users: {archived.get(year, 0)}")
+    click.echo(partitions.FUTURE)
+
+search_cli = cli_group('search', help='Maintain the transaction search index.')
+
+@search_cli.command('rebuild')
+@click.option('--user-id', type=int, default=None, help='Only reindex this user.')
+def search_rebuild(user_id):
+    """Rebuild transaction_terms from the transactions table."""
+    with mysql.connection.cursor() as cur:
+        indexed = search.rebuild(cur, user_id)
+        mysql.connection.commit()
+    click.echo(f'Indexed {indexed} transactions')
+
+assets_cli = cli_group('assets', help='Build fingerprinted static files.')
+
+@assets_cli.command('build')
+def assets_build():
+    """Fingerprint, minify and precompress static/ into static/dist/."""
+    manifest = assets.build(current_app.static_folder)
+    built = sum(entry['bytes'] for entry in manifest.values())
+    smallest = sum(min([entry['bytes'], entry.get('webp', entry['bytes'])] + list(entry['encodings'].values()))
+                   for entry in manifest.values())
+    click.echo(f'Built {len(manifest)} files into {assets.DIST}/: {built} bytes, {smallest} bytes as served compressed')
+    click.echo('Restart the app to serve them')
+
+db_cli = cli_group('db', help='Inspect the database servers.')
+
+@db_cli.command('replicas')
+@click.option('--max-lag', type=int, default=None, help='Fail if a replica is more than this many seconds behind.')
+def db_replicas(max_lag):
+    """Check each MYSQL_REPLICAS server is read-only, replicating and caught up."""
+    if not isinstance(mysql, PooledMySQL) or not current_app.config.get('MYSQL_REPLICAS'):
+        raise click.ClickException('no MYSQL_REPLICAS configured; every query goes to the primary')
+    failures = 0
+    for status in mysql.replica_status():
+        if 'error' in status:
+            failures += 1
+            click.echo(f"FAIL {status['address']}: {status['error']}")
+            continue
+        lag = status['seconds_behind']
+        ok = (status['read_only'] and status['io_running'] == 'Yes' and status['sql_running'] == 'Yes'
+              and lag is not None and (max_lag is None or lag <= max_lag))
+        failures += not ok
+        click.echo(f"{'ok  ' if ok else 'FAIL'} {status['address']} server_id={status['server_id']} "
+                   f"read_only={status['read_only']} io={status['io_running']} sql={status['sql_running']} "
+                   f"behind={lag}s")
+    if failures:
+        raise click.ClickException(f'{failures} replicas are not serving up-to-date reads')
+
+admin_cli = cli_group('admin', help='Grant or revoke access to the admin analytics.')
+
+@admin_cli.command('grant')
+@click.argument('username')
+def admin_grant(username):
+    """Give USERNAME the admin role."""
+    _set_role(username, 'admin')
+
+@admin_cli.command('revoke')
+@click.argument('username')
+def admin_revoke(username):
+    """Return USERNAME to the user role."""
+    _set_role(username, 'user')
+
+def _set_role(username, role):
+    with mysql.connection.cursor() as cur:
+        if not repository.user_by_username(cur, username):
+            raise click.ClickException(f'no user named {username}')
+        repository.set_role(cur, username, role)
+        mysql.connection.commit()
+    click.echo(f'{username} is now {role}')
+
+@cli_command('purge-idempotency-keys')
+@click.option('--hours', default=24, help='Keep keys used within this many hours.')
+def purge_idempotency_keys(hours):
+    """Delete batch idempotency keys older than --hours."""
+    with mysql.connection.cursor() as cur:
+        deleted = idempotency.purge(cur, hours)
+        mysql.connection.commit()
+    click.echo(f'Deleted {deleted} idempotency keys')
+
+outbox_cli = cli_group('outbox', help='Send queued email.')
+
+@outbox_cli.command('run')
+@click.option('--interval', default=2.0, help='Seconds to wait when the outbox is empty.')
+@click.option('--batch-size', default=outbox.BATCH_SIZE)
+def outbox_run(interval, batch_size):
+    """Drain the outbox continuously."""
+    while True:
+        sent = outbox.drain(mysql.connection, mail, batch_size)
+        if sent:
+            click.echo(f'Sent {sent} emails')
+        else:
+            time.sleep(interval)
+
+@outbox_cli.command('drain')
+@click.option('--batch-size', default=outbox.BATCH_SIZE)
+def outbox_drain(batch_size):
+    """Send one batch and exit."""
+    click.echo(f'Sent {outbox.drain(mysql.connection, mail, batch_size)} emails')
+
+@outbox_cli.command('stats')
+@click.option('--hours', default=24)
+def outbox_stats(hours):
+    """Report queue depth and end-to-end delivery latency."""
+    with mysql.connection.cursor() as cur:
+        stats = outbox.delivery_stats(cur, hours)
+    click.echo(json.dumps(stats))
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5002, debug=True)
\ No newline at end of file
+    create_app().run(host='0.0.0.0', port=5002, debug=True)
\ No newline at end of file
@@ -0,0 +1,313 @@
+import bisect
+import functools
+import gzip
+import heapq
+import itertools
+import json
+import os
+from collections import namedtuple
+from datetime import datetime
+
+import partitions
+import periods
+import search
+
+# Closed years of transactions move out of MySQL into one gzip'd JSON file
+# per user and year under ARCHIVE_DIR (<user_id>/<year>.json.gz). The file is
+# column-oriented (one list per column, rows in (date, id) order) so the
+# repeated categories compress well and a page of history is a bisect and a
+# slice rather than a parse per row. Only the stdlib is used, so reading
+# archived history costs the web workers nothing at import time.
+#
+# monthly_category_totals keeps its rows for archived years, so the yearly
+# reports and history totals read the same rollup as before. Rows written
+# into an archived year later stay in the table until the next
+# `flask archive run` for that year merges them into the file; the history
+# and export read paths merge both sides, dropping a row found in both.
+FORMAT_VERSION = 1
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+COLUMNS = ['id', 'date', 'amount', 'category', 'description']
+
+
+class ArchiveError(Exception):
+    pass
+
+
+Archive = namedtuple('Archive', ['user_id', 'year', 'ids', 'dates', 'amounts', 'categories', 'descriptions', 'keys'])
+
+YEAR_USERS = ("SELECT DISTINCT user_id FROM transactions WHERE " + periods.condition()
+              + " AND user_id IS NOT NULL ORDER BY user_id")
+# Locks the user's rows for the year (and the gaps between them), so nothing
+# can be inserted into the range between reading it and deleting it
+YEAR_ROWS = ("SELECT id, date, amount, category, description FROM transactions WHERE user_id = %s AND "
+             + periods.condition() + " ORDER BY date, id FOR UPDATE")
+DELETE_YEAR_ROWS = "DELETE FROM transactions WHERE user_id = %s AND " + periods.condition()
+YEAR_MONTHS = ("SELECT MONTH(date) AS month, COALESCE(category, '') AS category, COUNT(*) AS txn_count, "
+               "SUM(amount) AS total, SUM(GREATEST(amount, 0)) AS spending FROM transactions "
+               "WHERE user_id = %s AND " + periods.condition() + " GROUP BY MONTH(date), COALESCE(category, '')")
+YEAR_ROLLUP = ("SELECT month, category, txn_count, total, spending FROM monthly_category_totals "
+               "WHERE user_id = %s AND year = %s AND txn_count <> 0")
+RECORD_YEAR = """
+    INSERT INTO archived_years (user_id, year, txn_count, total)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE txn_count = VALUES(txn_count), total = VALUES(total), archived_at = CURRENT_TIMESTAMP
+"""
+ARCHIVED_YEARS = "SELECT user_id, year, txn_count, total FROM archived_years"
+LIVE_IDS = "SELECT id FROM transactions WHERE user_id = %s AND " + periods.condition()
+PARTITION_ROWS = "SELECT COUNT(*) AS txn_count FROM transactions WHERE " + periods.condition()
+
+
+def path(root, user_id, year):
+    return os.path.join(root, str(user_id), f'{year}.json.gz')
+
+
+def years(root, user_id):
+    # Archived years for the user, newest first. A directory listing rather
+    # than a query, so pages that never reach archived years cost no I/O
+    try:
+        names = os.listdir(os.path.join(root, str(user_id)))
+    except FileNotFoundError:
+        return []
+    return sorted((int(name.split('.')[0]) for name in names if name.endswith('.json.gz')), reverse=True)
+
+
+def load(root, user_id, year):
+    filename = path(root, user_id, year)
+    try:
+        modified = os.stat(filename).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    return _read(filename, modified)
+
+
+@functools.lru_cache(maxsize=32)
+def _read(filename, modified):
+    # Keyed on mtime as well, so a file rewritten by the archive job is
+    # read again
+    with gzip.open(filename, 'rt', encoding='utf-8') as f:
+        document = json.load(f)
+    columns = document['columns']
+    return Archive(document['user_id'], document['year'], columns['id'], columns['date'], columns['amount'],
+                   columns['category'], columns['description'], list(zip(columns['date'], columns['id'])))
+
+
+def write(root, user_id, year, rows):
+    # Merges rows (dicts with COLUMNS) into the user's file for the year and
+    # replaces it atomically. A row already archived is replaced by the live
+    # one, so re-running the job after a failure is harmless.
+    merged = {}
+    existing = load(root, user_id, year)
+    if existing:
+        merged.update((row['id'], row) for row in rows_of(existing))
+    for row in rows:
+        merged[row['id']] = {column: row[column] for column in COLUMNS}
+    ordered = sorted(merged.values(), key=lambda row: (_text(row['date']), row['id']))
+
+    document = {
+        'version': FORMAT_VERSION,
+        'user_id': user_id,
+        'year': year,
+        'txn_count': len(ordered),
+        'total': sum(row['amount'] for row in ordered),
+        'columns': {
+            'id': [row['id'] for row in ordered],
+            'date': [_text(row['date']) for row in ordered],
+            'amount': [row['amount'] for row in ordered],
+            'category': [row['category'] for row in ordered],
+            'description': [row['description'] for row in ordered],
+        },
+    }
+    filename = path(root, user_id, year)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    partial = filename + '.partial'
+    with gzip.open(partial, 'wt', encoding='utf-8') as f:
+        json.dump(document, f, separators=(',', ':'))
+    os.replace(partial, filename)
+    return load(root, user_id, year)
+
+
+def _text(value):
+    return value if isinstance(value, str) else value.strftime(DATE_FORMAT)
+
+
+def _row(archive, index):
+    return {'id': archive.ids[index], 'date': datetime.strptime(archive.dates[index], DATE_FORMAT),
+            'amount': archive.amounts[index], 'category': archive.categories[index],
+            'description': archive.descriptions[index]}
+
+
+def rows_of(archive, reverse=False):
+    indexes = range(len(archive.ids))
+    for index in reversed(indexes) if reverse else indexes:
+        yield _row(archive, index)
+
+
+def _key(row):
+    return row['date'], row['id']
+
+
+def _distinct(rows):
+    # Merged rows arrive in key order, so a row both archived and still in
+    # the table (mid-run, or written late) comes out twice in a row
+    previous = None
+    for row in rows:
+        if row['id'] != previous:
+            yield row
+        previous = row['id']
+
+
+# Read paths
+
+def _older_rows(root, user_id, archived, category, period, after):
+    # Archived rows newest first, older than the (date, id) cursor `after`
+    for year in archived:
+        if period and not (period.start < datetime(year + 1, 1, 1) and period.end > datetime(year, 1, 1)):
+            continue
+        if after and year > after[0].year:
+            continue
+        archive = load(root, user_id, year)
+        if archive is None:
+            continue
+        end = bisect.bisect_left(archive.keys, (after[0].strftime(DATE_FORMAT), after[1])) if after else len(archive.keys)
+        start, stop = (_text(period.start), _text(period.end)) if period else (None, None)
+        for index in range(end - 1, -1, -1):
+            if period and not start <= archive.dates[index] < stop:
+                continue
+            if category and archive.categories[index] != category:
+                continue
+            yield _row(archive, index)
+
+
+def history(rows, root, user_id, category=None, period=None, after=None, limit=None):
+    # rows: one page from the table, newest first. Rows newer than every
+    # archived year pass straight through; the rest are merged with the
+    # archive, so a page only opens archive files once it reaches them.
+    archived = years(root, user_id)
+    if not archived:
+        yield from rows
+        return
+
+    boundary = datetime(archived[0] + 1, 1, 1)
+    rows = iter(rows)
+    shown = 0
+    for row in rows:
+        if row['date'] < boundary:
+            rows = itertools.chain([row], rows)
+            break
+        yield row
+        shown += 1
+    if limit is not None and shown >= limit:
+        return
+
+    older = _older_rows(root, user_id, archived, category, period, after)
+    merged = _distinct(heapq.merge(rows, older, key=_key, reverse=True))
+    yield from itertools.islice(merged, None if limit is None else limit - shown)
+
+
+def export(rows, root, user_id):
+    # rows: the user's table rows oldest first, with their ids
+    archived = sorted(years(root, user_id))
+    older = itertools.chain.from_iterable(rows_of(archive) for archive in
+                                          (load(root, user_id, year) for year in archived) if archive)
+    return _distinct(heapq.merge(older, rows, key=_key))
+
+
+# The archive job and its checks
+
+def archive_year(connection, root, year, drop_partition=False):
+    # Moves every user's rows for `year` into their files, one user per DB
+    # transaction: read and lock the rows, write and re-read the file,
+    # check it holds every row, record the year, then delete the rows.
+    # With drop_partition the rows are left for a single DROP PARTITION
+    # once every file is written and the partition's row count matches.
+    window = periods.year(year)
+    summary = {'year': year, 'users': 0, 'transactions': 0, 'total': 0, 'partition_dropped': False}
+    with connection.cursor() as cur:
+        if drop_partition and year not in partitions.partitioned_years(cur):
+            raise ArchiveError(f'transactions has no partition {partitions.name(year)}')
+        cur.execute(YEAR_USERS, periods.params(window))
+        users = [row['user_id'] for row in cur.fetchall()]
+
+        for user_id in users:
+            cur.execute(YEAR_ROWS, [user_id] + periods.params(window))
+            rows = cur.fetchall()
+            archive = write(root, user_id, year, rows)
+            missing = set(row['id'] for row in rows) - set(archive.ids)
+            if missing:
+                connection.rollback()
+                raise ArchiveError(f'{path(root, user_id, year)} is missing {len(missing)} rows')
+
+            total = sum(archive.amounts)
+            cur.execute(RECORD_YEAR, (user_id, year, len(archive.ids), total))
+            if not drop_partition:
+                cur.execute(DELETE_YEAR_ROWS, [user_id] + periods.params(window))
+            search.remove(cur, [row['id'] for row in rows])
+            connection.commit()
+
+            summary['users'] += 1
+            summary['transactions'] += len(rows)
+            summary['total'] += sum(row['amount'] for row in rows)
+
+        if drop_partition:
+            cur.execute(PARTITION_ROWS, periods.params(window))
+            live = cur.fetchone()['txn_count']
+            if live != summary['transactions']:
+                raise ArchiveError(f'{live} rows in partition {partitions.name(year)} but {summary["transactions"]} '
+                                   f'archived; rerun `flask archive run` for {year}')
+            cur.execute(partitions.drop_statement(year))
+            summary['partition_dropped'] = True
+    return summary
+
+
+def verify(cur, root, user_id=None):
+    # For every archived (user, year): the file must match its archived_years
+    # record, and the file plus any rows still in the table must add up to
+    # the rollup row for every (month, category)
+    cur.execute(ARCHIVED_YEARS + (" WHERE user_id = %s" if user_id else ""), [user_id] if user_id else [])
+    mismatches = []
+    for record in cur.fetchall():
+        key = (record['user_id'], record['year'])
+        archive = load(root, *key)
+        if archive is None:
+            mismatches.append({'key': key, 'problem': 'file missing'})
+            continue
+        if len(archive.ids) != record['txn_count'] or sum(archive.amounts) != record['total']:
+            mismatches.append({'key': key, 'problem': 'file does not match archived_years',
+                               'expected': {'txn_count': record['txn_count'], 'total': record['total']},
+                               'actual': {'txn_count': len(archive.ids), 'total': sum(archive.amounts)}})
+
+        # A row still in the table (mid-run, or written after the year was
+        # archived) is counted from the table, where edits land
+        window = periods.params(periods.year(record['year']))
+        cur.execute(LIVE_IDS, [record['user_id']] + window)
+        expected = summarize(archive, skip=set(row['id'] for row in cur.fetchall()))
+        cur.execute(YEAR_MONTHS, [record['user_id']] + window)
+        for row in cur.fetchall():
+            month_key = (row['month'], row['category'])
+            count, total, spending = expected.get(month_key, (0, 0, 0))
+            expected[month_key] = (count + row['txn_count'], total + row['total'], spending + row['spending'])
+
+        cur.execute(YEAR_ROLLUP, key)
+        actual = {(row['month'], row['category']): (row['txn_count'], row['total'], row['spending'])
+                  for row in cur.fetchall()}
+        for month_key in sorted(set(expected) | set(actual)):
+            want = expected.get(month_key, (0, 0, 0))
+            got = tuple(actual.get(month_key, (0, 0, 0)))
+            if tuple(int(value) for value in want) != tuple(int(value) for value in got):
+                mismatches.append({'key': key + month_key, 'problem': 'rollup differs from archive plus table',
+                                   'expected': dict(zip(('txn_count', 'total', 'spending'), want)),
+                                   'actual': dict(zip(('txn_count', 'total', 'spending'), got))})
+    return mismatches
+
+
+def summarize(archive, skip=()):
+    # {(month, category): (txn_count, total, spending)}, as in the rollup,
+    # leaving out the ids in skip
+    totals = {}
+    for row_id, when, category, amount in zip(archive.ids, archive.dates, archive.categories, archive.amounts):
+        if row_id in skip:
+            continue
+        key = (int(when[5:7]), category or '')
+        count, total, spending = totals.get(key, (0, 0, 0))
+        totals[key] = (count + 1, total + amount, spending + max(amount, 0))
+    return totals
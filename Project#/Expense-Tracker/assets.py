@@ -0,0 +1,191 @@
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import re
+
+from flask import abort, request, send_from_directory
+
+# Build step and serving for fingerprinted static files. `flask assets
+# build` copies every file under static/ into static/dist/ under a name
+# carrying a hash of its content (styles/style.css becomes
+# styles/style.1a2b3c4d5e6f.css), minifying CSS and JS first. Next to each
+# text file it writes .gz (and .br when the brotli package is installed)
+# copies, and next to each PNG/JPEG a .webp variant when Pillow is installed
+# and the variant is smaller. manifest.json maps each source name to the
+# files built from it.
+#
+# With a manifest, init_app() makes url_for('static', filename=...) resolve
+# to the built file and serves static/dist/ itself: the WebP variant to
+# clients that ask for image/webp, the precompressed copy the client
+# accepts (br, then gzip), and a one-year immutable Cache-Control, since a
+# changed file gets a new name. Without one (before the first build) both
+# behave as Flask's defaults. Old builds are left in place so pages cached
+# before a deploy can still load their assets.
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+HASH_LENGTH = 12
+MAX_AGE = 365 * 24 * 3600
+TEXT = {'.css', '.js', '.svg', '.json', '.txt'}
+IMAGES = {'.png', '.jpg', '.jpeg'}
+WEBP_QUALITY = 80
+
+CSS_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+CSS_SPACE = re.compile(r'\s+')
+CSS_PUNCTUATION = re.compile(r'\s*([{};,>])\s*')
+
+
+def minify_css(text):
+    text = CSS_SPACE.sub(' ', CSS_COMMENT.sub('', text))
+    return CSS_PUNCTUATION.sub(r'\1', text).replace(';}', '}').strip()
+
+
+def minify_js(text):
+    # Line by line, so automatic semicolon insertion sees the same line
+    # breaks: drops indentation, blank lines and whole-line comments, and
+    # leaves lines inside a multi-line template literal alone
+    lines, literal, comment = [], False, False
+    for line in text.splitlines():
+        stripped = line.strip()
+        if literal:
+            lines.append(line)
+        elif comment:
+            comment = '*/' not in stripped
+            continue
+        elif stripped.startswith('/*'):
+            comment = '*/' not in stripped
+            continue
+        elif stripped and not stripped.startswith('//'):
+            lines.append(stripped)
+        literal ^= line.count('`') % 2 == 1
+    return '\n'.join(lines) + '\n'
+
+
+def _fingerprint(source, data):
+    root, extension = os.path.splitext(source)
+    return f"{root}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{extension}"
+
+
+def _compressed(data):
+    yield 'gzip', '.gz', gzip.compress(data, 9, mtime=0)
+    try:
+        import brotli
+    except ImportError:
+        return
+    yield 'br', '.br', brotli.compress(data, quality=11)
+
+
+def _webp(data, extension):
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    with Image.open(io.BytesIO(data)) as image:
+        output = io.BytesIO()
+        if extension == '.png':
+            image.save(output, 'WEBP', lossless=True, method=6)
+        else:
+            image.save(output, 'WEBP', quality=WEBP_QUALITY, method=6)
+    return output.getvalue()
+
+
+def _write(directory, name, data):
+    path = os.path.join(directory, *name.split('/'))
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'wb') as file:
+        file.write(data)
+    os.replace(path + '.tmp', path)
+
+
+def sources(static_dir):
+    for directory, subdirectories, files in os.walk(static_dir):
+        if directory == static_dir and DIST in subdirectories:
+            subdirectories.remove(DIST)
+        for file in sorted(files):
+            yield os.path.relpath(os.path.join(directory, file), static_dir).replace(os.sep, '/')
+
+
+def build(static_dir):
+    dist = os.path.join(static_dir, DIST)
+    manifest = {}
+    for source in sources(static_dir):
+        with open(os.path.join(static_dir, source), 'rb') as file:
+            data = file.read()
+        extension = os.path.splitext(source)[1].lower()
+        if extension == '.css':
+            data = minify_css(data.decode('utf-8')).encode('utf-8')
+        elif extension == '.js':
+            data = minify_js(data.decode('utf-8')).encode('utf-8')
+
+        name = _fingerprint(source, data)
+        _write(dist, name, data)
+        entry = {'file': name, 'bytes': len(data), 'encodings': {}}
+        if extension in TEXT:
+            for encoding, suffix, compressed in _compressed(data):
+                if len(compressed) < len(data):
+                    _write(dist, name + suffix, compressed)
+                    entry['encodings'][encoding] = len(compressed)
+        if extension in IMAGES:
+            webp = _webp(data, extension)
+            if webp and len(webp) < len(data):
+                _write(dist, name + '.webp', webp)
+                entry['webp'] = len(webp)
+        manifest[source] = entry
+
+    path = os.path.join(dist, MANIFEST)
+    with open(path + '.tmp', 'w') as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+    return manifest
+
+
+def load(static_dir):
+    try:
+        with open(os.path.join(static_dir, DIST, MANIFEST)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def init_app(app):
+    manifest = load(app.static_folder)
+    if not manifest:
+        return
+    dist = os.path.join(app.static_folder, DIST)
+    built = {entry['file']: entry for entry in manifest.values()}
+
+    @app.url_defaults
+    def fingerprinted(endpoint, values):
+        if endpoint == 'static':
+            entry = manifest.get(values.get('filename'))
+            if entry:
+                values['filename'] = f"{DIST}/{entry['file']}"
+
+    # More specific than Flask's /static/<path:filename>, so it wins
+    @app.route(f'{app.static_url_path}/{DIST}/<path:filename>', endpoint='static_dist')
+    def static_dist(filename):
+        entry = built.get(filename)
+        if entry is None:
+            abort(404)
+        name, mimetype, encoding = filename, mimetypes.guess_type(filename)[0], None
+        if 'webp' in entry and any(value == 'image/webp' for value, _ in request.accept_mimetypes):
+            name, mimetype = filename + '.webp', 'image/webp'
+        for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if candidate in entry['encodings'] and candidate in request.accept_encodings:
+                name, encoding = filename + suffix, candidate
+                break
+
+        response = send_from_directory(dist, name, mimetype=mimetype, max_age=MAX_AGE)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if 'webp' in entry:
+            response.vary.add('Accept')
+        if entry['encodings']:
+            response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
@@ -0,0 +1,109 @@
+"""Peak memory of the admin analytics reports against data size.
+
+Fills a fresh in-process SQLite database (DATABASE_BACKEND=sqlite, so no
+MySQL is needed) with --users users and each --rows count of transactions
+in turn, spread over the last year, rebuilds the monthly rollup, and runs
+every report in admin.REPORTS through /admin/analytics as an admin. Prints
+the rows each report read, its run time and the peak Python memory
+(tracemalloc, which also sees NumPy's arrays) while it ran, as JSON. The
+peaks should stay flat as the row count grows; exits non-zero if any grows
+by more than --max-growth-mb from the smallest run to the largest.
+
+    python bench/admin.py --rows 100000 1000000
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CATEGORIES = ['Food', 'Rent', 'Transport', 'Utilities', 'Shopping', 'Health', 'Travel', 'Fun']
+
+
+def seed(mysql, users, rows):
+    import rollup
+    now = datetime.now().replace(microsecond=0)
+    with mysql.connection.cursor() as cur:
+        cur.executemany("INSERT INTO users (username, password, role) VALUES (%s, 'x', %s)",
+                        [(f'user{n:05d}', 'admin' if n == 0 else 'user') for n in range(users)])
+        random.seed(rows)
+        for start in range(0, rows, 50000):
+            cur.executemany("INSERT INTO transactions (user_id, amount, description, category, date) "
+                            "VALUES (%s, %s, 'bench', %s, %s)",
+                            [(random.randint(1, users), int(random.lognormvariate(5, 1.2)) + 1,
+                              random.choice(CATEGORIES), now - timedelta(minutes=random.randint(0, 525600)))
+                             for _ in range(min(50000, rows - start))])
+        cur.executemany("INSERT INTO category_budgets (user_id, category, budget_limit, created_at) "
+                        "VALUES (%s, %s, %s, %s)",
+                        [(user, 'Food', random.choice([200, 500, 1000]), now - timedelta(days=400))
+                         for user in range(1, users + 1, 2)])
+        rollup.rebuild(cur, None)
+        mysql.connection.commit()
+
+
+def run(users, rows):
+    # One database size, in this process
+    sys.path.insert(0, APP_DIR)
+    os.chdir(APP_DIR)
+    from app import create_app, mysql
+    import admin
+
+    app = create_app()
+
+    with app.app_context():
+        seed(mysql, users, rows)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session.update(logged_in=True, username='user00000', userID=1)
+
+    results = {}
+    for name in admin.REPORTS:
+        tracemalloc.start()
+        started = time.perf_counter()
+        lines = client.get(f'/admin/analytics/{name}').get_data(as_text=True).splitlines()
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        last = json.loads(lines[-1])
+        if 'result' not in last:
+            raise SystemExit(f'{name} failed: {last}')
+        results[name] = {'rows_read': last['rows'], 'seconds': round(elapsed, 3), 'peak_mb': round(peak / 2 ** 20, 2)}
+    print(json.dumps(results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--max-growth-mb', type=float, default=2)
+    parser.add_argument('--run', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run is not None:
+        run(args.users, args.run)
+        return 0
+
+    report = {}
+    for rows in sorted(args.rows):
+        environment = dict(os.environ, DATABASE_BACKEND='sqlite', SQLITE_PATH=':memory:')
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--users', str(args.users),
+                                 '--run', str(rows)], cwd=APP_DIR, env=environment, check=True,
+                                capture_output=True, text=True).stdout
+        report[rows] = json.loads(output.strip().splitlines()[-1])
+    print(json.dumps(report, indent=2))
+
+    smallest, largest = report[min(report)], report[max(report)]
+    grown = [name for name in largest if largest[name]['peak_mb'] - smallest[name]['peak_mb'] > args.max_growth_mb]
+    if grown:
+        print(f"FAIL: peak memory grew with the data for {', '.join(grown)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
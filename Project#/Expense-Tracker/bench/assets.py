@@ -0,0 +1,91 @@
+"""Static asset transfer for first and repeat page loads.
+
+Builds static/dist/ (as `flask assets build` does), then loads the public
+pages through a test client the way a browser with a cache would. Each
+page's HTML is fetched, then every /static/ URL it references, with a
+browser's Accept and Accept-Encoding headers. A repeat load skips an asset
+that is still fresh in the cache (max-age) and revalidates the rest with
+If-None-Match. The same assets are then fetched again through Flask's
+default static route (/static/<source name>) for comparison. Prints asset
+requests and bytes per load as JSON, and exits non-zero if a repeat load
+of the built assets transfers more than --max-repeat-bytes.
+
+    python bench/assets.py --max-repeat-bytes 0
+"""
+import argparse
+import json
+import os
+import re
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+os.chdir(APP_DIR)
+
+import assets
+
+assets.build(os.path.join(APP_DIR, 'static'))
+
+from app import create_app
+
+app = create_app()
+
+PAGES = ['/', '/about', '/login', '/signup']
+BROWSER = {'Accept': 'image/avif,image/webp,*/*;q=0.8', 'Accept-Encoding': 'gzip, deflate, br'}
+ASSET_URL = re.compile(r'''(?:href|src)="(/static/[^"]+)"|url\('(/static/[^']+)'\)''')
+
+
+def page_assets(client):
+    urls = []
+    for page in PAGES:
+        html = client.get(page, headers=BROWSER).get_data(as_text=True)
+        for match in ASSET_URL.finditer(html):
+            url = match.group(1) or match.group(2)
+            if url not in urls:
+                urls.append(url)
+    return urls
+
+
+def load(client, urls, cache):
+    # One page load of every asset; cache maps URL to (fresh, ETag)
+    requests, transferred = 0, 0
+    for url in urls:
+        fresh, etag = cache.get(url, (False, None))
+        if fresh:
+            continue
+        headers = dict(BROWSER, **({'If-None-Match': etag} if etag else {}))
+        response = client.get(url, headers=headers)
+        requests += 1
+        transferred += len(response.data)
+        max_age = response.cache_control.max_age or 0
+        cache[url] = (max_age > 0, response.headers.get('ETag', etag))
+    return {'requests': requests, 'bytes': transferred}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--max-repeat-bytes', type=int, default=0)
+    args = parser.parse_args()
+
+    client = app.test_client()
+    built = page_assets(client)
+    sources = {entry['file']: source for source, entry in assets.load(app.static_folder).items()}
+    plain = [f"{app.static_url_path}/{sources[url.split('/' + assets.DIST + '/', 1)[1]]}" for url in built]
+
+    report = {}
+    for name, urls in (('fingerprinted', built), ('flask_default', plain)):
+        cache = {}
+        report[name] = {'assets': len(urls), 'first_load': load(client, urls, cache),
+                        'repeat_load': load(client, urls, cache)}
+    print(json.dumps(report, indent=2))
+
+    repeat = report['fingerprinted']['repeat_load']['bytes']
+    if repeat > args.max_repeat_bytes:
+        print(f'FAIL: repeat load transferred {repeat} bytes of assets (budget {args.max_repeat_bytes})',
+              file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""Spending insights budget.
+
+Builds a synthetic 13-month history (100k transactions by default, shaped
+like the rows the driver returns) and times analytics.columns() and
+analytics.insights() on it. Prints the median and worst times as JSON and
+exits non-zero if the median of the two together exceeds --max-ms.
+
+    python bench/insights.py --transactions 100000 --max-ms 50
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import date
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+import analytics
+
+
+def synthetic_rows(count, categories, today, seed):
+    rng = random.Random(seed)
+    first = analytics._day_number(analytics.history_start(today))
+    last = analytics._day_number(today)
+    names = [f'Category {index}' for index in range(categories)]
+    return [{'day': rng.randint(first, last), 'amount': int(rng.lognormvariate(6, 1)) + 1, 'category': rng.choice(names)}
+            for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--transactions', type=int, default=100000)
+    parser.add_argument('--categories', type=int, default=40)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--max-ms', type=float, default=50)
+    args = parser.parse_args()
+
+    today = date.today()
+    rows = synthetic_rows(args.transactions, args.categories, today, args.seed)
+    analytics.insights(analytics.columns(rows), today, 50000, 5000)
+
+    load_ms, compute_ms = [], []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        data = analytics.columns(rows)
+        loaded = time.perf_counter()
+        analytics.insights(data, today, 50000, 5000)
+        finished = time.perf_counter()
+        load_ms.append((loaded - started) * 1000)
+        compute_ms.append((finished - loaded) * 1000)
+
+    def median(values):
+        return sorted(values)[len(values) // 2]
+
+    report = {
+        'transactions': args.transactions,
+        'runs': args.runs,
+        'columns_ms': round(median(load_ms), 2),
+        'insights_ms': round(median(compute_ms), 2),
+        'total_ms': round(median([a + b for a, b in zip(load_ms, compute_ms)]), 2),
+        'worst_total_ms': round(max(a + b for a, b in zip(load_ms, compute_ms)), 2),
+    }
+    print(json.dumps(report, indent=2))
+
+    if report['total_ms'] > args.max_ms:
+        print(f"FAIL: insights took {report['total_ms']:.1f} ms for {args.transactions} transactions "
+              f"(budget {args.max_ms:.0f} ms)", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
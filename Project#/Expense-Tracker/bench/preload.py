@@ -0,0 +1,101 @@
+"""Per-worker memory saved by preloading the app before fork.
+
+Forks --workers workers the way a pre-fork server does, twice, each time
+from a fresh master process:
+
+  preload  the master imports wsgi.py (app.py, PRELOAD_MODULES, compiled
+           templates, gc.freeze) and each worker runs wsgi.warm_up()
+  lazy     each worker imports wsgi.py itself after fork, as a server
+           without preload does, and then runs wsgi.warm_up()
+
+Workers then run a full collection, as they would while serving, and
+report their private memory (Private_Clean + Private_Dirty from
+/proc/self/smaps_rollup, so Linux only) and PSS. Prints the per-worker
+averages for both modes and the private memory saved per worker as JSON.
+Runs on the in-process SQLite backend, so no MySQL is needed.
+
+    python bench/preload.py --workers 4
+"""
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def memory():
+    fields = {}
+    with open('/proc/self/smaps_rollup') as smaps:
+        for line in smaps:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return {'private_mb': (fields['Private_Clean'] + fields['Private_Dirty']) / 1024, 'pss_mb': fields['Pss'] / 1024}
+
+
+def worker(output):
+    import wsgi
+    wsgi.warm_up(wsgi.application)
+    gc.collect()
+    os.write(output, (json.dumps(memory()) + '\n').encode())
+    os._exit(0)
+
+
+def run_master(mode, workers):
+    # One master: fork the workers, collect one line of JSON from each
+    if mode == 'preload':
+        __import__('wsgi')
+    reader, writer = os.pipe()
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            os.close(reader)
+            worker(writer)
+        children.append(pid)
+    os.close(writer)
+    with os.fdopen(reader) as lines:
+        results = [json.loads(line) for line in lines]
+    for pid in children:
+        os.waitpid(pid, 0)
+    print(json.dumps({
+        'private_mb': sum(result['private_mb'] for result in results) / len(results),
+        'pss_mb': sum(result['pss_mb'] for result in results) / len(results),
+    }))
+
+
+def measure(mode, workers):
+    environment = dict(os.environ, DATABASE_BACKEND='sqlite', SQLITE_PATH=':memory:')
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--master', mode, '--workers', str(workers)],
+                            cwd=APP_DIR, env=environment, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--master', choices=['preload', 'lazy'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.master:
+        sys.path.insert(0, APP_DIR)
+        run_master(args.master, args.workers)
+        return 0
+
+    preload = measure('preload', args.workers)
+    lazy = measure('lazy', args.workers)
+    report = {
+        'workers': args.workers,
+        'preload': {key: round(value, 1) for key, value in preload.items()},
+        'lazy': {key: round(value, 1) for key, value in lazy.items()},
+        'private_mb_saved_per_worker': round(lazy['private_mb'] - preload['private_mb'], 1),
+    }
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""Read/write routing against a primary and a replica.
+
+Needs two MySQL/MariaDB servers with the queries.sql schema, the second
+replicating from the first, and the app pointed at both:
+
+    MYSQL_REPLICAS=127.0.0.1:3307 python bench/replicas.py --user bench00001
+
+Logs in as a seeded user (see bench/seed.py) and walks through a write the
+way a browser does, noting for each request whether its connection came
+from the primary or a replica (db_checkouts_total) and whether the page
+shows the new transaction:
+
+  idle       GET /addTransactions once the login's pin has expired: replica
+  write      POST /addTransactions and the redirect after it: primary, and
+             the new transaction is on the page however far the replica lags
+  pinned     GET /transactionHistory/page within --window seconds: primary
+  expired    GET /addTransactions after the window: replica again
+
+The transaction is deleted again at the end. Prints the steps as JSON and
+exits non-zero if any was routed to the wrong server or read-after-write
+missed the write. Run `flask db replicas` first to check the replica is
+replicating.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+os.chdir(APP_DIR)
+
+import metrics
+from app import create_app
+
+app = create_app()
+
+CATEGORY = 'Bench'
+
+
+def checkouts():
+    return {target: metrics.counter('db_checkouts_total', 'Connections checked out by target', target=target).value
+            for target in ('primary', 'replica')}
+
+
+def step(name, expected, request, marker=None, seen=None):
+    before = checkouts()
+    response = request()
+    after = checkouts()
+    targets = sorted(target for target in after if after[target] > before[target])
+    result = {'step': name, 'status': response.status_code, 'targets': targets, 'expected': expected}
+    if seen is not None:
+        result['sees_write'] = marker in response.get_data(as_text=True)
+        result['ok'] = targets == [expected] and result['sees_write'] == seen
+    else:
+        result['ok'] = targets == [expected]
+    return result, response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--user', default='bench00001')
+    parser.add_argument('--password', default='bench-password')
+    parser.add_argument('--window', type=float, default=2, help='READ_YOUR_WRITES_SECONDS for the run.')
+    parser.add_argument('--lag', type=float, default=1, help='Seconds to allow the replica to catch up.')
+    args = parser.parse_args()
+
+    if not app.config.get('MYSQL_REPLICAS'):
+        raise SystemExit('set MYSQL_REPLICAS to the replica address')
+    app.config['READ_YOUR_WRITES_SECONDS'] = args.window
+
+    client = app.test_client()
+    if client.post('/login', data={'username': args.user, 'password': args.password}).status_code != 302:
+        raise SystemExit(f'login failed for {args.user}; run bench/seed.py first')
+    time.sleep(args.window)
+
+    marker = f'replica check {uuid.uuid4().hex[:12]}'
+    steps = []
+    steps.append(step('idle', 'replica', lambda: client.get('/addTransactions'), marker, False)[0])
+    steps.append(step('write', 'primary', lambda: client.post(
+        '/addTransactions', data={'amount': '1', 'description': marker, 'category': CATEGORY},
+        follow_redirects=True), marker, True)[0])
+    result, response = step('pinned', 'primary', lambda: client.get(f'/transactionHistory/page?category={CATEGORY}'))
+    steps.append(result)
+    time.sleep(args.window + args.lag)
+    steps.append(step('expired', 'replica', lambda: client.get('/addTransactions'), marker, True)[0])
+
+    for row in response.get_json()['transactions']:
+        if row['description'] == marker:
+            client.post(f"/deleteCurrentMonthTransaction/{row['id']}")
+
+    print(json.dumps(steps, indent=2))
+    failed = [result['step'] for result in steps if not result['ok']]
+    if failed:
+        print(f"FAIL: {', '.join(failed)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
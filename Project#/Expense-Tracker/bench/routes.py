@@ -0,0 +1,282 @@
+"""Route-level load benchmark.
+
+Logs in as several seeded users (see bench/seed.py) and drives the app's
+routes in-process through Flask test clients, one thread per session, for a
+fixed duration. Reports p50/p95/p99 latency, throughput and DB queries and
+DB time per request (from the Server-Timing header) for each route as JSON,
+so runs can be saved and compared across commits:
+
+    python bench/routes.py --sessions 8 --duration 30 --output before.json
+    python bench/routes.py --sessions 8 --duration 30 --compare before.json --max-regression 10
+
+Streamed pages (transactionHistory, export.csv) are timed to the last byte,
+but their Server-Timing only covers the queries run before streaming began.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+os.chdir(APP_DIR)
+
+from app import create_app
+
+app = create_app()
+
+THIS_YEAR = datetime.now().year
+
+# (name, method, path, form data); paths may use {transaction_id} and
+# {cursor}, filled in per session
+READS = [
+    ('index', 'GET', '/', None),
+    ('about', 'GET', '/about', None),
+    ('addTransactions', 'GET', '/addTransactions', None),
+    ('transactionHistory', 'GET', '/transactionHistory', None),
+    ('transactionHistory:year', 'POST', '/transactionHistory', {'month': '00', 'year': str(THIS_YEAR)}),
+    ('transactionHistory:month', 'POST', '/transactionHistory',
+     {'month': f'{datetime.now().month:02d}', 'year': str(THIS_YEAR)}),
+    ('transactionHistoryPage', 'GET', '/transactionHistory/page', None),
+    ('transactionHistoryPage:deep', 'GET', '/transactionHistory/page?cursor={cursor}', None),
+    ('exportTransactions', 'GET', '/transactions/export.csv', None),
+    ('transactionSearch', 'GET', '/api/transactions/search?q=card', None),
+    ('transactionSearch:facet', 'GET', f'/api/transactions/search?q=food+mar&from={THIS_YEAR - 1}-01-01', None),
+    ('editCurrentMonthTransaction', 'GET', '/editCurrentMonthTransaction/{transaction_id}', None),
+    ('track_budget', 'GET', '/track_budget', None),
+    ('createBarCharts', 'GET', '/category', None),
+    ('yearlyBar', 'GET', '/yearly_bar', None),
+    ('monthlyBar', 'GET', '/monthly_bar', None),
+    ('dashboard', 'GET', '/dashboard', None),
+    ('dashboardSeries', 'GET', '/api/dashboard', None),
+    ('spendingReport', 'GET', f'/reports/{THIS_YEAR}/{datetime.now().month}/report.png', None),
+    ('metrics', 'GET', '/metrics', None),
+]
+
+# Writes run in pairs, the second undoing the first, so the seeded data
+# stays put. They only touch the 'Bench' category, which seed.py never uses.
+WRITES = [
+    [('addTransactions:post', 'POST', '/addTransactions',
+      {'amount': '125', 'description': 'bench write', 'category': 'Bench'}),
+     ('deleteCurrentMonthTransaction', 'POST', '/deleteCurrentMonthTransaction/{bench_id}', None)],
+    [('set_category_budget', 'POST', '/set_category_budget', {'category': 'Bench', 'budget_limit': '1000'}),
+     ('delete_category_budget', 'POST', '/category_budget/delete/Bench', None)],
+]
+
+# Endpoints deliberately not driven, and why
+SKIPPED = {
+    'static': 'static files',
+    'static_dist': 'static files',
+    'logout': 'ends the session',
+    'signup': 'creates users; timed by hashing, not the DB',
+    'reset_request': 'queues email',
+    'reset_token': 'needs a mailed token',
+    'importTransactions': 'bulk write; use a dedicated import run',
+    'deleteTransaction': 'same handler as deleteCurrentMonthTransaction',
+    'adminAnalytics': 'admin only; scans every user, so not a per-session route',
+}
+
+SERVER_TIMING = re.compile(r'dur=([\d.]+);desc="(\d+) queries"')
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Session:
+    def __init__(self, username, password):
+        self.client = app.test_client()
+        self.samples = []
+        self.values = {}
+        started = time.perf_counter()
+        response = self.client.post('/login', data={'username': username, 'password': password})
+        if response.status_code != 302:
+            raise SystemExit(f'login failed for {username} ({response.status_code}); run bench/seed.py first')
+        self.record('login:post', started, response)
+
+    def discover(self):
+        # A transaction id and a deep keyset cursor for the parameterised routes
+        page = self.client.get('/transactionHistory/page').get_json() or {}
+        rows = page.get('transactions') or []
+        self.values['transaction_id'] = rows[0]['id'] if rows else 0
+        self.values['cursor'] = page.get('next_cursor') or ''
+        if page.get('next_cursor'):
+            deeper = self.client.get('/transactionHistory/page?cursor=' + page['next_cursor']).get_json()
+            self.values['cursor'] = deeper.get('next_cursor') or self.values['cursor']
+
+    def request(self, name, method, path, data):
+        if '{bench_id}' in path:
+            rows = self.client.get('/transactionHistory/page?category=Bench').get_json()['transactions']
+            self.values['bench_id'] = rows[0]['id'] if rows else 0
+        url = path.format(**self.values)
+        started = time.perf_counter()
+        response = self.client.open(url, method=method, data=data)
+        response.get_data()
+        self.record(name, started, response)
+
+    def record(self, name, started, response):
+        elapsed = time.perf_counter() - started
+        match = SERVER_TIMING.search(response.headers.get('Server-Timing', ''))
+        db_ms, queries = (float(match.group(1)), int(match.group(2))) if match else (0.0, 0)
+        self.samples.append((name, elapsed, queries, db_ms, response.status_code >= 400))
+        response.close()
+
+
+def run(sessions, scenario, duration, warmup):
+    deadline = [None]
+    start = threading.Barrier(len(sessions) + 1)
+
+    def worker(session, seed):
+        rng = random.Random(seed)
+        start.wait()
+        while time.perf_counter() < deadline[0]:
+            for group in rng.sample(scenario, len(scenario)):
+                for step in group:
+                    session.request(*step)
+
+    for session in sessions:
+        session.discover()
+        for _ in range(warmup):
+            for group in scenario:
+                for step in group:
+                    session.request(*step)
+        session.samples = [sample for sample in session.samples if sample[0] == 'login:post']
+
+    threads = [threading.Thread(target=worker, args=(session, index)) for index, session in enumerate(sessions)]
+    for thread in threads:
+        thread.start()
+    deadline[0] = time.perf_counter() + duration
+    measured_from = time.perf_counter()
+    start.wait()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - measured_from
+
+
+def summarise(samples, wall):
+    by_route = {}
+    for name, elapsed, queries, db_ms, failed in samples:
+        by_route.setdefault(name, []).append((elapsed, queries, db_ms, failed))
+
+    routes = {}
+    for name, rows in sorted(by_route.items()):
+        latencies = [row[0] * 1000 for row in rows]
+        routes[name] = {
+            'requests': len(rows),
+            'errors': sum(row[3] for row in rows),
+            'p50_ms': round(percentile(latencies, 0.50), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+            'mean_ms': round(sum(latencies) / len(latencies), 2),
+            'throughput_rps': round(len(rows) / wall, 2),
+            'queries_per_request': round(sum(row[1] for row in rows) / len(rows), 2),
+            'db_ms_per_request': round(sum(row[2] for row in rows) / len(rows), 2),
+        }
+    measured = [sample for sample in samples if sample[0] != 'login:post']
+    latencies = [sample[1] * 1000 for sample in measured]
+    total = {
+        'requests': len(measured),
+        'errors': sum(sample[4] for sample in measured),
+        'p50_ms': round(percentile(latencies, 0.50) or 0, 2),
+        'p95_ms': round(percentile(latencies, 0.95) or 0, 2),
+        'p99_ms': round(percentile(latencies, 0.99) or 0, 2),
+        'throughput_rps': round(len(measured) / wall, 2),
+    }
+    return routes, total
+
+
+def covered_endpoints(scenario):
+    adapter = app.url_map.bind('localhost')
+    covered = set()
+    for group in scenario:
+        for name, method, path, data in group:
+            endpoint, _ = adapter.match(re.sub(r'\{\w+\}', '1', path).split('?')[0], method=method)
+            covered.add(endpoint)
+    return covered
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline, max_regression):
+    failures = []
+    for name, current in report['routes'].items():
+        before = baseline['routes'].get(name)
+        if not before or not before['p95_ms']:
+            continue
+        change = (current['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+        queries = current['queries_per_request'] - before['queries_per_request']
+        print(f"{name:32} p95 {before['p95_ms']:9.2f} -> {current['p95_ms']:9.2f} ms ({change:+6.1f}%)"
+              f"  queries {queries:+.2f}", file=sys.stderr)
+        if max_regression is not None and change > max_regression:
+            failures.append(f'{name} p95 regressed {change:.1f}%')
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=4, help='Concurrent logged-in users.')
+    parser.add_argument('--seeded-users', type=int, default=1000, help='--users given to bench/seed.py.')
+    parser.add_argument('--prefix', default='bench')
+    parser.add_argument('--user-password', default='bench-password')
+    parser.add_argument('--duration', type=float, default=20, help='Measured seconds.')
+    parser.add_argument('--warmup', type=int, default=1, help='Unmeasured passes over the scenario per session.')
+    parser.add_argument('--reads-only', action='store_true', help='Skip the write routes.')
+    parser.add_argument('--output', help='Also write the JSON report to this file.')
+    parser.add_argument('--compare', help='Baseline JSON report to compare p95 latencies against.')
+    parser.add_argument('--max-regression', type=float, default=None, help='Fail if any route p95 grows by more %%.')
+    args = parser.parse_args()
+
+    scenario = [[step] for step in READS] + ([] if args.reads_only else WRITES)
+    uncovered = sorted({rule.endpoint for rule in app.url_map.iter_rules()}
+                       - covered_endpoints(scenario) - {'login'} - set(SKIPPED))
+
+    # Spread sessions across history sizes: rank 1 is the heaviest user
+    ranks = sorted({1 + index * (args.seeded_users - 1) // max(args.sessions - 1, 1) for index in range(args.sessions)})
+    sessions = [Session(f'{args.prefix}{rank:05d}', args.user_password) for rank in ranks]
+    wall = run(sessions, scenario, args.duration, args.warmup)
+    routes, total = summarise([sample for session in sessions for sample in session.samples], wall)
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sessions': len(sessions),
+        'user_ranks': ranks,
+        'duration_s': round(wall, 2),
+        'total': total,
+        'routes': routes,
+        'uncovered_endpoints': uncovered,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+    failures = []
+    if args.compare:
+        with open(args.compare) as f:
+            failures = compare(report, json.load(f), args.max_regression)
+    for failure in failures:
+        print('FAIL: ' + failure, file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""Transaction search latency budget.
+
+Loads one user with --transactions synthetic rows (generated as
+bench/seed.py does) into the in-process SQLite backend, builds their search
+index, and times GET /api/transactions/search through a test client for a
+mix of single-word, prefix, month and faceted queries, first pages and
+deeper keyset pages. Prints p50/p95 per query as JSON and exits non-zero if
+the overall p95 exceeds --max-p95-ms. To time the same endpoint against
+MySQL, seed with bench/seed.py and run bench/routes.py.
+
+    python bench/search.py --transactions 100000 --max-p95-ms 50
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+os.chdir(APP_DIR)
+os.environ['DATABASE_BACKEND'] = 'sqlite'
+os.environ['SQLITE_PATH'] = ':memory:'
+
+import repository
+import rollup
+import search
+import seed
+from app import create_app, mysql
+
+app = create_app()
+
+THIS_YEAR = datetime.now().year
+
+
+def queries(top_category):
+    # Words from seed.DESCRIPTIONS, which every user's rows draw on
+    return [
+        ('word', {'q': 'card'}),
+        ('prefix', {'q': 'onl'}),
+        ('short prefix', {'q': 'ca'}),
+        ('two words', {'q': f'{top_category} upi'}),
+        ('month', {'q': 'cash mar'}),
+        ('category facet', {'q': 'monthly', 'category': top_category}),
+        ('date facet', {'q': 'online', 'from': f'{THIS_YEAR - 1}-01-01', 'to': f'{THIS_YEAR - 1}-12-31'}),
+        ('no match', {'q': 'zzzz'}),
+    ]
+
+
+def load_user(count, years, seed_value):
+    rng = random.Random(seed_value)
+    now = datetime.now()
+    with app.app_context():
+        with mysql.connection.cursor() as cur:
+            user_id = repository.create_user(cur, 'Bench', 'Search', 'search@example.com', 'benchsearch', '')
+            profile = seed.user_profile(rng, seed.category_names(len(seed.CATEGORIES)), now, years)
+            rows = [row[1:] for row in seed.transactions_for(rng, user_id, count, profile, now)]
+            repository.insert_transactions(cur, user_id, rows)
+            rollup.rebuild(cur, user_id)
+            started = time.perf_counter()
+            search.rebuild(cur, user_id)
+            indexed = time.perf_counter() - started
+            mysql.connection.commit()
+    return user_id, profile[0][0], indexed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--transactions', type=int, default=100000)
+    parser.add_argument('--years', type=float, default=2)
+    parser.add_argument('--runs', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--max-p95-ms', type=float, default=50)
+    args = parser.parse_args()
+
+    user_id, top_category, index_seconds = load_user(args.transactions, args.years, args.seed)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['logged_in'] = True
+        session['userID'] = user_id
+
+    def timed(params):
+        started = time.perf_counter()
+        response = client.get('/api/transactions/search', query_string=params)
+        elapsed = (time.perf_counter() - started) * 1000
+        if response.status_code != 200:
+            raise SystemExit(f'search failed ({response.status_code}) for {params}')
+        return elapsed, response.get_json()
+
+    def p(values, fraction):
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    report = {'transactions': args.transactions, 'index_seconds': round(index_seconds, 2), 'queries': {}}
+    everything = []
+    for name, params in queries(top_category):
+        first, deep, hits = [], [], 0
+        for _ in range(args.runs):
+            elapsed, page = timed(params)
+            first.append(elapsed)
+            hits = sum(facet['count'] for facet in page['facets']['category'])
+            if page['next_cursor']:
+                elapsed, _ = timed(dict(params, cursor=page['next_cursor']))
+                deep.append(elapsed)
+        everything += first + deep
+        report['queries'][name] = {
+            'params': params,
+            'matches': hits,
+            'first_page_p50_ms': round(p(first, 0.5), 2),
+            'first_page_p95_ms': round(p(first, 0.95), 2),
+            'next_page_p95_ms': round(p(deep, 0.95), 2) if deep else None,
+        }
+    report['p95_ms'] = round(p(everything, 0.95), 2)
+    print(json.dumps(report, indent=2))
+
+    if report['p95_ms'] > args.max_p95_ms:
+        print(f"FAIL: search p95 {report['p95_ms']:.1f} ms for {args.transactions} transactions "
+              f"(budget {args.max_p95_ms:.0f} ms)", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
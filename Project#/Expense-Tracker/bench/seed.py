@@ -0,0 +1,182 @@
+"""Synthetic data for benchmarking.
+
+Fills the queries.sql schema with users whose history sizes follow a long
+tail (a few users with hundreds of thousands of rows, most with a few
+hundred), Zipf-distributed categories, log-normal amounts and histories of
+varying length, then rebuilds the monthly rollup and the search index.
+Users are named <prefix>00001, <prefix>00002, ... in descending history
+size, all with the same password, so bench/routes.py can log in as any of
+them. Prints a JSON summary.
+
+    python bench/seed.py --users 2000 --transactions 2000000 --reset
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+import MySQLdb
+import MySQLdb.cursors
+from passlib.hash import sha256_crypt
+
+import config
+import rollup
+import search
+
+CATEGORIES = ['Food', 'Groceries', 'Rent', 'Transport', 'Fuel', 'Utilities', 'Phone', 'Internet', 'Shopping',
+              'Clothing', 'Health', 'Pharmacy', 'Insurance', 'Education', 'Books', 'Entertainment', 'Movies',
+              'Subscriptions', 'Travel', 'Hotels', 'Gifts', 'Charity', 'Personal Care', 'Fitness', 'Pets',
+              'Household', 'Repairs', 'Electronics', 'Taxes', 'Fees', 'Kids', 'Coffee', 'Snacks', 'Dining Out',
+              'Parking', 'Taxi', 'Games', 'Music', 'Hobbies', 'Garden']
+DESCRIPTIONS = ['card payment', 'upi', 'cash', 'online order', 'monthly', 'weekend', 'with friends', 'refill',
+                'renewal', 'store', 'market', 'app purchase', 'bill', 'top up', 'misc']
+
+
+def category_names(count):
+    names = list(CATEGORIES[:count])
+    while len(names) < count:
+        names.append(f'Category {len(names) + 1}')
+    return names
+
+
+def history_sizes(rng, users, transactions, alpha):
+    # Pareto weights give the long tail; every user gets at least one row
+    weights = sorted((rng.paretovariate(alpha) for _ in range(users)), reverse=True)
+    scale = transactions / sum(weights)
+    return [max(1, int(weight * scale)) for weight in weights]
+
+
+def user_profile(rng, categories, now, years):
+    # Each user spends in their own Zipf-ranked subset of the categories,
+    # with a typical amount per category
+    own = rng.sample(categories, rng.randint(min(5, len(categories)), len(categories)))
+    weights = [1 / (rank ** 1.1) for rank in range(1, len(own) + 1)]
+    medians = {category: math.exp(rng.uniform(3, 8)) for category in own}
+    start = now - timedelta(days=rng.uniform(30, years * 365))
+    return own, weights, medians, start
+
+
+def transactions_for(rng, user_id, count, profile, now):
+    own, weights, medians, start = profile
+    span = (now - start).total_seconds()
+    for category in rng.choices(own, weights, k=count):
+        amount = max(1, int(rng.lognormvariate(math.log(medians[category]), 0.6)))
+        when = start + timedelta(seconds=rng.uniform(0, span))
+        yield user_id, amount, f'{category} {rng.choice(DESCRIPTIONS)}', category, when.replace(microsecond=0)
+
+
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def connect(args):
+    return MySQLdb.connect(host=args.host, user=args.user, passwd=args.password or '', db=args.db,
+                           cursorclass=MySQLdb.cursors.DictCursor, charset='utf8mb4')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--transactions', type=int, default=1000000, help='Total rows across all users.')
+    parser.add_argument('--categories', type=int, default=len(CATEGORIES))
+    parser.add_argument('--years', type=float, default=3, help='Longest history, in years.')
+    parser.add_argument('--tail', type=float, default=1.2, help='Pareto alpha; lower means a heavier tail.')
+    parser.add_argument('--budget-share', type=float, default=0.7, help='Fraction of users with budgets.')
+    parser.add_argument('--prefix', default='bench')
+    parser.add_argument('--user-password', default='bench-password')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--reset', action='store_true', help='Delete existing <prefix> users first.')
+    parser.add_argument('--host', default=config.MYSQL_HOST)
+    parser.add_argument('--user', default=config.MYSQL_USER)
+    parser.add_argument('--password', default=config.MYSQL_PASSWORD)
+    parser.add_argument('--db', default=config.MYSQL_DB)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    now = datetime.now() - timedelta(minutes=1)
+    categories = category_names(args.categories)
+    password_hash = sha256_crypt.using(rounds=config.HASH_ROUNDS).hash(args.user_password)
+
+    connection = connect(args)
+    cur = connection.cursor()
+    cur.execute("SET unique_checks = 0")
+    started = time.perf_counter()
+
+    if args.reset:
+        cur.execute("DELETE FROM users WHERE username LIKE %s", [args.prefix + '%'])
+        connection.commit()
+
+    sizes = history_sizes(rng, args.users, args.transactions, args.tail)
+    inserted = 0
+    user_ids = []
+    for rank, count in enumerate(sizes, 1):
+        username = f'{args.prefix}{rank:05d}'
+        cur.execute("INSERT INTO users(first_name, last_name, email, username, password) VALUES(%s, %s, %s, %s, %s)",
+                    ('Bench', str(rank), f'{username}@example.com', username, password_hash))
+        user_id = cur.lastrowid
+        user_ids.append(user_id)
+
+        profile = user_profile(rng, categories, now, args.years)
+        for batch in batches(transactions_for(rng, user_id, count, profile, now), args.batch_size):
+            cur.executemany("INSERT INTO transactions(user_id, amount, description, category, date) VALUES(%s, %s, %s, %s, %s)",
+                            batch)
+            connection.commit()
+            inserted += len(batch)
+
+        if rng.random() < args.budget_share:
+            own, weights, medians, start = profile
+            months = max(1, (now - start).days / 30)
+            monthly = sum(medians.values()) * count / months / len(own)
+            cur.execute("INSERT INTO user_budget (user_id, monthly_budget, monthly_savings_goal) VALUES (%s, %s, %s)",
+                        (user_id, round(monthly * rng.uniform(0.8, 1.3), 2), round(monthly * rng.uniform(0.1, 0.3), 2)))
+            cur.executemany("INSERT INTO category_budgets (user_id, category, budget_limit) VALUES (%s, %s, %s)",
+                            [(user_id, category, round(medians[category] * count / months * rng.uniform(0.05, 0.3), 2))
+                             for category in own[:3]])
+            connection.commit()
+
+    rollup_started = time.perf_counter()
+    for user_id in user_ids:
+        rollup.rebuild(cur, user_id)
+        connection.commit()
+    index_started = time.perf_counter()
+    for user_id in user_ids:
+        search.rebuild(cur, user_id)
+        connection.commit()
+    finished = time.perf_counter()
+    connection.close()
+
+    print(json.dumps({
+        'users': len(user_ids),
+        'transactions': inserted,
+        'categories': len(categories),
+        'largest_history': sizes[0],
+        'median_history': sorted(sizes)[len(sizes) // 2],
+        'first_user_id': user_ids[0] if user_ids else None,
+        'usernames': f'{args.prefix}00001..{args.prefix}{len(sizes):05d}',
+        'user_password': args.user_password,
+        'insert_seconds': round(rollup_started - started, 2),
+        'rows_per_second': round(inserted / max(rollup_started - started, 1e-9)),
+        'rollup_seconds': round(index_started - rollup_started, 2),
+        'search_index_seconds': round(finished - index_started, 2),
+        'seed': args.seed,
+    }, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""Startup budget for the web app.
+
+Imports app.py and builds the app (create_app()) in a fresh interpreter
+and reports the time taken and the resident set size afterwards as JSON.
+Exits non-zero if that pulls in any of the analytics/plotting libraries, or
+goes over the given budgets.
+
+    python bench/startup.py --max-import-ms 400 --max-rss-mb 80
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ['pandas', 'numpy', 'matplotlib', 'seaborn', 'plotly']
+
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import app
+app.create_app()
+elapsed = time.perf_counter() - start
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+heavy = sorted({name.split('.')[0] for name in sys.modules} & set(%r))
+print(json.dumps({'import_ms': elapsed * 1000, 'rss_mb': rss_kb / 1024, 'heavy_modules': heavy}))
+""" % (HEAVY_MODULES,)
+
+
+def measure(runs):
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', PROBE], cwd=APP_DIR, check=True,
+                                capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-import-ms', type=float, default=None)
+    parser.add_argument('--max-rss-mb', type=float, default=None)
+    args = parser.parse_args()
+
+    results = measure(args.runs)
+    report = {
+        'runs': args.runs,
+        'import_ms': sorted(result['import_ms'] for result in results)[len(results) // 2],
+        'rss_mb': max(result['rss_mb'] for result in results),
+        'heavy_modules': results[0]['heavy_modules'],
+    }
+    print(json.dumps(report, indent=2))
+
+    failures = []
+    if report['heavy_modules']:
+        failures.append('app.py imports ' + ', '.join(report['heavy_modules']))
+    if args.max_import_ms is not None and report['import_ms'] > args.max_import_ms:
+        failures.append(f"import took {report['import_ms']:.0f} ms (budget {args.max_import_ms:.0f} ms)")
+    if args.max_rss_mb is not None and report['rss_mb'] > args.max_rss_mb:
+        failures.append(f"RSS is {report['rss_mb']:.1f} MB (budget {args.max_rss_mb:.0f} MB)")
+
+    for failure in failures:
+        print('FAIL: ' + failure, file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+import csv
+import io
+from datetime import datetime
+
+from werkzeug.datastructures import MultiDict
+
+# Bulk CSV import/export of transactions. Both directions stream: the upload
+# is parsed a row at a time from Werkzeug's spooled file, and the export is
+# written from a server-side cursor, so memory does not grow with file size.
+# JSON write batches from offline clients are validated here too.
+COLUMNS = ['date', 'amount', 'category', 'description']
+DATE_FORMATS = ['%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d', '%d/%m/%Y']
+CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 500
+EXPORT_FLUSH_ROWS = 500
+MAX_BATCH_ITEMS = 500
+
+
+def parse_date(value):
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), date_format)
+        except ValueError:
+            continue
+    return None
+
+
+def read_rows(stream, form_class):
+    # Yields (line, values, errors) for each data row, validated with the
+    # same form class as the single-row add form.
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    missing = [column for column in COLUMNS if column not in (reader.fieldnames or [])]
+    if missing:
+        yield 1, None, {'header': ['missing columns: ' + ', '.join(missing)]}
+        return
+
+    for row in reader:
+        form = form_class(MultiDict({column: (row.get(column) or '').strip() for column in COLUMNS}))
+        errors = dict(form.errors) if not form.validate() else {}
+        when = parse_date(form.date.data or '')
+        if when is None and 'date' not in errors:
+            errors['date'] = ['expected YYYY-MM-DD or YYYY-MM-DD HH:MM:SS']
+        if errors:
+            yield reader.line_num, None, errors
+        else:
+            yield reader.line_num, (form.amount.data, form.description.data, form.category.data, when), None
+
+
+def read_batch(body, form_class):
+    # Validates a JSON batch of {"create": [...], "update": [...], "delete":
+    # [...]} with the add form. Returns (creates, updates, deletes, errors);
+    # creates are (amount, description, category, date) like read_rows, and
+    # a create without a date is dated now.
+    creates, updates, deletes, errors = [], [], [], []
+    items = [body.get(name) or [] for name in ('create', 'update', 'delete')]
+    if not all(isinstance(item, list) for item in items):
+        return creates, updates, deletes, [{'batch': ['create, update and delete must be lists']}]
+    if sum(len(item) for item in items) > MAX_BATCH_ITEMS:
+        return creates, updates, deletes, [{'batch': [f'at most {MAX_BATCH_ITEMS} items per batch']}]
+
+    now = datetime.now().replace(microsecond=0)
+    for kind, entries in (('create', items[0]), ('update', items[1])):
+        for index, entry in enumerate(entries):
+            if not isinstance(entry, dict):
+                errors.append({kind: index, 'errors': {'item': ['expected an object']}})
+                continue
+            values = {column: str(entry.get(column) or '').strip() for column in COLUMNS}
+            if kind == 'update' or not values['date']:
+                values['date'] = now.strftime('%Y-%m-%d %H:%M:%S')
+            form = form_class(MultiDict(values))
+            item_errors = dict(form.errors) if not form.validate() else {}
+            when = parse_date(form.date.data)
+            if when is None:
+                item_errors['date'] = ['expected YYYY-MM-DD or YYYY-MM-DD HH:MM:SS']
+            if kind == 'update' and not isinstance(entry.get('id'), int):
+                item_errors['id'] = ['expected the transaction id']
+            if item_errors:
+                errors.append({kind: index, 'errors': item_errors})
+            elif kind == 'create':
+                creates.append((form.amount.data, form.description.data, form.category.data, when))
+            else:
+                updates.append((entry['id'], form.amount.data, form.description.data, form.category.data))
+
+    for index, entry in enumerate(items[2]):
+        if isinstance(entry, int):
+            deletes.append(entry)
+        else:
+            errors.append({'delete': index, 'errors': {'id': ['expected the transaction id']}})
+    return creates, updates, deletes, errors
+
+
+def chunks(rows, size=CHUNK_SIZE):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def write_rows(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for count, row in enumerate(rows, 1):
+        writer.writerow([row['date'].strftime('%Y-%m-%d %H:%M:%S'), row['amount'], row['category'], row['description']])
+        if count % EXPORT_FLUSH_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
@@ -0,0 +1,118 @@
+import collections
+import pickle
+import threading
+
+import metrics
+
+# Two-tier cache for per-user payloads such as the dashboard aggregates.
+# The first tier is an in-process LRU bounded by entry count and pickled
+# size. The optional second tier is any client with Redis' get/set/delete
+# (a redis.Redis, or fakeredis.FakeRedis as a local stand-in) so workers can
+# share results. Entries carry the user's write version from versions.py; a
+# lookup with a newer version is a miss, and write routes also invalidate
+# explicitly.
+
+
+class LocalCache:
+    def __init__(self, max_entries=1024, max_bytes=16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (value, size)
+            self.size += size
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def delete(self, key):
+        with self._lock:
+            self._discard(key)
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class UserCache:
+    def __init__(self, name, local=None, shared=None, shared_ttl=3600):
+        self.name = name
+        self.local = local or LocalCache()
+        self.shared = shared
+        self.shared_ttl = shared_ttl
+        metrics.gauge(f'{name}_cache_entries', f'Entries in the local {name} cache', lambda: len(self.local))
+        metrics.gauge(f'{name}_cache_bytes', f'Pickled bytes held by the local {name} cache', lambda: self.local.size)
+
+    def key(self, user_id):
+        return f'{self.name}:{user_id}'
+
+    def get(self, user_id, version):
+        key = self.key(user_id)
+        entry = self.local.get(key)
+        if entry is not None and entry[0] >= version:
+            self._count('hits', 'local')
+            return entry[1]
+
+        if self.shared is not None:
+            blob = self._shared_call('get', key)
+            if blob is not None:
+                entry = pickle.loads(blob)
+                if entry[0] >= version:
+                    self.local.set(key, entry, len(blob))
+                    self._count('hits', 'shared')
+                    return entry[1]
+
+        self._count('misses', 'all')
+        return None
+
+    def set(self, user_id, version, payload):
+        key = self.key(user_id)
+        blob = pickle.dumps((version, payload), pickle.HIGHEST_PROTOCOL)
+        self.local.set(key, (version, payload), len(blob))
+        if self.shared is not None:
+            self._shared_call('set', key, blob, ex=self.shared_ttl)
+
+    def invalidate(self, user_id):
+        key = self.key(user_id)
+        self.local.delete(key)
+        if self.shared is not None:
+            self._shared_call('delete', key)
+
+    def _shared_call(self, method, *args, **kwargs):
+        # The shared tier is an optimisation; never fail a request over it
+        try:
+            return getattr(self.shared, method)(*args, **kwargs)
+        except Exception:
+            metrics.counter(f'{self.name}_cache_shared_errors_total',
+                            f'Failed calls to the shared {self.name} cache').inc()
+            return None
+
+    def _count(self, outcome, tier):
+        metrics.counter(f'{self.name}_cache_{outcome}_total', f'{self.name} cache {outcome}', tier=tier).inc()
+
+
+def shared_client(url):
+    if not url:
+        return None
+    # Optional dependency: only needed when a shared cache is configured
+    import redis
+    return redis.Redis.from_url(url)
@@ -0,0 +1,88 @@
+import io
+
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.figure import Figure
+import numpy as np
+
+import periods
+
+# Report charts, drawn in the report process pool (see reports.py) from the
+# plain lists reports.report_data() gathers. Only the pool's processes
+# import this module, so matplotlib never loads in a web worker; keep it
+# out of anything the views or PRELOAD_MODULES import. Figures are built
+# directly rather than through pyplot, so nothing is left in pyplot's
+# global state from one render to the next.
+PIE_SLICES = 8
+PIE_MIN_SHARE = 0.03
+
+
+def _heatmap(figure, axes, data):
+    # Rows are weekdays, columns weeks from first_day (a Monday); days after
+    # last_day stay blank
+    first = np.datetime64(data['first_day'], 'D')
+    length = int((np.datetime64(data['last_day'], 'D') - first).astype(np.int64)) + 1
+    grid = np.full(7 * ((length + 6) // 7), np.nan)
+    grid[:length] = 0.0
+    if data['days']:
+        offsets = (np.array([day for day, _ in data['days']], dtype='datetime64[D]') - first).astype(np.int64)
+        amounts = np.array([amount for _, amount in data['days']], dtype=np.float64)
+        keep = (offsets >= 0) & (offsets < length)
+        np.add.at(grid, offsets[keep], amounts[keep])
+    grid = grid.reshape(-1, 7).T
+
+    image = axes.imshow(grid, aspect='auto', cmap='YlOrRd', interpolation='nearest')
+    figure.colorbar(image, ax=axes, label='Spent')
+    axes.set_yticks(range(7), periods.WEEKDAY_LABELS)
+    mondays = first + 7 * np.arange(grid.shape[1])
+    months = mondays.astype('datetime64[M]')
+    starts = np.flatnonzero(np.concatenate(([True], months[1:] != months[:-1])))
+    axes.set_xticks(starts, [periods.MONTH_LABELS[int(str(months[i])[5:7]) - 1] for i in starts])
+    axes.set_title('Daily spending by week')
+
+
+def _categories(figure, axes, data):
+    # The largest categories, up to PIE_SLICES - 1 of them, then the rest
+    # (and anything too thin to label) as Other
+    items = sorted((item for item in data['categories'] if item[1] > 0), key=lambda item: -item[1])
+    total = sum(amount for _, amount in items)
+    shown = [item for item in items[:PIE_SLICES - 1] if item[1] >= total * PIE_MIN_SHARE]
+    if len(shown) < len(items):
+        items = shown + [('Other', total - sum(amount for _, amount in shown))]
+    axes.set_title(f"{periods.MONTH_LABELS[data['month'] - 1]} {data['year']} by category")
+    if not items:
+        axes.text(0.5, 0.5, 'No spending', ha='center', va='center')
+        axes.axis('off')
+        return
+    axes.pie([amount for _, amount in items], labels=[name for name, _ in items],
+             autopct=lambda share: f'{share:.0f}%' if share >= 5 else '',
+             startangle=90, counterclock=False)
+
+
+def _year_over_year(figure, axes, data):
+    months = np.arange(12)
+    last_year, this_year = data['monthly']
+    axes.bar(months - 0.2, last_year, 0.4, label=str(data['year'] - 1))
+    axes.bar(months + 0.2, this_year, 0.4, label=str(data['year']))
+    axes.set_xticks(months, periods.MONTH_LABELS)
+    axes.legend()
+    axes.set_title('Year over year')
+
+
+DRAW = {'heatmap': _heatmap, 'categories': _categories, 'year_over_year': _year_over_year}
+
+
+def render_chart(chart, fmt, data):
+    if chart == 'report':
+        figure = Figure(figsize=(11, 8.5), layout='constrained')
+        grid = figure.add_gridspec(2, 2)
+        _heatmap(figure, figure.add_subplot(grid[0, :]), data)
+        _categories(figure, figure.add_subplot(grid[1, 0]), data)
+        _year_over_year(figure, figure.add_subplot(grid[1, 1]), data)
+        figure.suptitle(f"Spending report, {periods.MONTH_LABELS[data['month'] - 1]} {data['year']}")
+    else:
+        figure = Figure(figsize=(8, 4.5), layout='constrained')
+        DRAW[chart](figure, figure.add_subplot(), data)
+    output = io.BytesIO()
+    figure.savefig(output, format=fmt, dpi=100)
+    return output.getvalue()
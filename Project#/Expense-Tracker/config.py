@@ -1,15 +1,79 @@
 import os
 
-DEBUG = True
+# Off unless asked for: debug mode re-reads templates from disk on every
+# render. `python app.py` still runs the debug server for local work.
+DEBUG = os.environ.get('FLASK_DEBUG') == '1'
 # TESTING = True
 MYSQL_HOST = 'localhost'
 MYSQL_USER = 'root'
 MYSQL_PASSWORD = os.getenv('MYSQL_PWD')
 MYSQL_DB = 'tracker'
 MYSQL_CURSORCLASS = 'DictCursor'
+# 'mysql', or 'sqlite' for the in-process backend in sqlite_backend.py (tests
+# and local development; SQLITE_PATH defaults to a fresh in-memory DB)
+DATABASE_BACKEND = os.environ.get('DATABASE_BACKEND', 'mysql')
+SQLITE_PATH = os.environ.get('SQLITE_PATH', ':memory:')
+# Per-worker connection pool (see db.py). Idle connections are pinged before
+# reuse once they have sat for MYSQL_POOL_PING_AFTER seconds.
+MYSQL_POOL_MIN = 1
+MYSQL_POOL_MAX = 10
+MYSQL_POOL_TIMEOUT = 5
+MYSQL_POOL_PING_AFTER = 30
+# Read replicas, e.g. MYSQL_REPLICAS=replica1,replica2:3307 (same user,
+# password and database as the primary). GET requests read from them; a
+# session that has just written reads from the primary for
+# READ_YOUR_WRITES_SECONDS, which should exceed the usual replication lag
+# (`flask db replicas` shows it).
+MYSQL_REPLICAS = [replica for replica in os.environ.get('MYSQL_REPLICAS', '').split(',') if replica]
+READ_YOUR_WRITES_SECONDS = int(os.environ.get('READ_YOUR_WRITES_SECONDS', 5))
 SECRET_KEY = 'your_secret_key'
-MAIL_SERVER = 'smtp.googlemail.com'
-MAIL_PORT = 587
-MAIL_USE_TLS = True
+# Point these at a local stand-in (python -m aiosmtpd -n -l localhost:8025,
+# MAIL_USE_TLS=0) to exercise `flask outbox` without a real SMTP server.
+MAIL_SERVER = os.environ.get('MAIL_SERVER', 'smtp.googlemail.com')
+MAIL_PORT = int(os.environ.get('MAIL_PORT', 587))
+MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', '1') == '1'
 MAIL_USERNAME = os.environ.get('EMAIL_USER')
 MAIL_PASSWORD = os.environ.get('EMAIL_PASS')
+# Seconds a worker trusts its cached per-user write version for ETags
+DATA_VERSION_TTL = 5
+# Password hashing pool (see hashing.py). HASH_ROUNDS is the sha256_crypt cost;
+# stored hashes with a different cost are rehashed on the next login.
+HASH_WORKERS = 2
+HASH_MAX_PENDING = 16
+HASH_TIMEOUT = 5
+HASH_ROUNDS = 535000
+# Per-user dashboard cache (see cache.py). Set CACHE_REDIS_URL to share it
+# between workers; the local LRU is always used in front of it.
+DASHBOARD_CACHE_ENTRIES = 1024
+DASHBOARD_CACHE_BYTES = 16 * 1024 * 1024
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+# Fractions of a budget limit that raise an alert when crossed
+BUDGET_ALERT_THRESHOLDS = (0.8, 1.0)
+# Statements slower than this are logged to expense_tracker.slow_sql
+SLOW_QUERY_SECONDS = 0.2
+# /metrics answers admins and requests carrying METRICS_TOKEN as a bearer
+# token. With METRICS_DIR set (gunicorn.conf.py sets one), each worker
+# writes its metrics there every METRICS_FLUSH_SECONDS and a scrape of any
+# worker adds them all up (see metrics.py).
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_SECONDS = 5
+# Closed years of transactions archived by `flask archive run` (see
+# archive.py). ARCHIVE_HOT_YEARS years, counting the current one, stay in
+# the table.
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archive'))
+ARCHIVE_HOT_YEARS = 2
+# Modules the views import on first use, imported up front by wsgi.py so a
+# pre-fork server's workers share one copy
+PRELOAD_MODULES = ('analytics',)
+# Report charts (see reports.py): render pool size and queue, and the disk
+# cache of rendered images, bounded to REPORT_CACHE_BYTES
+REPORT_WORKERS = 2
+REPORT_MAX_PENDING = 8
+REPORT_TIMEOUT = 30
+REPORT_CACHE_DIR = os.environ.get('REPORT_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'report_cache'))
+REPORT_CACHE_BYTES = 256 * 1024 * 1024
+# Admin analytics (see admin.py): how long one report may run and how many
+# may run at once in each worker
+ADMIN_REPORT_SECONDS = 60
+ADMIN_MAX_RUNNING = 1
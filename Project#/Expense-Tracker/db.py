@@ -0,0 +1,342 @@
+import collections
+import itertools
+import os
+import threading
+import time
+
+import MySQLdb
+import MySQLdb.connections
+import MySQLdb.cursors
+from flask import g, has_request_context, request, session
+
+import instrumentation
+import metrics
+
+# Drop-in replacement for flask_mysqldb.MySQL backed by a per-worker
+# connection pool. `mysql.connection` checks a connection out on first use in
+# an app context and returns it on teardown, so routes keep their
+# `with mysql.connection.cursor() as cur:` shape without paying a handshake
+# per request.
+#
+# With MYSQL_REPLICAS set, GET and HEAD requests check their connection out
+# of a replica's pool instead (round robin), since every GET handler only
+# reads; other requests, CLI commands and anything outside a request use
+# the primary. After a request that may have written, the session is pinned
+# to the primary for READ_YOUR_WRITES_SECONDS, so the redirect that follows
+# a write, and the pages after it, see the write even while the replicas
+# lag behind. A replica that cannot be reached is skipped for
+# REPLICA_RETRY_SECONDS and its reads go to the primary; one whose pool is
+# merely exhausted stays in rotation and only the read that timed out falls
+# back.
+READ_METHODS = frozenset(['GET', 'HEAD'])
+PIN_KEY = 'db_primary_until'
+REPLICA_RETRY_SECONDS = 10
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class Connection(MySQLdb.connections.Connection):
+    # Every cursor, including explicit SSDictCursor ones, is instrumented
+    def cursor(self, cursorclass=None):
+        return super().cursor(instrumentation.instrumented(cursorclass or self.cursorclass))
+
+
+class ConnectionPool:
+    def __init__(self, connect, min_size=1, max_size=10, timeout=5, ping_after=30):
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self._idle = collections.deque()
+        self._cond = threading.Condition()
+        self._size = 0
+        self.in_use = 0
+        self.checkout_failures = 0
+        self._wait = metrics.histogram('db_pool_wait_seconds', 'Time spent waiting to check out a connection',
+                                       buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5))
+
+    @property
+    def idle(self):
+        return len(self._idle)
+
+    def fill(self):
+        # Top the pool up to min_size
+        while True:
+            with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                connection = self._connect()
+            except MySQLdb.Error:
+                with self._cond:
+                    self._size -= 1
+                raise
+            with self._cond:
+                self._idle.append((connection, time.monotonic()))
+                self._cond.notify()
+
+    def checkout(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    connection, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    connection, last_used = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.checkout_failures += 1
+                    raise PoolTimeout(f'no database connection free after {self.timeout}s')
+                self._cond.wait(remaining)
+
+        try:
+            if connection is None:
+                connection = self._connect()
+            elif time.monotonic() - last_used > self.ping_after:
+                connection = self._ping(connection)
+        except MySQLdb.Error:
+            with self._cond:
+                self._size -= 1
+                self.checkout_failures += 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self.in_use += 1
+        self._wait.observe(time.monotonic() - start)
+        return connection
+
+    def checkin(self, connection):
+        discard = False
+        try:
+            # End any open transaction so the next request gets a fresh snapshot
+            connection.rollback()
+        except MySQLdb.Error:
+            discard = True
+
+        with self._cond:
+            self.in_use -= 1
+            if discard:
+                self._size -= 1
+            else:
+                self._idle.append((connection, time.monotonic()))
+            self._cond.notify()
+
+        if discard:
+            _close_quietly(connection)
+
+    def discard(self, connection):
+        # Close a checked-out connection instead of returning it
+        with self._cond:
+            self.in_use -= 1
+            self._size -= 1
+            self._cond.notify()
+        _close_quietly(connection)
+
+    def _ping(self, connection):
+        try:
+            connection.ping()
+            return connection
+        except MySQLdb.Error:
+            _close_quietly(connection)
+            return self._connect()
+
+    def stats(self):
+        with self._cond:
+            return {'size': self._size, 'in_use': self.in_use, 'idle': len(self._idle),
+                    'checkout_failures': self.checkout_failures}
+
+
+def _close_quietly(connection):
+    try:
+        connection.close()
+    except MySQLdb.Error:
+        pass
+
+
+class PooledMySQL:
+    def __init__(self, app=None):
+        self._pool = None
+        self._replicas = []
+        self._inherited = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._turn = itertools.count()
+        self._down_until = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.teardown_appcontext(self.teardown)
+        app.after_request(self.pin_writes)
+        metrics.gauge('db_pool_in_use', 'Connections checked out', lambda: self.pool.in_use if self._pool else 0)
+        metrics.gauge('db_pool_idle', 'Connections idle in the pool', lambda: self.pool.idle if self._pool else 0)
+        metrics.gauge('db_pool_checkout_failures_total', 'Checkouts that timed out or failed to connect',
+                      lambda: self.pool.checkout_failures if self._pool else 0, kind='counter')
+
+    def connect(self, host=None, port=None):
+        # The primary unless given a replica's address; replicas share the
+        # primary's credentials and database name
+        config = self.app.config
+        kwargs = {
+            'host': host or config.get('MYSQL_HOST', 'localhost'),
+            'user': config.get('MYSQL_USER'),
+            'passwd': config.get('MYSQL_PASSWORD') or '',
+            'db': config.get('MYSQL_DB'),
+            'port': port or config.get('MYSQL_PORT', 3306),
+            'charset': config.get('MYSQL_CHARSET', 'utf8mb4'),
+        }
+        if config.get('MYSQL_CURSORCLASS'):
+            kwargs['cursorclass'] = getattr(MySQLdb.cursors, config['MYSQL_CURSORCLASS'])
+        return Connection(**kwargs)
+
+    def replica_addresses(self):
+        # MYSQL_REPLICAS entries are 'host' or 'host:port'
+        default_port = self.app.config.get('MYSQL_PORT', 3306)
+        addresses = []
+        for replica in self.app.config.get('MYSQL_REPLICAS', ()):
+            host, _, port = replica.partition(':')
+            addresses.append((host, int(port) if port else default_port))
+        return addresses
+
+    def _new_pool(self, host=None, port=None):
+        config = self.app.config
+        return ConnectionPool(lambda: self.connect(host, port),
+                              config.get('MYSQL_POOL_MIN', 1),
+                              config.get('MYSQL_POOL_MAX', 10),
+                              config.get('MYSQL_POOL_TIMEOUT', 5),
+                              config.get('MYSQL_POOL_PING_AFTER', 30))
+
+    def _pools(self):
+        # Built lazily, and rebuilt after a fork, so connections are never
+        # shared between processes
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                # Keep the parent's pools referenced: letting their
+                # connections be collected here would send COM_QUIT on
+                # sockets the parent still uses.
+                self._inherited = (self._pool, self._replicas)
+                self._pool = self._new_pool()
+                self._replicas = [self._new_pool(host, port) for host, port in self.replica_addresses()]
+                self._down_until = {}
+                self._pid = os.getpid()
+            return self._pool, self._replicas
+
+    @property
+    def pool(self):
+        return self._pools()[0]
+
+    @property
+    def replicas(self):
+        return self._pools()[1]
+
+    def reads_from_replica(self):
+        return (has_request_context() and request.method in READ_METHODS
+                and session.get(PIN_KEY, 0) <= time.time())
+
+    def _replica(self):
+        # The next replica in turn that has not failed recently
+        replicas = self.replicas
+        now = time.monotonic()
+        for _ in range(len(replicas)):
+            index = next(self._turn) % len(replicas)
+            if self._down_until.get(index, 0) <= now:
+                return index, replicas[index]
+        return None, None
+
+    def _checkout(self):
+        if self.replicas and self.reads_from_replica():
+            index, replica = self._replica()
+            if replica is not None:
+                try:
+                    replica.fill()
+                    connection = replica.checkout()
+                    metrics.counter('db_checkouts_total', 'Connections checked out by target',
+                                    target='replica').inc()
+                    return replica, connection
+                except MySQLdb.Error:
+                    self._down_until[index] = time.monotonic() + REPLICA_RETRY_SECONDS
+                    self.app.logger.warning('replica %s:%s unavailable, reading from the primary',
+                                            *self.replica_addresses()[index], exc_info=True)
+                    metrics.counter('db_replica_fallbacks_total', 'Replica reads sent to the primary instead',
+                                    reason='down').inc()
+                except PoolTimeout:
+                    # Reachable but every connection is in use: only this
+                    # read goes to the primary
+                    metrics.counter('db_replica_fallbacks_total', 'Replica reads sent to the primary instead',
+                                    reason='busy').inc()
+        pool = self.pool
+        pool.fill()
+        connection = pool.checkout()
+        metrics.counter('db_checkouts_total', 'Connections checked out by target', target='primary').inc()
+        return pool, connection
+
+    @property
+    def connection(self):
+        if 'db_connection' not in g:
+            g.db_pool, g.db_connection = self._checkout()
+        return g.db_connection
+
+    def pin_writes(self, response):
+        if self.app.config.get('MYSQL_REPLICAS') and request.method not in READ_METHODS:
+            session[PIN_KEY] = time.time() + self.app.config.get('READ_YOUR_WRITES_SECONDS', 5)
+        return response
+
+    def replica_status(self):
+        # For `flask db replicas`: each replica's server, whether it is
+        # read-only and how far its replication threads are behind
+        statuses = []
+        for host, port in self.replica_addresses():
+            status = {'address': f'{host}:{port}'}
+            try:
+                connection = self.connect(host, port)
+            except MySQLdb.Error as error:
+                status['error'] = str(error)
+                statuses.append(status)
+                continue
+            try:
+                cur = connection.cursor(MySQLdb.cursors.DictCursor)
+                cur.execute("SELECT @@server_id AS server_id, @@read_only AS read_only")
+                status.update(cur.fetchone())
+                try:
+                    cur.execute("SHOW REPLICA STATUS")
+                except MySQLdb.Error:
+                    # MySQL before 8.0.22, MariaDB before 10.5
+                    cur.execute("SHOW SLAVE STATUS")
+                row = cur.fetchone()
+                if row is None:
+                    status['error'] = 'not configured as a replica'
+                else:
+                    status['io_running'] = row.get('Replica_IO_Running', row.get('Slave_IO_Running'))
+                    status['sql_running'] = row.get('Replica_SQL_Running', row.get('Slave_SQL_Running'))
+                    status['seconds_behind'] = row.get('Seconds_Behind_Source', row.get('Seconds_Behind_Master'))
+            except MySQLdb.Error as error:
+                status['error'] = str(error)
+            finally:
+                _close_quietly(connection)
+            statuses.append(status)
+        return statuses
+
+    def discard(self):
+        # Drop this request's connection rather than returning it to the
+        # pool, e.g. to abandon an unbuffered result part way: closing the
+        # socket stops the query on the server instead of reading the rest
+        pool = g.pop('db_pool', None)
+        connection = g.pop('db_connection', None)
+        if connection is not None:
+            pool.discard(connection)
+
+    def teardown(self, exception):
+        pool = g.pop('db_pool', None)
+        connection = g.pop('db_connection', None)
+        if connection is not None:
+            pool.checkin(connection)
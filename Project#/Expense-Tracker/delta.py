@@ -0,0 +1,28 @@
+# Delta sync for the dashboard series. A client holds a sync token made of
+# the user's write version and the day (the daily window moves at midnight).
+# Each served snapshot is remembered per (user, token) in a bounded LRU; when
+# a client asks `since` a token we still hold, it gets only the points that
+# changed, otherwise the full series.
+
+
+def token(version, day):
+    return f'{version}.{day}'
+
+
+def series(payload):
+    return {
+        'daily': {row['date']: row['amount'] for row in payload['daily_spending']},
+        'categories': {row['category']: row['amount'] for row in payload['category_spending']},
+        'summary': dict(payload['financial_summary']),
+    }
+
+
+def diff(old, new):
+    changes = {}
+    for name, points in new.items():
+        before = old.get(name, {})
+        upsert = {key: value for key, value in points.items() if before.get(key) != value}
+        remove = [key for key in before if key not in points]
+        if upsert or remove:
+            changes[name] = {'upsert': upsert, 'remove': remove}
+    return changes
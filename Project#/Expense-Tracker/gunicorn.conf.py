@@ -0,0 +1,32 @@
+import multiprocessing
+import os
+import tempfile
+
+# gunicorn -c gunicorn.conf.py wsgi:application
+#
+# preload_app loads the app once in the master (see wsgi.py); each worker
+# then warms up its own connections and template state before it is handed
+# any requests.
+#
+# Workers add their metrics to METRICS_DIR (see metrics.py) so /metrics
+# covers all of them; it is emptied when the server starts and a dead
+# worker's counts are folded into one file.
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), f'expense-tracker-metrics-{os.getuid()}'))
+bind = os.environ.get('BIND', '0.0.0.0:5002')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+preload_app = True
+
+
+def on_starting(server):
+    import metrics
+    metrics.clear(os.environ['METRICS_DIR'])
+
+
+def post_fork(server, worker):
+    import wsgi
+    wsgi.warm_up(wsgi.application)
+
+
+def child_exit(server, worker):
+    import metrics
+    metrics.process_exited(os.environ['METRICS_DIR'], worker.pid)
@@ -0,0 +1,53 @@
+from passlib.hash import sha256_crypt
+
+import pools
+
+# Password hashing is tens of milliseconds of CPU per call, so it runs in a
+# small process pool (pools.py) instead of on the request thread. Past
+# max_pending queued or running calls, after `timeout` seconds, or when a
+# pool process died, callers get HashingBusy rather than piling up behind a
+# burst of logins.
+
+
+class HashingBusy(Exception):
+    pass
+
+
+def _hasher(rounds):
+    if rounds:
+        return sha256_crypt.using(rounds=rounds)
+    return sha256_crypt
+
+
+def _hash(password, rounds):
+    return _hasher(rounds).hash(password)
+
+
+def _verify(password, hashed):
+    return sha256_crypt.verify(password, hashed)
+
+
+class HashingService:
+    def __init__(self, workers=2, max_pending=16, timeout=5, rounds=None):
+        self.rounds = rounds
+        self.pool = pools.BoundedPool('hashing', 'operation', 'Hashing calls', HashingBusy,
+                                      workers, max_pending, timeout)
+
+    def configure(self, config):
+        self.rounds = config.get('HASH_ROUNDS', self.rounds)
+        self.pool.configure(config.get('HASH_WORKERS'), config.get('HASH_MAX_PENDING'), config.get('HASH_TIMEOUT'))
+
+    def hash(self, password):
+        return self.pool.run('hash', _hash, str(password), self.rounds)
+
+    def verify(self, password, hashed):
+        return self.pool.run('verify', _verify, str(password), hashed)
+
+    def needs_update(self, hashed):
+        # Cheap: only parses the stored hash, so it runs in-process
+        if not self.rounds:
+            return False
+        return sha256_crypt.using(min_desired_rounds=self.rounds, max_desired_rounds=self.rounds).needs_update(hashed)
+
+
+service = HashingService()
@@ -0,0 +1,57 @@
+from datetime import datetime
+
+import periods
+
+# Transaction history is read in keyset pages ordered by (date, id) DESC.
+# The cursor is the (date, id) of the last row already shown, so each page
+# is a bounded range scan on idx_user_date (user_id, date, id) no matter how
+# deep into the history the user has scrolled.
+PAGE_SIZE = 100
+CURSOR_FORMAT = '%Y%m%d%H%M%S'
+
+
+def encode_cursor(row):
+    return f"{row['date'].strftime(CURSOR_FORMAT)}-{row['id']}"
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        when, row_id = cursor.split('-')
+        return datetime.strptime(when, CURSOR_FORMAT), int(row_id)
+    except ValueError:
+        return None
+
+
+def page_query(user_id, category=None, period=None, cursor=None, limit=PAGE_SIZE):
+    where = ["user_id = %s"]
+    args = [user_id]
+
+    if category:
+        where.append("category = %s")
+        args.append(category)
+
+    if period:
+        where.append(periods.condition())
+        args += periods.params(period)
+
+    after = decode_cursor(cursor)
+    if after:
+        where.append("(date < %s OR (date = %s AND id < %s))")
+        args += [after[0], after[0], after[1]]
+
+    query = ("SELECT id, amount, description, category, date FROM transactions WHERE "
+             + " AND ".join(where) + " ORDER BY date DESC, id DESC LIMIT %s")
+    return query, args + [limit]
+
+
+def format_row(row):
+    return {
+        'id': row['id'],
+        'amount': row['amount'],
+        'category': row['category'],
+        'description': row['description'],
+        'date': row['date'].strftime('%d %B, %Y'),
+        'cursor': encode_cursor(row),
+    }
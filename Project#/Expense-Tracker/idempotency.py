@@ -0,0 +1,41 @@
+import json
+from datetime import datetime, timedelta
+
+# Client-supplied idempotency keys for the batch write API. The key row is
+# inserted (INSERT IGNORE) in the same DB transaction as the writes and
+# updated with the response before commit. A retry with the same key either
+# blocks on that row until the first attempt commits and then gets its stored
+# response, or, if the first attempt rolled back, claims the key itself. A
+# key whose row has no response yet is still being applied elsewhere (e.g.
+# the row was visible before the other transaction stored its response), and
+# the retry is told to come back rather than being treated as new.
+MAX_KEY_LENGTH = 64
+
+CLAIMED = 'claimed'
+IN_PROGRESS = 'in_progress'
+REPLAY = 'replay'
+
+
+def claim(cur, user_id, key):
+    # Returns (state, response): (CLAIMED, None) if the key is new and now
+    # held by this transaction, (IN_PROGRESS, None) if another request holds
+    # it without a response yet, or (REPLAY, response) with the response
+    # stored by the request that already used it
+    cur.execute("INSERT IGNORE INTO idempotency_keys (user_id, idempotency_key) VALUES (%s, %s)", (user_id, key))
+    if cur.rowcount == 1:
+        return CLAIMED, None
+    cur.execute("SELECT response FROM idempotency_keys WHERE user_id = %s AND idempotency_key = %s", (user_id, key))
+    row = cur.fetchone()
+    if row and row['response']:
+        return REPLAY, json.loads(row['response'])
+    return IN_PROGRESS, None
+
+
+def store(cur, user_id, key, response):
+    cur.execute("UPDATE idempotency_keys SET response = %s WHERE user_id = %s AND idempotency_key = %s",
+                (json.dumps(response), user_id, key))
+
+
+def purge(cur, hours):
+    cur.execute("DELETE FROM idempotency_keys WHERE created_at < %s", [datetime.now() - timedelta(hours=hours)])
+    return cur.rowcount
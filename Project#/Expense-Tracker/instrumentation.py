@@ -0,0 +1,110 @@
+import logging
+import re
+import time
+
+from flask import g, has_app_context, has_request_context, request
+
+import metrics
+
+# Per-request SQL accounting. Every cursor handed out by db.py is wrapped so
+# execute()/executemany() record statement count, DB time and rows in
+# flask.g; statements slower than SLOW_QUERY_SECONDS are logged with their
+# normalized text and the route that ran them. The per-request totals feed
+# the route histograms on /metrics and a Server-Timing header. The cost is a
+# couple of perf_counter() calls per statement.
+slow_log = logging.getLogger('expense_tracker.slow_sql')
+
+SLOW_QUERY_SECONDS = 0.2
+
+ROUTE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+_whitespace = re.compile(r'\s+')
+_literal = re.compile(r"'(?:[^'\\]|\\.)*'|\b\d+\b")
+
+
+def normalize(query):
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    return _literal.sub('?', _whitespace.sub(' ', query).strip())
+
+
+def _verb(query):
+    if isinstance(query, bytes):
+        query = query[:16].decode('ascii', 'replace')
+    words = query[:32].split(None, 1)
+    return words[0].upper() if words else 'OTHER'
+
+
+class InstrumentedCursor:
+    def execute(self, query, args=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, args)
+        finally:
+            _record(query, time.perf_counter() - start, self.rowcount)
+
+    def executemany(self, query, args):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, args)
+        finally:
+            _record(query, time.perf_counter() - start, self.rowcount)
+
+
+_classes = {}
+
+
+def instrumented(cursorclass):
+    if issubclass(cursorclass, InstrumentedCursor):
+        return cursorclass
+    if cursorclass not in _classes:
+        _classes[cursorclass] = type('Instrumented' + cursorclass.__name__, (InstrumentedCursor, cursorclass), {})
+    return _classes[cursorclass]
+
+
+def _record(query, elapsed, rowcount):
+    verb = _verb(query)
+    metrics.histogram('sql_statement_seconds', 'Latency of individual SQL statements', verb=verb).observe(elapsed)
+
+    if has_app_context():
+        stats = g.setdefault('sql_stats', {'queries': 0, 'db_seconds': 0.0, 'rows': 0})
+        stats['queries'] += 1
+        stats['db_seconds'] += elapsed
+        if rowcount and rowcount > 0:
+            stats['rows'] += rowcount
+
+    if elapsed >= SLOW_QUERY_SECONDS:
+        route = request.endpoint if has_request_context() else None
+        slow_log.warning('slow query %.3fs route=%s rows=%s sql=%s', elapsed, route, rowcount, normalize(query))
+
+
+def init_app(app):
+    global SLOW_QUERY_SECONDS
+    SLOW_QUERY_SECONDS = app.config.get('SLOW_QUERY_SECONDS', SLOW_QUERY_SECONDS)
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def server_timing(response):
+        stats = g.get('sql_stats')
+        if stats:
+            response.headers['Server-Timing'] = f"db;dur={stats['db_seconds'] * 1000:.1f};desc=\"{stats['queries']} queries\""
+        return response
+
+    # Observed at teardown so streamed responses are timed to the last byte
+    @app.teardown_request
+    def observe_request(exception):
+        started = g.pop('request_started', None)
+        if started is None:
+            return
+        route = request.endpoint or 'unmatched'
+        stats = g.pop('sql_stats', None) or {'queries': 0, 'db_seconds': 0.0, 'rows': 0}
+        metrics.histogram('http_request_seconds', 'Request latency by route', ROUTE_BUCKETS,
+                          route=route).observe(time.perf_counter() - started)
+        metrics.histogram('http_request_db_seconds', 'DB time per request by route', ROUTE_BUCKETS,
+                          route=route).observe(stats['db_seconds'])
+        metrics.histogram('http_request_queries', 'SQL statements per request by route', QUERY_COUNT_BUCKETS,
+                          route=route).observe(stats['queries'])
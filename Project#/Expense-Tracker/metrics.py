@@ -0,0 +1,260 @@
+import atexit
+import bisect
+import fcntl
+import json
+import os
+import threading
+import time
+
+# Minimal in-process metrics in Prometheus text format. Counters and
+# histograms are registered by name and labels and rendered by /metrics.
+#
+# Each process has its own registry, so under a pre-forking server a scrape
+# would only see the worker that answered it. After share(directory) a
+# process writes its registry to <directory>/<pid>.json every `interval`
+# seconds, at exit and whenever it renders, and render() adds up every
+# process's file: counters and histograms summed, gauges summed over live
+# processes only. Other processes' values are up to `interval` seconds old.
+# process_exited() (gunicorn's child_exit) folds a dead worker's counts into
+# exited.json, so they survive it and the directory does not grow with
+# worker restarts; clear() empties the directory before the server starts.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+EXITED = 'exited'
+
+_registry = {}
+_lock = threading.Lock()
+_directory = None
+
+
+def _label_text(labels, extra=''):
+    text = ','.join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+    if extra:
+        text = text + ',' + extra if text else extra
+    return '{' + text + '}' if text else ''
+
+
+def _le(bound):
+    return f'le="{bound}"'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=None):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels or {}
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self):
+        return {'value': self.value}
+
+
+class Gauge:
+    # Reads its value from a callback at render time
+    def __init__(self, name, help_text, labels=None, callback=None, kind='gauge'):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels or {}
+        self.callback = callback
+        self.kind = kind
+
+    def snapshot(self):
+        return {'value': self.callback()}
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=None, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels or {}
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {'buckets': list(self.buckets), 'counts': list(self.counts), 'sum': self.sum, 'count': self.count}
+
+
+def _get(cls, name, help_text, labels, *args):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        if key not in _registry:
+            _registry[key] = cls(name, help_text, labels, *args)
+        return _registry[key]
+
+
+def counter(name, help_text, **labels):
+    return _get(Counter, name, help_text, labels)
+
+
+def gauge(name, help_text, callback, kind='gauge', **labels):
+    return _get(Gauge, name, help_text, labels, callback, kind)
+
+
+def histogram(name, help_text, buckets=DEFAULT_BUCKETS, **labels):
+    return _get(Histogram, name, help_text, labels, buckets)
+
+
+def _snapshot():
+    with _lock:
+        entries = list(_registry.values())
+    return [dict(metric.snapshot(), name=metric.name, help=metric.help_text, kind=metric.kind,
+                 labels=sorted(metric.labels.items())) for metric in entries]
+
+
+def _lines(entry):
+    name, labels = entry['name'], dict(entry['labels'])
+    if entry['kind'] != 'histogram':
+        return [f'{name}{_label_text(labels)} {entry["value"]}']
+    lines = []
+    cumulative = 0
+    for bound, count in zip(entry['buckets'], entry['counts']):
+        cumulative += count
+        lines.append(f'{name}_bucket{_label_text(labels, _le(bound))} {cumulative}')
+    lines.append(f'{name}_bucket{_label_text(labels, _le("+Inf"))} {entry["count"]}')
+    lines.append(f'{name}_sum{_label_text(labels)} {entry["sum"]}')
+    lines.append(f'{name}_count{_label_text(labels)} {entry["count"]}')
+    return lines
+
+
+def _add(merged, entries, live=True):
+    # Gauges only count while their process is alive
+    for entry in entries:
+        if entry['kind'] == 'gauge' and not live:
+            continue
+        key = (entry['name'], tuple(map(tuple, entry['labels'])))
+        total = merged.get(key)
+        if total is None:
+            merged[key] = dict(entry)
+        elif entry['kind'] != 'histogram':
+            total['value'] += entry['value']
+        elif total['buckets'] == entry['buckets']:
+            total['counts'] = [a + b for a, b in zip(total['counts'], entry['counts'])]
+            total['sum'] += entry['sum']
+            total['count'] += entry['count']
+
+
+def _path(directory, name):
+    return os.path.join(directory, f'{name}.json')
+
+
+def _read(path):
+    try:
+        with open(path) as source:
+            return json.load(source)
+    except (OSError, ValueError):
+        return []
+
+
+def _write_json(path, entries):
+    temporary = f'{path}.{threading.get_ident()}.tmp'
+    with open(temporary, 'w') as target:
+        json.dump(entries, target)
+    os.replace(temporary, path)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _locked(directory, mode):
+    # Readers take it shared and process_exited() exclusive, so a scrape
+    # never sees a worker's counts both in its own file and in exited.json
+    lock = open(os.path.join(directory, '.lock'), 'a')
+    fcntl.flock(lock, mode)
+    return lock
+
+
+def write():
+    # This process's registry to the shared directory, if there is one
+    if _directory is not None:
+        _write_json(_path(_directory, os.getpid()), _snapshot())
+
+
+def _writer(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            write()
+        except OSError:
+            pass
+
+
+def share(directory, interval=5):
+    # Call in each worker after fork, never in a master that forks later:
+    # the writer is a thread
+    global _directory
+    os.makedirs(directory, exist_ok=True)
+    _directory = directory
+    atexit.register(write)
+    threading.Thread(target=_writer, args=(interval,), name='metrics-writer', daemon=True).start()
+
+
+def clear(directory):
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.endswith('.json'):
+            os.remove(os.path.join(directory, name))
+
+
+def process_exited(directory, pid):
+    path = _path(directory, pid)
+    if not os.path.exists(path):
+        return
+    with _locked(directory, fcntl.LOCK_EX):
+        merged = {}
+        _add(merged, _read(_path(directory, EXITED)))
+        _add(merged, _read(path), live=False)
+        _write_json(_path(directory, EXITED), list(merged.values()))
+        os.remove(path)
+
+
+def render():
+    if _directory is None:
+        entries = _snapshot()
+    else:
+        write()
+        merged = {}
+        with _locked(_directory, fcntl.LOCK_SH):
+            for name in os.listdir(_directory):
+                stem, extension = os.path.splitext(name)
+                if extension != '.json' or not (stem == EXITED or stem.isdigit()):
+                    continue
+                live = stem != EXITED and _alive(int(stem))
+                _add(merged, _read(os.path.join(_directory, name)), live)
+        entries = list(merged.values())
+
+    lines = []
+    seen = set()
+    for entry in sorted(entries, key=lambda entry: entry['name']):
+        if entry['name'] not in seen:
+            seen.add(entry['name'])
+            lines.append(f'# HELP {entry["name"]} {entry["help"]}')
+            lines.append(f'# TYPE {entry["name"]} {entry["kind"]}')
+        lines.extend(_lines(entry))
+    return '\n'.join(lines) + '\n'
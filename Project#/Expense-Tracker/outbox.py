@@ -0,0 +1,110 @@
+import smtplib
+import time
+
+from flask_mail import Message
+
+import metrics
+
+# Outgoing mail is written to email_outbox inside the request and sent later
+# by `flask outbox run`, so a slow or unreachable SMTP server never holds up a
+# worker. Each batch is claimed with SKIP LOCKED (several senders can run side
+# by side), sent over one SMTP connection, and failures are retried with
+# exponential backoff until MAX_ATTEMPTS.
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 8
+BASE_BACKOFF = 30
+MAX_BACKOFF = 3600
+
+
+def enqueue(cur, recipient, subject, body, sender):
+    cur.execute("""
+        INSERT INTO email_outbox (recipient, sender, subject, body)
+        VALUES (%s, %s, %s, %s)
+    """, (recipient, sender, subject, body))
+
+
+def backoff(attempts):
+    return min(BASE_BACKOFF * 2 ** (attempts - 1), MAX_BACKOFF)
+
+
+def drain(connection, mail, batch_size=BATCH_SIZE):
+    cur = connection.cursor()
+    cur.execute("""
+        SELECT id, recipient, sender, subject, body, attempts,
+               TIMESTAMPDIFF(MICROSECOND, created_at, NOW(6)) / 1000000 AS age
+        FROM email_outbox
+        WHERE sent_at IS NULL AND attempts < %s AND next_attempt_at <= NOW()
+        ORDER BY id
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    """, (MAX_ATTEMPTS, batch_size))
+    batch = cur.fetchall()
+    if not batch:
+        connection.commit()
+        cur.close()
+        return 0
+
+    claimed_at = time.perf_counter()
+    remaining = list(batch)
+    sent = 0
+    try:
+        with mail.connect() as smtp:
+            while remaining:
+                email = remaining[0]
+                try:
+                    smtp.send(Message(email['subject'], sender=email['sender'],
+                                      recipients=[email['recipient']], body=email['body']))
+                except smtplib.SMTPServerDisconnected:
+                    raise
+                except smtplib.SMTPException as e:
+                    # Rejected by the server; the connection is still usable
+                    remaining.pop(0)
+                    _failed(cur, email, e)
+                    continue
+                remaining.pop(0)
+                cur.execute("UPDATE email_outbox SET sent_at = NOW(6), attempts = attempts + 1 WHERE id = %s", [email['id']])
+                metrics.histogram('email_delivery_seconds', 'Time from enqueue to SMTP acceptance',
+                                  buckets=(1, 5, 15, 30, 60, 300, 900, 3600)).observe(
+                    float(email['age']) + time.perf_counter() - claimed_at)
+                sent += 1
+    except (smtplib.SMTPException, OSError) as e:
+        # Connecting failed or the connection dropped mid-batch
+        for email in remaining:
+            _failed(cur, email, e)
+
+    connection.commit()
+    cur.close()
+    metrics.counter('email_sent_total', 'Emails accepted by the SMTP server').inc(sent)
+    return sent
+
+
+def _failed(cur, email, error):
+    attempts = email['attempts'] + 1
+    cur.execute("""
+        UPDATE email_outbox
+        SET attempts = %s, last_error = %s, next_attempt_at = NOW() + INTERVAL %s SECOND
+        WHERE id = %s
+    """, (attempts, str(error)[:255], backoff(attempts), email['id']))
+    metrics.counter('email_failed_total', 'Email send attempts that failed').inc()
+
+
+def delivery_stats(cur, hours=24):
+    cur.execute("""
+        SELECT TIMESTAMPDIFF(MICROSECOND, created_at, sent_at) / 1000000 AS latency
+        FROM email_outbox
+        WHERE sent_at >= NOW() - INTERVAL %s HOUR
+        ORDER BY latency
+    """, [hours])
+    latencies = [float(row['latency']) for row in cur.fetchall()]
+    cur.execute("""
+        SELECT SUM(sent_at IS NULL AND attempts < %s) AS pending,
+               SUM(sent_at IS NULL AND attempts >= %s) AS dead
+        FROM email_outbox
+    """, (MAX_ATTEMPTS, MAX_ATTEMPTS))
+    counts = cur.fetchone()
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else None
+
+    return {'sent': len(latencies), 'pending': int(counts['pending'] or 0), 'dead': int(counts['dead'] or 0),
+            'p50': percentile(0.5), 'p95': percentile(0.95), 'max': latencies[-1] if latencies else None}
@@ -0,0 +1,77 @@
+from datetime import datetime
+
+# Range partitioning of transactions by calendar year, on
+# UNIX_TIMESTAMP(date) (the only expression MySQL accepts for partitioning a
+# TIMESTAMP column). Period-filtered reads prune to the partitions they
+# touch, and a year that has been archived (see archive.py) is removed with
+# DROP PARTITION instead of a row-by-row DELETE.
+#
+# MySQL requires the partitioning column in every unique key and does not
+# allow foreign keys on partitioned tables, so converting the table makes
+# date NOT NULL, widens the primary key to (id, date) and drops the
+# user_id foreign keys. Nothing deletes users, so losing ON DELETE CASCADE
+# changes nothing today; a user delete would have to remove the rows itself.
+# The statements are built here and run (or printed) by `flask partitions`.
+FUTURE = 'pfuture'
+
+
+def name(year):
+    return f'p{year}'
+
+
+def _bound(year):
+    return f"UNIX_TIMESTAMP('{year + 1}-01-01 00:00:00')"
+
+
+def _definition(year):
+    return f"PARTITION {name(year)} VALUES LESS THAN ({_bound(year)})"
+
+
+def foreign_keys(cur):
+    cur.execute("""
+        SELECT CONSTRAINT_NAME AS name FROM information_schema.TABLE_CONSTRAINTS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'transactions' AND CONSTRAINT_TYPE = 'FOREIGN KEY'
+    """)
+    return [row['name'] for row in cur.fetchall()]
+
+
+def partitioned_years(cur):
+    # Years with their own partition, oldest first; empty if the table is
+    # not partitioned
+    cur.execute("""
+        SELECT PARTITION_NAME AS name FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'transactions' AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """)
+    return [int(row['name'][1:]) for row in cur.fetchall() if row['name'] != FUTURE]
+
+
+def first_year(cur):
+    cur.execute("SELECT YEAR(MIN(date)) AS year FROM transactions")
+    return cur.fetchone()['year'] or datetime.now().year
+
+
+def create_statements(cur, first, last):
+    # One partition per year from first to last, plus FUTURE for anything
+    # later, so inserts never fail for want of a partition
+    statements = ["UPDATE transactions SET date = CURRENT_TIMESTAMP WHERE date IS NULL"]
+    drops = [f"DROP FOREIGN KEY `{key}`" for key in foreign_keys(cur)]
+    if drops:
+        statements.append("ALTER TABLE transactions " + ", ".join(drops))
+    statements.append("ALTER TABLE transactions MODIFY `date` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP, "
+                      "DROP PRIMARY KEY, ADD PRIMARY KEY (id, `date`)")
+    definitions = [_definition(year) for year in range(first, last + 1)]
+    statements.append("ALTER TABLE transactions PARTITION BY RANGE (UNIX_TIMESTAMP(`date`)) (\n    "
+                      + ",\n    ".join(definitions + [f"PARTITION {FUTURE} VALUES LESS THAN (MAXVALUE)"]) + "\n)")
+    return statements
+
+
+def extend_statement(year):
+    # Split FUTURE so `year` gets its own partition; cheap while FUTURE is
+    # empty, which it is as long as this runs before the year starts
+    return (f"ALTER TABLE transactions REORGANIZE PARTITION {FUTURE} INTO (\n    {_definition(year)},\n"
+            f"    PARTITION {FUTURE} VALUES LESS THAN (MAXVALUE)\n)")
+
+
+def drop_statement(year):
+    return f"ALTER TABLE transactions DROP PARTITION {name(year)}"
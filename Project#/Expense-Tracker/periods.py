@@ -0,0 +1,64 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+# A reporting period is a half-open range: start <= date < end.
+# Filtering on the raw column (instead of MONTH(date)/YEAR(date)) lets MySQL
+# range-scan the idx_user_date (user_id, date) index.
+Period = namedtuple('Period', ['start', 'end'])
+
+MONTH_LABELS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+WEEKDAY_LABELS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+
+def month(year_value, month_value):
+    y, m = int(year_value), int(month_value)
+    start = datetime(y, m, 1)
+    if m == 12:
+        end = datetime(y + 1, 1, 1)
+    else:
+        end = datetime(y, m + 1, 1)
+    return Period(start, end)
+
+
+def year(year_value):
+    y = int(year_value)
+    return Period(datetime(y, 1, 1), datetime(y + 1, 1, 1))
+
+
+def years(first_year, last_year):
+    return Period(datetime(int(first_year), 1, 1), datetime(int(last_year) + 1, 1, 1))
+
+
+def current_month(now=None):
+    now = now or datetime.now()
+    return month(now.year, now.month)
+
+
+def current_year(now=None):
+    now = now or datetime.now()
+    return year(now.year)
+
+
+def previous_year(now=None):
+    now = now or datetime.now()
+    return year(now.year - 1)
+
+
+def last_days(days, now=None):
+    now = now or datetime.now()
+    return Period(now - timedelta(days=days), now + timedelta(seconds=1))
+
+
+def from_form(month_value, year_value):
+    # The history filter posts month "00" to mean the whole year
+    if str(month_value) in ('0', '00'):
+        return year(year_value)
+    return month(year_value, month_value)
+
+
+def condition(column='date'):
+    return f"{column} >= %s AND {column} < %s"
+
+
+def params(period):
+    return [period.start, period.end]
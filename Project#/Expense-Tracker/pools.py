@@ -0,0 +1,99 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+
+# A spawn-started process pool for CPU-bound calls that must not hold a
+# request thread (password hashing, report rendering). At most max_pending
+# calls may be queued or running; past that callers get the pool's `busy`
+# exception straight away rather than piling up behind a burst. A call holds
+# its slot until the pool is done with it, even after its caller has given
+# up waiting (`busy` after `timeout` seconds), so the bound covers the work
+# actually in the pool. A pool broken by a process dying (e.g. the OOM
+# killer) is replaced on the next call.
+#
+# Each pool reports <metric>_rejected_total, <metric>_timeouts_total,
+# <metric>_seconds and <metric>_pool_restarts_total, the first three
+# labelled by the call's name under `label`.
+
+
+class BoundedPool:
+    def __init__(self, metric, label, calls, busy, workers=2, max_pending=16, timeout=5,
+                 buckets=metrics.DEFAULT_BUCKETS):
+        # calls names what is queued, for the metrics' help, e.g. 'Hashing calls'
+        self.metric = metric
+        self.label = label
+        self.calls = calls
+        self.busy = busy
+        self.buckets = buckets
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def configure(self, workers=None, max_pending=None, timeout=None):
+        # None keeps the current setting
+        if workers is not None:
+            self.workers = workers
+        if timeout is not None:
+            self.timeout = timeout
+        if max_pending is not None:
+            self._slots = threading.BoundedSemaphore(max_pending)
+
+    def run(self, name, function, *args):
+        labels = {self.label: name}
+        if not self._slots.acquire(blocking=False):
+            metrics.counter(f'{self.metric}_rejected_total', f'{self.calls} rejected because the queue was full',
+                            **labels).inc()
+            raise self.busy(name)
+
+        # configure() may swap the semaphore; release the one acquired
+        slots = self._slots
+        start = time.perf_counter()
+        executor = self._pool()
+        try:
+            future = executor.submit(function, *args)
+        except BrokenProcessPool:
+            slots.release()
+            self._replace(executor)
+            raise self.busy(name) from None
+        except BaseException:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
+
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # Drops it if it has not started; otherwise it keeps its slot
+            # until it finishes
+            future.cancel()
+            metrics.counter(f'{self.metric}_timeouts_total', f'{self.calls} that outlasted the timeout',
+                            **labels).inc()
+            raise self.busy(name) from None
+        except BrokenProcessPool:
+            self._replace(executor)
+            raise self.busy(name) from None
+        finally:
+            metrics.histogram(f'{self.metric}_seconds', f'Latency of {self.calls.lower()} including queueing',
+                              buckets=self.buckets, **labels).observe(time.perf_counter() - start)
+
+    def _pool(self):
+        # Created on first use so pre-fork servers start it inside each worker
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def _replace(self, broken):
+        # Only the first caller to see a broken pool drops it
+        with self._executor_lock:
+            if self._executor is broken:
+                self._executor = None
+                metrics.counter(f'{self.metric}_pool_restarts_total',
+                                f'Pools for {self.calls.lower()} replaced after a process died').inc()
+        broken.shutdown(wait=False, cancel_futures=True)
@@ -100,4 +100,101 @@ SELECT
     SUM(CASE WHEN amount > 0 THEN amount ELSE 0 END) as income,
     ABS(SUM(CASE WHEN amount < 0 THEN amount ELSE 0 END)) as expenses
 FROM transactions
-GROUP BY user_id, DATE_FORMAT(date, '%Y-%m'), category;
\ No newline at end of file
+GROUP BY user_id, DATE_FORMAT(date, '%Y-%m'), category;
+
+-- Per-user monthly/category rollup, maintained by rollup.py on every
+-- transaction write. Backfill or check it with `flask rollup rebuild|verify`.
+CREATE TABLE IF NOT EXISTS monthly_category_totals (
+    user_id INT NOT NULL,
+    year SMALLINT NOT NULL,
+    month TINYINT NOT NULL,
+    category VARCHAR(255) NOT NULL DEFAULT '',
+    txn_count INT NOT NULL DEFAULT 0,
+    total BIGINT NOT NULL DEFAULT 0,
+    spending BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, year, month, category),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+) ENGINE=InnoDB;
+
+-- Per-user write counter, bumped in the same transaction as every write to
+-- transactions. Chart endpoints derive ETag/Last-Modified from it.
+CREATE TABLE IF NOT EXISTS user_data_versions (
+    user_id INT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    modified_at DATETIME NOT NULL,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+) ENGINE=InnoDB;
+
+-- Outgoing email, written by requests and sent by `flask outbox run`.
+CREATE TABLE IF NOT EXISTS email_outbox (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    recipient VARCHAR(255) NOT NULL,
+    sender VARCHAR(255) NOT NULL,
+    subject VARCHAR(255) NOT NULL,
+    body TEXT NOT NULL,
+    attempts INT NOT NULL DEFAULT 0,
+    last_error VARCHAR(255) DEFAULT NULL,
+    created_at DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    next_attempt_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    sent_at DATETIME(6) DEFAULT NULL,
+    KEY idx_pending (sent_at, next_attempt_at)
+) ENGINE=InnoDB;
+
+-- Budget threshold crossings for the month, written by alerts.py when a
+-- transaction or budget write pushes spending past a threshold.
+CREATE TABLE IF NOT EXISTS budget_alerts (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    user_id INT NOT NULL,
+    year SMALLINT NOT NULL,
+    month TINYINT NOT NULL,
+    kind VARCHAR(20) NOT NULL,
+    category VARCHAR(255) NOT NULL DEFAULT '',
+    threshold TINYINT NOT NULL,
+    spent DECIMAL(12,2) NOT NULL,
+    budget_limit DECIMAL(10,2) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY unique_alert (user_id, year, month, kind, category, threshold),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+) ENGINE=InnoDB;
+
+-- Idempotency keys for POST /api/transactions/batch, holding the response to
+-- replay on a retry. Purge old ones with `flask purge-idempotency-keys`.
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    user_id INT NOT NULL,
+    idempotency_key VARCHAR(64) NOT NULL,
+    response TEXT DEFAULT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, idempotency_key),
+    KEY idx_created (created_at),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+) ENGINE=InnoDB;
+
+-- One row per (user, year) moved to the archive files by `flask archive run`
+-- (see archive.py), with the totals `flask archive verify` checks the file
+-- against. Range partitioning transactions by year is done with
+-- `flask partitions create` (see partitions.py), not here, because it drops
+-- the transactions foreign keys.
+CREATE TABLE IF NOT EXISTS archived_years (
+    user_id INT NOT NULL,
+    year SMALLINT NOT NULL,
+    txn_count INT NOT NULL,
+    total BIGINT NOT NULL,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, year),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+) ENGINE=InnoDB;
+
+-- Search index: one row per (user, lowercased word, transaction) over each
+-- transaction's description and category, with the transaction's date and
+-- category copied in so searches and facet counts read only this table. Kept
+-- in step by the write routes (see search.py); binary collation so prefix
+-- ranges compare by code point. Rebuild with `flask search rebuild`.
+CREATE TABLE IF NOT EXISTS transaction_terms (
+    user_id INT NOT NULL,
+    term VARCHAR(32) NOT NULL,
+    date TIMESTAMP NOT NULL,
+    transaction_id INT NOT NULL,
+    category VARCHAR(255) NOT NULL DEFAULT '',
+    PRIMARY KEY (user_id, term, date, transaction_id),
+    KEY idx_transaction (transaction_id, term)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_bin;
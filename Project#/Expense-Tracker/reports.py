@@ -0,0 +1,170 @@
+import hashlib
+import os
+import threading
+from datetime import datetime, timedelta
+
+import metrics
+import periods
+import pools
+import repository
+import rollup
+
+# Monthly report charts rendered server-side, so a report can be downloaded
+# or linked from an email: a day-of-week by week spending heatmap, the
+# month's category split, this year against last by month, or all three on
+# one page ('report'). The data is gathered here with the usual queries and
+# passed as plain lists to a small process pool (pools.py), where
+# charts.render_chart() draws it with matplotlib, so neither the import nor
+# the drawing holds a request thread or the GIL. Past max_pending queued or
+# running renders, after `timeout` seconds, or when a pool process died,
+# callers get ReportsBusy.
+#
+# Rendered images are kept on disk under a hash of everything that decides
+# their content: user, data version (versions.py), month, chart, format and
+# STYLE, plus the day for a month that is still running. A report whose
+# data has not changed is sent straight from disk. The cache is bounded by
+# size, dropping the least recently used files first.
+CHARTS = ('heatmap', 'categories', 'year_over_year', 'report')
+FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+HEATMAP_WEEKS = 26
+# report_data() reaches back into the year before and forward to the end of
+# the month, so both must stay within datetime's range
+MIN_YEAR = 2
+MAX_YEAR = datetime.max.year - 1
+# Bump when the drawing code changes, so cached images are redrawn
+STYLE = 1
+# Renders take far longer than metrics.DEFAULT_BUCKETS is made for
+RENDER_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class ReportsBusy(Exception):
+    pass
+
+
+def report_data(cur, user_id, year, month, today):
+    period = periods.month(year, month)
+    last_day = min(period.end.date() - timedelta(days=1), today)
+    # HEATMAP_WEEKS whole weeks, Monday to Sunday, ending with last_day's
+    first_day = last_day - timedelta(days=last_day.weekday() + 7 * (HEATMAP_WEEKS - 1))
+    start = datetime(first_day.year, first_day.month, first_day.day)
+    days = repository.daily_spending(cur, user_id, periods.Period(start, start + timedelta(weeks=HEATMAP_WEEKS)))
+    monthly = {year - 1: [0.0] * 12, year: [0.0] * 12}
+    for row in rollup.monthly_totals(cur, user_id, year - 1, year):
+        monthly[row['year']][row['month'] - 1] = float(row['amount'] or 0)
+    return {
+        'year': year,
+        'month': month,
+        'first_day': first_day.isoformat(),
+        'last_day': last_day.isoformat(),
+        'days': [(str(row['date'])[:10], float(row['amount'] or 0)) for row in days],
+        'categories': [(row['category'] or 'Uncategorised', float(row['amount'] or 0))
+                       for row in rollup.category_totals(cur, user_id, year, month)],
+        'monthly': [monthly[year - 1], monthly[year]],
+    }
+
+
+def running_day(year, month, today):
+    # A month that has not ended yet also changes with the date: today,
+    # else None
+    return today if (year, month) >= (today.year, today.month) else None
+
+
+def cache_key(user_id, version, year, month, chart, fmt, today):
+    running = running_day(year, month, today)
+    return hashlib.sha256(f'{user_id}:{version}:{year}-{month}:{chart}:{fmt}:{STYLE}:{running}'.encode()).hexdigest()
+
+
+def _render(chart, fmt, data):
+    # Runs in a pool process; charts (matplotlib) is only ever imported there
+    import charts
+    return charts.render_chart(chart, fmt, data)
+
+
+class RenderService:
+    def __init__(self, workers=2, max_pending=8, timeout=30):
+        self.pool = pools.BoundedPool('report_render', 'chart', 'Report renders', ReportsBusy,
+                                      workers, max_pending, timeout, buckets=RENDER_BUCKETS)
+
+    def configure(self, config):
+        self.pool.configure(config.get('REPORT_WORKERS'), config.get('REPORT_MAX_PENDING'),
+                            config.get('REPORT_TIMEOUT'))
+
+    def render(self, chart, fmt, data):
+        return self.pool.run(chart, _render, chart, fmt, data)
+
+
+class DiskCache:
+    # Each process keeps a running total of the cache's size: the total
+    # found by its last walk of the tree plus what it has written since.
+    # Only its first put, and a put that takes the total over max_bytes,
+    # walk the tree. A walk deletes down to EVICT_TO of the budget, so walks
+    # stay rare, and resets the total to what is really on disk, other
+    # processes' files included.
+    EVICT_TO = 0.9
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._size = None
+        self._lock = threading.Lock()
+
+    def path(self, key, fmt):
+        return os.path.join(self.root, key[:2], f'{key}.{fmt}')
+
+    def get(self, key, fmt):
+        path = self.path(key, fmt)
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+            # The mtime doubles as the last use, for eviction
+            os.utime(path)
+        except FileNotFoundError:
+            metrics.counter('report_cache_misses_total', 'Report images rendered').inc()
+            return None
+        metrics.counter('report_cache_hits_total', 'Report images sent from the disk cache').inc()
+        return data
+
+    def put(self, key, fmt, data):
+        path = self.path(key, fmt)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporary, 'wb') as file:
+            file.write(data)
+        try:
+            replaced = os.stat(path).st_size
+        except FileNotFoundError:
+            replaced = 0
+        os.replace(temporary, path)
+        with self._lock:
+            if self._size is not None:
+                self._size += len(data) - replaced
+            over = self._size is None or self._size > self.max_bytes
+        if over:
+            self.evict()
+
+    def evict(self):
+        with self._lock:
+            files = []
+            for directory, _, names in os.walk(self.root):
+                for name in names:
+                    if name.endswith('.tmp'):
+                        continue
+                    try:
+                        stat = os.stat(os.path.join(directory, name))
+                    except FileNotFoundError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, os.path.join(directory, name)))
+            total = sum(size for _, size, _ in files)
+            if total > self.max_bytes:
+                for _, size, path in sorted(files):
+                    if total <= self.max_bytes * self.EVICT_TO:
+                        break
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+            self._size = total
+
+
+service = RenderService()
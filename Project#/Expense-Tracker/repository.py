@@ -0,0 +1,221 @@
+import alerts
+import history
+import periods
+
+# Every statement the routes issue, as constants with every value bound as a
+# parameter. Routes call these functions with a cursor instead of writing
+# SQL; rollup.py, alerts.py, versions.py and outbox.py own the statements for
+# their own tables the same way. Because the text of each statement never
+# changes, backends that cache prepared statements by text (sqlite3 does, per
+# connection) reuse them across requests. The same functions run against
+# MySQL or, with DATABASE_BACKEND = 'sqlite', the in-process backend in
+# sqlite_backend.py.
+
+USER_BY_EMAIL = "SELECT id, username, email FROM users WHERE email = %s"
+USER_BY_USERNAME = "SELECT id, username, password FROM users WHERE username = %s"
+CREATE_USER = "INSERT INTO users(first_name, last_name, email, username, password) VALUES(%s, %s, %s, %s, %s)"
+SET_PASSWORD = "UPDATE users SET password = %s WHERE id = %s"
+BUDGET_PASSWORD = "SELECT budget_password FROM users WHERE id = %s"
+SET_BUDGET_PASSWORD = "UPDATE users SET budget_password = %s WHERE id = %s"
+USER_ROLE = "SELECT role FROM users WHERE id = %s"
+SET_ROLE = "UPDATE users SET role = %s WHERE username = %s"
+
+ADD_TRANSACTION = "INSERT INTO transactions(user_id, amount, description, category, date) VALUES(%s, %s, %s, %s, %s)"
+INSERT_TRANSACTIONS = "INSERT INTO transactions(user_id, amount, description, category, date) VALUES "
+TRANSACTION_ROW = "(%s, %s, %s, %s, %s)"
+TRANSACTION = "SELECT id, user_id, amount, description, category, date FROM transactions WHERE id = %s"
+OWN_TRANSACTION = TRANSACTION + " AND user_id = %s"
+UPDATE_OWN_TRANSACTION = "UPDATE transactions SET amount = %s, description = %s, category = %s WHERE id = %s AND user_id = %s"
+DELETE_OWN_TRANSACTION = "DELETE FROM transactions WHERE id = %s AND user_id = %s"
+MAX_INSERT_ROWS = 500
+PERIOD_SPENDING = "SELECT SUM(amount) AS amount FROM transactions WHERE user_id = %s AND " + periods.condition()
+PERIOD_TRANSACTIONS = ("SELECT id, amount, description, category, date FROM transactions WHERE user_id = %s AND "
+                       + periods.condition() + " ORDER BY date DESC")
+EXPORT_TRANSACTIONS = "SELECT id, date, amount, category, description FROM transactions WHERE user_id = %s ORDER BY date, id"
+DAILY_SPENDING = ("SELECT DATE(date) AS date, SUM(amount) AS amount FROM transactions WHERE user_id = %s AND "
+                  + periods.condition() + " GROUP BY DATE(date) ORDER BY date")
+
+USER_BUDGET = "SELECT monthly_budget, monthly_savings_goal FROM user_budget WHERE user_id = %s"
+BUDGET_UPDATES = "SELECT COUNT(*) AS update_count FROM user_budget WHERE user_id = %s AND " + periods.condition('updated_at')
+UPDATE_USER_BUDGET = """
+    UPDATE user_budget
+    SET monthly_budget = %s, monthly_savings_goal = %s, updated_at = CURRENT_TIMESTAMP
+    WHERE user_id = %s
+"""
+CREATE_USER_BUDGET = "INSERT INTO user_budget (user_id, monthly_budget, monthly_savings_goal) VALUES (%s, %s, %s)"
+CATEGORY_BUDGET = "SELECT category, budget_limit FROM category_budgets WHERE user_id = %s AND category = %s"
+CREATE_CATEGORY_BUDGET = "INSERT INTO category_budgets (user_id, category, budget_limit) VALUES (%s, %s, %s)"
+DELETE_CATEGORY_BUDGET = "DELETE FROM category_budgets WHERE user_id = %s AND category = %s"
+DELETE_CATEGORY_ALERTS = "DELETE FROM budget_alerts WHERE user_id = %s AND kind = %s AND category = %s"
+CATEGORY_BUDGET_STATUS = """
+    SELECT cb.category, cb.budget_limit,
+           COALESCE(r.total, 0) AS current_spending,
+           cb.budget_limit - COALESCE(r.total, 0) AS remaining
+    FROM category_budgets cb
+    LEFT JOIN monthly_category_totals r ON cb.category = r.category
+        AND cb.user_id = r.user_id
+        AND r.year = %s
+        AND r.month = %s
+    WHERE cb.user_id = %s
+"""
+
+ARCHIVED_USERS_BY_YEAR = "SELECT year, COUNT(*) AS users FROM archived_years GROUP BY year"
+
+
+# Users
+
+def user_by_email(cur, email):
+    cur.execute(USER_BY_EMAIL, [email])
+    return cur.fetchone()
+
+
+def user_by_username(cur, username):
+    cur.execute(USER_BY_USERNAME, [username])
+    return cur.fetchone()
+
+
+def create_user(cur, first_name, last_name, email, username, password_hash):
+    cur.execute(CREATE_USER, (first_name, last_name, email, username, password_hash))
+    return cur.lastrowid
+
+
+def set_password(cur, user_id, password_hash):
+    cur.execute(SET_PASSWORD, (password_hash, user_id))
+
+
+def budget_password(cur, user_id):
+    cur.execute(BUDGET_PASSWORD, [user_id])
+    row = cur.fetchone()
+    return row['budget_password'] if row else None
+
+
+def set_budget_password(cur, user_id, password_hash):
+    cur.execute(SET_BUDGET_PASSWORD, (password_hash, user_id))
+
+
+def user_role(cur, user_id):
+    cur.execute(USER_ROLE, [user_id])
+    row = cur.fetchone()
+    return row['role'] if row else None
+
+
+def set_role(cur, username, role):
+    cur.execute(SET_ROLE, (role, username))
+    return cur.rowcount
+
+
+# Transactions
+
+def add_transaction(cur, user_id, amount, description, category, date):
+    cur.execute(ADD_TRANSACTION, (user_id, amount, description, category, date))
+    return cur.lastrowid
+
+
+def insert_transactions(cur, user_id, rows):
+    # One multi-row INSERT per MAX_INSERT_ROWS rows, returning the new ids
+    # without reading them back: InnoDB reserves a single block of
+    # consecutive ids for an INSERT whose row count is known up front, and
+    # lastrowid is the first of them (assumes auto_increment_increment = 1)
+    ids = []
+    for start in range(0, len(rows), MAX_INSERT_ROWS):
+        chunk = rows[start:start + MAX_INSERT_ROWS]
+        cur.execute(INSERT_TRANSACTIONS + ', '.join([TRANSACTION_ROW] * len(chunk)),
+                    [value for row in chunk for value in (user_id,) + tuple(row)])
+        ids += range(cur.lastrowid, cur.lastrowid + len(chunk))
+    return ids
+
+
+def transaction(cur, transaction_id):
+    cur.execute(TRANSACTION, [transaction_id])
+    return cur.fetchone()
+
+
+def own_transaction(cur, user_id, transaction_id):
+    cur.execute(OWN_TRANSACTION, (transaction_id, user_id))
+    return cur.fetchone()
+
+
+def update_own_transaction(cur, user_id, transaction_id, amount, description, category):
+    cur.execute(UPDATE_OWN_TRANSACTION, (amount, description, category, transaction_id, user_id))
+    return cur.rowcount
+
+
+def delete_own_transaction(cur, user_id, transaction_id):
+    cur.execute(DELETE_OWN_TRANSACTION, (transaction_id, user_id))
+    return cur.rowcount
+
+
+def period_spending(cur, user_id, period):
+    cur.execute(PERIOD_SPENDING, [user_id] + periods.params(period))
+    return cur.fetchone()['amount'] or 0
+
+
+def period_transactions(cur, user_id, period):
+    cur.execute(PERIOD_TRANSACTIONS, [user_id] + periods.params(period))
+    return cur.fetchall()
+
+
+def daily_spending(cur, user_id, period):
+    cur.execute(DAILY_SPENDING, [user_id] + periods.params(period))
+    return cur.fetchall()
+
+
+# The next two execute on the caller's (server-side) cursor and leave the
+# rows to be iterated from it, so large results are never materialised
+
+def export_transactions(cur, user_id):
+    cur.execute(EXPORT_TRANSACTIONS, [user_id])
+    return cur
+
+
+def history_page(cur, user_id, category=None, period=None, cursor=None, limit=history.PAGE_SIZE):
+    query, args = history.page_query(user_id, category, period, cursor, limit)
+    cur.execute(query, args)
+    return cur
+
+
+# Budgets
+
+def user_budget(cur, user_id):
+    cur.execute(USER_BUDGET, [user_id])
+    return cur.fetchone()
+
+
+def budget_updates(cur, user_id, period):
+    cur.execute(BUDGET_UPDATES, [user_id] + periods.params(period))
+    return cur.fetchone()['update_count']
+
+
+def save_user_budget(cur, user_id, monthly_budget, monthly_savings_goal):
+    if user_budget(cur, user_id):
+        cur.execute(UPDATE_USER_BUDGET, (monthly_budget, monthly_savings_goal, user_id))
+    else:
+        cur.execute(CREATE_USER_BUDGET, (user_id, monthly_budget, monthly_savings_goal))
+
+
+def category_budget(cur, user_id, category):
+    cur.execute(CATEGORY_BUDGET, (user_id, category))
+    return cur.fetchone()
+
+
+def create_category_budget(cur, user_id, category, budget_limit):
+    cur.execute(CREATE_CATEGORY_BUDGET, (user_id, category, budget_limit))
+
+
+def delete_category_budget(cur, user_id, category):
+    # The category's alerts go with it, so a new budget starts clean
+    cur.execute(DELETE_CATEGORY_BUDGET, (user_id, category))
+    cur.execute(DELETE_CATEGORY_ALERTS, (user_id, alerts.CATEGORY, category))
+
+
+def category_budget_status(cur, user_id, year, month):
+    cur.execute(CATEGORY_BUDGET_STATUS, [year, month, user_id])
+    return cur.fetchall()
+
+
+# Archive
+
+def archived_users_by_year(cur):
+    # {year: number of users whose year was moved to the archive files}
+    cur.execute(ARCHIVED_USERS_BY_YEAR)
+    return {row['year']: row['users'] for row in cur.fetchall()}
@@ -0,0 +1,144 @@
+# Per-user (year, month, category) spending totals kept in step with the
+# transactions table. Every write route calls add()/remove() on the same
+# cursor before committing, so the rollup and the raw rows change in one
+# DB transaction.
+
+UPSERT = """
+    INSERT INTO monthly_category_totals (user_id, year, month, category, txn_count, total, spending)
+    SELECT user_id, YEAR(date), MONTH(date), COALESCE(category, ''),
+           %s * COUNT(*), %s * SUM(amount), %s * SUM(GREATEST(amount, 0))
+    FROM transactions
+    WHERE {where} AND user_id IS NOT NULL
+    GROUP BY user_id, YEAR(date), MONTH(date), COALESCE(category, '')
+    ON DUPLICATE KEY UPDATE
+        txn_count = txn_count + VALUES(txn_count),
+        total = total + VALUES(total),
+        spending = spending + VALUES(spending)
+"""
+
+# rebuild() and drift() leave archived years alone: their rows are in the
+# archive files, not the table, and `flask archive verify` checks them
+GROUPED = """
+    SELECT user_id, YEAR(date) AS year, MONTH(date) AS month, COALESCE(category, '') AS category,
+           COUNT(*) AS txn_count, SUM(amount) AS total, SUM(GREATEST(amount, 0)) AS spending
+    FROM transactions
+    WHERE user_id IS NOT NULL {user_filter}
+      AND NOT EXISTS (SELECT 1 FROM archived_years a
+                      WHERE a.user_id = transactions.user_id AND a.year = YEAR(transactions.date))
+    GROUP BY user_id, YEAR(date), MONTH(date), COALESCE(category, '')
+"""
+
+NOT_ARCHIVED = """
+    AND NOT EXISTS (SELECT 1 FROM archived_years a
+                    WHERE a.user_id = monthly_category_totals.user_id AND a.year = monthly_category_totals.year)
+"""
+
+
+def add(cur, transaction_id):
+    # Call after the row is inserted or updated
+    cur.execute(UPSERT.format(where='id = %s'), (1, 1, 1, transaction_id))
+
+
+def remove(cur, transaction_id):
+    # Call before the row is deleted or updated
+    cur.execute(UPSERT.format(where='id = %s'), (-1, -1, -1, transaction_id))
+
+
+def add_rows(cur, user_id, rows):
+    # Bulk inserts: fold (amount, category, date) tuples in Python and apply
+    # one upsert per (year, month, category) instead of one per row
+    totals = {}
+    for amount, category, when in rows:
+        key = (when.year, when.month, category or '')
+        count, total, spending = totals.get(key, (0, 0, 0))
+        totals[key] = (count + 1, total + amount, spending + max(amount, 0))
+    if totals:
+        cur.executemany("""
+            INSERT INTO monthly_category_totals (user_id, year, month, category, txn_count, total, spending)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                txn_count = txn_count + VALUES(txn_count),
+                total = total + VALUES(total),
+                spending = spending + VALUES(spending)
+        """, [(user_id,) + key + value for key, value in totals.items()])
+
+
+def rebuild(cur, user_id=None):
+    user_filter = 'AND user_id = %s' if user_id else ''
+    args = [user_id] if user_id else []
+    cur.execute("DELETE FROM monthly_category_totals WHERE 1 = 1 " + user_filter + NOT_ARCHIVED, args)
+    cur.execute("INSERT INTO monthly_category_totals (user_id, year, month, category, txn_count, total, spending)"
+                + GROUPED.format(user_filter=user_filter), args)
+    return cur.rowcount
+
+
+def drift(cur, user_id=None):
+    user_filter = 'AND user_id = %s' if user_id else ''
+    args = [user_id] if user_id else []
+
+    cur.execute(GROUPED.format(user_filter=user_filter), args)
+    expected = {(row['user_id'], row['year'], row['month'], row['category']): row for row in cur.fetchall()}
+
+    cur.execute("SELECT * FROM monthly_category_totals WHERE txn_count <> 0 " + user_filter + NOT_ARCHIVED, args)
+    actual = {(row['user_id'], row['year'], row['month'], row['category']): row for row in cur.fetchall()}
+
+    mismatches = []
+    for key in sorted(set(expected) | set(actual)):
+        want = expected.get(key) or {'txn_count': 0, 'total': 0, 'spending': 0}
+        got = actual.get(key) or {'txn_count': 0, 'total': 0, 'spending': 0}
+        if any(want[column] != got[column] for column in ('txn_count', 'total', 'spending')):
+            mismatches.append({'key': key, 'expected': want, 'actual': got})
+    return mismatches
+
+
+def category_totals(cur, user_id, year=None, month=None):
+    period_filter = ('AND year = %s ' if year else '') + ('AND month = %s ' if month else '')
+    args = [user_id] + ([year] if year else []) + ([month] if month else [])
+    cur.execute("""
+        SELECT category, SUM(total) AS amount
+        FROM monthly_category_totals
+        WHERE user_id = %s """ + period_filter + """
+        GROUP BY category
+        HAVING SUM(txn_count) > 0
+        ORDER BY category
+    """, args)
+    return cur.fetchall()
+
+
+def monthly_totals(cur, user_id, first_year, last_year):
+    cur.execute("""
+        SELECT year, month, SUM(total) AS amount
+        FROM monthly_category_totals
+        WHERE user_id = %s AND year BETWEEN %s AND %s
+        GROUP BY year, month
+        HAVING SUM(txn_count) > 0
+        ORDER BY year, month
+    """, (user_id, first_year, last_year))
+    return cur.fetchall()
+
+
+def total_spending(cur, user_id):
+    cur.execute("SELECT SUM(spending) AS total_spending FROM monthly_category_totals WHERE user_id = %s", [user_id])
+    return cur.fetchone()['total_spending']
+
+
+def period_total(cur, user_id, year=None, month=None):
+    where = "user_id = %s"
+    args = [user_id]
+    if year:
+        where += " AND year = %s"
+        args.append(year)
+    if month:
+        where += " AND month = %s"
+        args.append(month)
+    cur.execute("SELECT SUM(total) AS amount FROM monthly_category_totals WHERE " + where, args)
+    return cur.fetchone()['amount']
+
+
+def categories(cur, user_id):
+    cur.execute("""
+        SELECT DISTINCT category FROM monthly_category_totals
+        WHERE user_id = %s AND txn_count > 0 AND category <> ''
+        ORDER BY category
+    """, [user_id])
+    return [row['category'] for row in cur.fetchall()]
@@ -0,0 +1,256 @@
+import heapq
+import itertools
+import re
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta
+
+import history
+import periods
+
+# Per-user inverted index over transaction descriptions and categories:
+# one transaction_terms row per (user, word, transaction), carrying the
+# transaction's date and category so a search is answered from the index
+# alone until the final page of rows is fetched by id. Every write route
+# calls add()/remove() on the same cursor before committing, like the
+# rollup, so the index changes in the same DB transaction as the rows.
+#
+# A query is split into words and every word has to match. Words of
+# MIN_PREFIX letters or more match as prefixes ("ub" finds "uber"), shorter
+# ones only as whole words. The word with the fewest index rows drives the
+# query and the others are probed per candidate on idx_transaction. A page
+# is a backwards walk of the primary key (user_id, term, date,
+# transaction_id) for each word the driving prefix completes to, merged
+# here, so there is no sort over every match. A word that starts a month
+# name ("mar", "march") also matches transactions dated in that month, so
+# "rent march" finds March's rent. Results come back in history order, in
+# keyset pages with the same cursors, and the first page carries category
+# and month facet counts. Archived years (see archive.py) are not indexed.
+TERM_LENGTH = 32
+MIN_PREFIX = 2
+MAX_WORDS = 8
+MAX_COMPLETIONS = 8
+MAX_FACETS = 24
+COUNT_LIMIT = 10000
+INSERT_ROWS = 1000
+TOKEN = re.compile(r'\w+')
+MONTH_NAMES = ['january', 'february', 'march', 'april', 'may', 'june', 'july', 'august', 'september', 'october',
+               'november', 'december']
+
+INSERT_TERMS = "INSERT IGNORE INTO transaction_terms (user_id, term, date, transaction_id, category) VALUES "
+TERM_ROW = "(%s, %s, %s, %s, %s)"
+DELETE_TERMS = "DELETE FROM transaction_terms WHERE transaction_id = %s"
+DELETE_USER_TERMS = "DELETE FROM transaction_terms WHERE user_id = %s"
+USER_ROWS = "SELECT id, description, category, date FROM transactions WHERE user_id = %s"
+INDEXED_USERS = "SELECT DISTINCT user_id FROM transactions WHERE user_id IS NOT NULL"
+# Index rows for a word, counted up to a cap: enough to pick the rarest word
+POSTINGS = ("SELECT COUNT(*) AS count FROM (SELECT 1 FROM transaction_terms WHERE user_id = %s AND {word} "
+            "LIMIT %s) p")
+COMPLETIONS = "SELECT DISTINCT term FROM transaction_terms WHERE user_id = %s AND {word} ORDER BY term LIMIT %s"
+ALSO_MATCHES = "EXISTS (SELECT 1 FROM transaction_terms o WHERE o.transaction_id = m.transaction_id AND {word})"
+# Queries made only of month words have no word to drive from, so they
+# filter the user's transactions instead
+MATCHES = "t.id IN (SELECT transaction_id FROM transaction_terms WHERE user_id = %s AND {word})"
+# The ids come from the user's own index rows, and filtering on user_id as
+# well would tempt the planner onto idx_user_date instead of the primary key
+ROWS_BY_ID = "SELECT id, amount, description, category, date FROM transactions WHERE id IN ({ids})"
+
+# How a query is answered, worked out once per request by match(). alias is
+# 'm' (index rows) or 't' (transactions). Each of drivers is a (condition,
+# args) pair read in date order for a page; covering is one condition over
+# all of them for the facet counts, in which a transaction is counted once
+# per driver it matches unless repeats says to count distinct ids. filters
+# and args hold the other words.
+Match = namedtuple('Match', ['alias', 'drivers', 'covering', 'repeats', 'filters', 'args'])
+
+
+def terms(*texts):
+    found = set()
+    for text in texts:
+        found.update(word[:TERM_LENGTH] for word in TOKEN.findall((text or '').lower()))
+    return found
+
+
+def add(cur, user_id, rows):
+    # rows are (transaction_id, description, category, date) tuples
+    values = [(user_id, term, when, transaction_id, category or '')
+              for transaction_id, description, category, when in rows for term in terms(description, category)]
+    for start in range(0, len(values), INSERT_ROWS):
+        chunk = values[start:start + INSERT_ROWS]
+        cur.execute(INSERT_TERMS + ', '.join([TERM_ROW] * len(chunk)), [value for row in chunk for value in row])
+
+
+def remove(cur, transaction_ids):
+    cur.executemany(DELETE_TERMS, [[transaction_id] for transaction_id in transaction_ids])
+
+
+def rebuild(cur, user_id=None):
+    user_ids = [user_id] if user_id else [row['user_id'] for row in _fetch(cur, INDEXED_USERS, [])]
+    indexed = 0
+    for user in user_ids:
+        cur.execute(DELETE_USER_TERMS, [user])
+        rows = _fetch(cur, USER_ROWS, [user])
+        add(cur, user, [(row['id'], row['description'], row['category'], row['date']) for row in rows])
+        indexed += len(rows)
+    return indexed
+
+
+def _fetch(cur, query, args):
+    cur.execute(query, args)
+    return cur.fetchall()
+
+
+def _word(column, word):
+    # Condition and args matching one query word against a term column
+    if len(word) < MIN_PREFIX:
+        return f"{column} = %s", [word]
+    # word with its last letter bumped is the smallest string above every
+    # string starting with word
+    return f"{column} >= %s AND {column} < %s", [word, word[:-1] + chr(ord(word[-1]) + 1)]
+
+
+def _month(word):
+    if len(word) < 3:
+        return None
+    for number, name in enumerate(MONTH_NAMES, 1):
+        if name.startswith(word):
+            return number
+    return None
+
+
+def parse_range(start, end):
+    # Inclusive YYYY-MM-DD bounds from the query string; either may be blank
+    if not start and not end:
+        return None
+    try:
+        first = datetime.strptime(start, '%Y-%m-%d') if start else datetime(1970, 1, 1)
+        last = datetime.strptime(end, '%Y-%m-%d') + timedelta(days=1) if end else datetime(9999, 1, 1)
+    except ValueError:
+        return None
+    return periods.Period(first, last)
+
+
+def match(cur, user_id, query):
+    words = sorted(terms(query))[:MAX_WORDS]
+    plain = [word for word in words if not _month(word)]
+    if not plain:
+        filters, args = [], []
+        for word in words:
+            condition, word_args = _word('term', word)
+            filters.append("(" + MATCHES.format(word=condition) + " OR MONTH(t.date) = %s)")
+            args += [user_id] + word_args + [_month(word)]
+        everything = ("t.user_id = %s", [user_id])
+        return Match('t', [everything], everything, False, filters, args)
+
+    def postings(word):
+        condition, word_args = _word('term', word)
+        return _fetch(cur, POSTINGS.format(word=condition), [user_id] + word_args + [COUNT_LIMIT])[0]['count']
+
+    lead = min(plain, key=postings)
+    condition, lead_args = _word('m.term', lead)
+    covering = ("m.user_id = %s AND " + condition, [user_id] + lead_args)
+    condition, lead_args = _word('term', lead)
+    completions = [row['term'] for row in
+                   _fetch(cur, COMPLETIONS.format(word=condition), [user_id] + lead_args + [MAX_COMPLETIONS + 1])]
+    if len(completions) <= MAX_COMPLETIONS:
+        drivers = [("m.user_id = %s AND m.term = %s", [user_id, term]) for term in completions]
+    else:
+        drivers = [covering]
+
+    filters, args = [], []
+    for word in words:
+        if word == lead:
+            continue
+        condition, word_args = _word('o.term', word)
+        month = _month(word)
+        if month:
+            filters.append("(" + ALSO_MATCHES.format(word=condition) + " OR MONTH(m.date) = %s)")
+            args += word_args + [month]
+        else:
+            filters.append(ALSO_MATCHES.format(word=condition))
+            args += word_args
+    return Match('m', drivers, covering, len(completions) > 1, filters, args)
+
+
+def _where(found, driver, category=None, period=None):
+    condition, args = driver
+    where, args = [condition] + found.filters, args + found.args
+    if category:
+        where.append(f"COALESCE({found.alias}.category, '') = %s")
+        args.append(category)
+    if period:
+        where.append(periods.condition(f'{found.alias}.date'))
+        args += periods.params(period)
+    return " AND ".join(where), args
+
+
+def _row_id(alias):
+    return f'{alias}.transaction_id' if alias == 'm' else f'{alias}.id'
+
+
+def _source(alias):
+    return "transaction_terms m" if alias == 'm' else "transactions t"
+
+
+def search(cur, found, category=None, period=None, cursor=None, limit=history.PAGE_SIZE):
+    alias, row_id = found.alias, _row_id(found.alias)
+    # Only a single driver over several completions can return a
+    # transaction twice in one query
+    distinct = 'DISTINCT ' if found.repeats and len(found.drivers) == 1 else ''
+    after = history.decode_cursor(cursor)
+    pages = []
+    for driver in found.drivers:
+        where, args = _where(found, driver, category, period)
+        if after:
+            where += f" AND ({alias}.date < %s OR ({alias}.date = %s AND {row_id} < %s))"
+            args += [after[0], after[0], after[1]]
+        pages.append(_fetch(cur, f"SELECT {distinct}{row_id} AS id, {alias}.date FROM {_source(alias)} "
+                                 f"WHERE {where} ORDER BY {alias}.date DESC, {row_id} DESC LIMIT %s", args + [limit]))
+
+    # A transaction found by two drivers comes out of the merge twice in a row
+    merged = heapq.merge(*pages, key=lambda row: (row['date'], row['id']), reverse=True)
+    ids = [key for key, _ in itertools.islice(itertools.groupby(row['id'] for row in merged), limit)]
+    if not ids:
+        return []
+    rows = {row['id']: row for row in _fetch(cur, ROWS_BY_ID.format(ids=', '.join(['%s'] * len(ids))), ids)}
+    return [rows[transaction_id] for transaction_id in ids if transaction_id in rows]
+
+
+def _groups(cur, found, period=None):
+    # Match counts per (category, year, month). A transaction has one
+    # category and one date, so the counts add up exactly into either facet
+    alias = found.alias
+    count = f'COUNT(DISTINCT {_row_id(alias)})' if found.repeats else 'COUNT(*)'
+    where, args = _where(found, found.covering, period=period)
+    return _fetch(cur, f"SELECT COALESCE({alias}.category, '') AS category, YEAR({alias}.date) AS year, "
+                       f"MONTH({alias}.date) AS month, {count} AS count FROM {_source(alias)} WHERE {where} "
+                       f"GROUP BY COALESCE({alias}.category, ''), YEAR({alias}.date), MONTH({alias}.date)", args)
+
+
+def facets(cur, found, category=None, period=None):
+    # Each facet is counted with the other facet's filter applied but not
+    # its own, so picking a category still shows the other categories. One
+    # grouped query serves both unless a date range has to be left out of
+    # the month counts
+    groups = _groups(cur, found)
+    in_period = _groups(cur, found, period) if period else groups
+
+    categories = Counter()
+    for row in in_period:
+        categories[row['category']] += row['count']
+    months = Counter()
+    for row in groups:
+        if not category or row['category'] == category:
+            months[row['year'], row['month']] += row['count']
+
+    return {
+        'category': [{'value': value, 'count': count}
+                     for value, count in sorted(categories.items(), key=lambda item: (-item[1], item[0]))[:MAX_FACETS]],
+        'month': [_month_facet(year, number, count)
+                  for (year, number), count in sorted(months.items(), reverse=True)[:MAX_FACETS]],
+    }
+
+
+def _month_facet(year, number, count):
+    month = periods.month(year, number)
+    return {'value': f"{year}-{number:02d}", 'count': count, 'from': month.start.strftime('%Y-%m-%d'),
+            'to': (month.end - timedelta(days=1)).strftime('%Y-%m-%d')}
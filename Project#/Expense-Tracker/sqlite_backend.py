@@ -0,0 +1,305 @@
+import functools
+import re
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import MySQLdb
+from flask import g
+
+import instrumentation
+
+# In-process stand-in for PooledMySQL, selected with DATABASE_BACKEND =
+# 'sqlite'. It runs the statements in repository.py, rollup.py, alerts.py,
+# versions.py, history.py and outbox.py unchanged: the MySQL constructs they use are
+# rewritten once per statement text (and cached, so sqlite3's own per-
+# connection statement cache reuses the prepared statement), and the MySQL
+# functions they call are registered on the connection. Rows come back as
+# dicts with datetime values, like MySQLdb's DictCursor. One connection is
+# shared by the process, so this is for tests and local development, not
+# for serving; SKIP LOCKED is dropped, which is harmless with a single
+# connection. partitions.py (information_schema, partition DDL) still needs
+# MySQL.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    first_name TEXT, last_name TEXT, email TEXT, username TEXT,
+    password TEXT, budget_password TEXT, role TEXT DEFAULT 'user'
+);
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    amount INTEGER NOT NULL DEFAULT 0 CHECK (amount <> 0),
+    description TEXT, category TEXT,
+    date TEXT DEFAULT (datetime('now', 'localtime'))
+);
+CREATE INDEX IF NOT EXISTS idx_user_date ON transactions (user_id, date);
+CREATE TABLE IF NOT EXISTS user_budget (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    monthly_budget REAL NOT NULL DEFAULT 0,
+    monthly_savings_goal REAL NOT NULL DEFAULT 0,
+    created_at TEXT DEFAULT (datetime('now', 'localtime')),
+    updated_at TEXT DEFAULT (datetime('now', 'localtime'))
+);
+CREATE TABLE IF NOT EXISTS category_budgets (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    category TEXT NOT NULL,
+    budget_limit REAL NOT NULL DEFAULT 0,
+    created_at TEXT DEFAULT (datetime('now', 'localtime')),
+    updated_at TEXT DEFAULT (datetime('now', 'localtime')),
+    UNIQUE (user_id, category)
+);
+CREATE TABLE IF NOT EXISTS monthly_category_totals (
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    year INTEGER NOT NULL, month INTEGER NOT NULL,
+    category TEXT NOT NULL DEFAULT '',
+    txn_count INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL DEFAULT 0,
+    spending INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, year, month, category)
+);
+CREATE TABLE IF NOT EXISTS user_data_versions (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    version INTEGER NOT NULL DEFAULT 0,
+    modified_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS email_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recipient TEXT NOT NULL, sender TEXT NOT NULL, subject TEXT NOT NULL, body TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0, last_error TEXT,
+    created_at TEXT NOT NULL DEFAULT (datetime('now', 'localtime')),
+    next_attempt_at TEXT NOT NULL DEFAULT (datetime('now', 'localtime')),
+    sent_at TEXT
+);
+CREATE TABLE IF NOT EXISTS budget_alerts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    year INTEGER NOT NULL, month INTEGER NOT NULL,
+    kind TEXT NOT NULL, category TEXT NOT NULL DEFAULT '',
+    threshold INTEGER NOT NULL, spent REAL NOT NULL, budget_limit REAL NOT NULL,
+    created_at TEXT DEFAULT (datetime('now', 'localtime')),
+    UNIQUE (user_id, year, month, kind, category, threshold)
+);
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    idempotency_key TEXT NOT NULL,
+    response TEXT,
+    created_at TEXT DEFAULT (datetime('now', 'localtime')),
+    PRIMARY KEY (user_id, idempotency_key)
+);
+CREATE TABLE IF NOT EXISTS archived_years (
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    year INTEGER NOT NULL,
+    txn_count INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    archived_at TEXT DEFAULT (datetime('now', 'localtime')),
+    PRIMARY KEY (user_id, year)
+);
+CREATE TABLE IF NOT EXISTS transaction_terms (
+    user_id INTEGER NOT NULL,
+    term TEXT NOT NULL,
+    date TEXT NOT NULL,
+    transaction_id INTEGER NOT NULL,
+    category TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (user_id, term, date, transaction_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_transaction ON transaction_terms (transaction_id, term);
+"""
+
+REWRITES = [
+    (re.compile(r'%s'), '?'),
+    (re.compile(r'\bINSERT IGNORE\b', re.I), 'INSERT OR IGNORE'),
+    (re.compile(r'\bON DUPLICATE KEY UPDATE\b', re.I), 'ON CONFLICT DO UPDATE SET'),
+    (re.compile(r'\bVALUES\((\w+)\)', re.I), r'excluded.\1'),
+    (re.compile(r'\bCURRENT_TIMESTAMP\b', re.I), 'NOW()'),
+    (re.compile(r'\bFOR UPDATE( SKIP LOCKED)?', re.I), ''),
+    # The outbox's date arithmetic: the unit becomes a string argument
+    (re.compile(r'\bTIMESTAMPDIFF\((\w+),', re.I), r"TIMESTAMPDIFF('\1',"),
+    (re.compile(r'\bNOW\(\) ([+-]) INTERVAL (\?|\d+) (\w+)', re.I), r"DATE_ADD(NOW(), \1\2, '\3')"),
+    # Inline YEAR/MONTH of a column instead of calling back into Python for
+    # every row; the registered functions still cover other arguments
+    (re.compile(r'\bYEAR\(([\w.]+)\)'), r'CAST(substr(\1, 1, 4) AS INTEGER)'),
+    (re.compile(r'\bMONTH\(([\w.]+)\)'), r'CAST(substr(\1, 6, 2) AS INTEGER)'),
+]
+
+# Columns returned as datetimes (or dates, for DATE(...) results)
+DATE_COLUMNS = {'date', 'created_at', 'updated_at', 'modified_at', 'sent_at', 'next_attempt_at', 'archived_at'}
+
+
+@functools.lru_cache(maxsize=512)
+def translate(query):
+    for pattern, replacement in REWRITES:
+        query = pattern.sub(replacement, query)
+    # SQLite needs a WHERE before ON CONFLICT in INSERT ... SELECT; all of
+    # ours have one
+    return query
+
+
+def _adapt(value):
+    if isinstance(value, datetime):
+        return value.isoformat(' ', 'seconds')
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _convert(name, value):
+    if name in DATE_COLUMNS and isinstance(value, str):
+        return date.fromisoformat(value) if len(value) == 10 else datetime.fromisoformat(value)
+    return value
+
+
+def _day(value):
+    return value[:10] if value else None
+
+
+def _timestampdiff(unit, start, end):
+    # REAL rather than MySQL's integer, so the callers' division by 1000000
+    # is not an integer division here
+    if start is None or end is None:
+        return None
+    return (datetime.fromisoformat(end) - datetime.fromisoformat(start)) / timedelta(**{unit.lower() + 's': 1})
+
+
+def _date_add(value, amount, unit):
+    return (datetime.fromisoformat(value) + timedelta(**{unit.lower() + 's': amount})).isoformat(' ', 'seconds')
+
+
+def _register_functions(connection):
+    connection.create_function('YEAR', 1, lambda value: int(value[:4]) if value else None, deterministic=True)
+    connection.create_function('MONTH', 1, lambda value: int(value[5:7]) if value else None, deterministic=True)
+    connection.create_function('DATE', 1, _day, deterministic=True)
+    connection.create_function('TO_DAYS', 1, lambda value: date.fromisoformat(value[:10]).toordinal() + 365
+                               if value else None, deterministic=True)
+    connection.create_function('GREATEST', 2, max, deterministic=True)
+    connection.create_function('NOW', 0, lambda: datetime.now().isoformat(' ', 'seconds'))
+    connection.create_function('NOW', 1, lambda precision: datetime.now().isoformat(' ', 'microseconds'
+                                                                                   if precision else 'seconds'))
+    connection.create_function('TIMESTAMPDIFF', 3, _timestampdiff, deterministic=True)
+    connection.create_function('DATE_ADD', 3, _date_add, deterministic=True)
+
+
+class Cursor:
+    def __init__(self, connection):
+        self._cursor = connection.cursor()
+        self._lastrowid = None
+
+    def execute(self, query, args=None):
+        try:
+            self._cursor.execute(translate(query), [_adapt(arg) for arg in args or ()])
+        except sqlite3.IntegrityError as e:
+            raise MySQLdb.IntegrityError(*e.args) from e
+        # MySQL reports the first id of a multi-row INSERT, sqlite3 the last
+        self._lastrowid = self._cursor.lastrowid
+        if self._cursor.rowcount > 1 and query.lstrip()[:6].upper() == 'INSERT':
+            self._lastrowid -= self._cursor.rowcount - 1
+        return self._cursor.rowcount
+
+    def executemany(self, query, args):
+        try:
+            self._cursor.executemany(translate(query), [[_adapt(arg) for arg in row] for row in args])
+        except sqlite3.IntegrityError as e:
+            raise MySQLdb.IntegrityError(*e.args) from e
+        return self._cursor.rowcount
+
+    def _row(self, row):
+        if row is None:
+            return None
+        return {column[0]: _convert(column[0], value) for column, value in zip(self._cursor.description, row)}
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def fetchmany(self, size=1):
+        return [self._row(row) for row in self._cursor.fetchmany(size)]
+
+    def __iter__(self):
+        for row in self._cursor:
+            yield self._row(row)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._lastrowid
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Connection:
+    def __init__(self, path):
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA foreign_keys = ON')
+        self._connection.executescript(SCHEMA)
+        _register_functions(self._connection)
+        self.lock = threading.RLock()
+
+    def cursor(self, cursorclass=None):
+        # cursorclass (e.g. SSDictCursor) is accepted for compatibility;
+        # sqlite3 cursors already step through results lazily
+        return instrumentation.instrumented(Cursor)(self._connection)
+
+    def commit(self):
+        self._connection.commit()
+
+    def rollback(self):
+        self._connection.rollback()
+
+    def ping(self):
+        pass
+
+    def close(self):
+        self._connection.close()
+
+
+class SQLiteDB:
+    def __init__(self, app=None):
+        self._connection = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.teardown_appcontext(self.teardown)
+
+    @property
+    def connection(self):
+        with self._lock:
+            if self._connection is None:
+                self._connection = Connection(self.app.config.get('SQLITE_PATH', ':memory:'))
+        if 'db_connection' not in g:
+            self._connection.lock.acquire()
+            g.db_connection = self._connection
+        return g.db_connection
+
+    def teardown(self, exception):
+        connection = g.pop('db_connection', None)
+        if connection is not None:
+            connection.rollback()
+            connection.lock.release()
+
+    def discard(self):
+        # Nothing to stop mid-stream here; just end the request's use of it
+        self.teardown(None)
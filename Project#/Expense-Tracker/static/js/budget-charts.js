@@ -192,6 +192,73 @@ const CHART_COLORS = {
     });
   }
   
+  // Initialize bar chart
+  function initBarChart(data) {
+    if (!data || !data.labels || !data.values || data.labels.length === 0) {
+      console.log('No data available for bar chart');
+      return;
+    }
+  
+    const ctx = document.getElementById('barChart').getContext('2d');
+    return new Chart(ctx, {
+      type: 'bar',
+      data: {
+        labels: data.labels,
+        datasets: [{
+          label: 'Monthly Spending',
+          data: data.values,
+          backgroundColor: CHART_COLORS.primary
+        }]
+      },
+      options: {
+        responsive: true,
+        plugins: {
+          legend: { display: false },
+          title: {
+            display: true,
+            text: 'Monthly Spending This Year'
+          }
+        },
+        scales: {
+          y: { beginAtZero: true }
+        }
+      }
+    });
+  }
+  
+  // Initialize grouped bar chart
+  function initGroupedBarChart(data) {
+    if (!data || !data.labels || !data.categories || data.categories.length === 0) {
+      console.log('No data available for grouped bar chart');
+      return;
+    }
+  
+    const ctx = document.getElementById('comparisonChart').getContext('2d');
+    const datasets = data.categories.map((category, index) => ({
+      label: category,
+      data: data.values[category],
+      backgroundColor: CHART_COLORS.colors[index % CHART_COLORS.colors.length]
+    }));
+  
+    return new Chart(ctx, {
+      type: 'bar',
+      data: { labels: data.labels, datasets },
+      options: {
+        responsive: true,
+        plugins: {
+          legend: { position: 'top' },
+          title: {
+            display: true,
+            text: 'Comparison Between This Year and Last Year'
+          }
+        },
+        scales: {
+          y: { beginAtZero: true }
+        }
+      }
+    });
+  }
+  
   // Switch between chart types
   function switchChart(chartType) {
     const chartContainers = document.querySelectorAll('.chart-container');
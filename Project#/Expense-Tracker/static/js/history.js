@@ -0,0 +1,181 @@
+// Load further pages of transaction history as the table scrolls into view
+(function () {
+  const table = document.getElementById('history-table');
+  const sentinel = document.getElementById('history-more');
+  if (!table || !sentinel) {
+    return;
+  }
+
+  const PAGE_SIZE = 100;
+  let loading = false;
+  const rows = table.querySelectorAll('tr[data-cursor]');
+  let nextCursor = rows.length >= PAGE_SIZE ? rows[rows.length - 1].dataset.cursor : null;
+
+  function cell(text) {
+    const td = document.createElement('td');
+    td.textContent = text;
+    return td;
+  }
+
+  function appendRow(transaction) {
+    const row = document.createElement('tr');
+    row.dataset.cursor = transaction.cursor;
+    row.appendChild(cell(transaction.date));
+    row.appendChild(cell(transaction.amount));
+    row.appendChild(cell(transaction.category));
+    row.appendChild(cell(transaction.description));
+
+    const edit = document.createElement('td');
+    const link = document.createElement('a');
+    link.href = 'editTransaction/' + transaction.id;
+    link.className = 'btn btn-primary pull-right';
+    link.textContent = 'Edit';
+    edit.appendChild(link);
+    row.appendChild(edit);
+
+    const remove = document.createElement('td');
+    const button = document.createElement('button');
+    button.type = 'button';
+    button.className = 'btn btn-danger delete-transaction';
+    button.dataset.toggle = 'modal';
+    button.dataset.target = '#exampleModalCenter';
+    button.dataset.id = transaction.id;
+    button.dataset.url = transaction.delete_url;
+    button.textContent = 'Delete';
+    remove.appendChild(button);
+    row.appendChild(remove);
+
+    table.querySelector('tbody').appendChild(row);
+  }
+
+  function loadMore() {
+    if (loading || !nextCursor) {
+      return;
+    }
+    loading = true;
+    const separator = table.dataset.pageUrl.indexOf('?') === -1 ? '?' : '&';
+    fetch(table.dataset.pageUrl + separator + 'cursor=' + encodeURIComponent(nextCursor), { credentials: 'same-origin' })
+      .then(response => response.json())
+      .then(page => {
+        page.transactions.forEach(appendRow);
+        nextCursor = page.next_cursor;
+      })
+      .finally(() => {
+        loading = false;
+      });
+  }
+
+  // The search box below swaps in other rows and a new page URL
+  table.addEventListener('history:reset', event => {
+    (event.detail.transactions || []).forEach(appendRow);
+    nextCursor = event.detail.cursor;
+  });
+
+  new IntersectionObserver(entries => {
+    if (entries.some(entry => entry.isIntersecting)) {
+      loadMore();
+    }
+  }).observe(sentinel);
+})();
+
+// Search box: each (debounced) query replaces the table with the first page
+// of matches and its facet counts; pages after that load as above. Clicking
+// a category or month facet narrows the search, and clicking it again, or
+// clearing the box, puts the history back.
+(function () {
+  const input = document.getElementById('history-search');
+  const table = document.getElementById('history-table');
+  const facets = document.getElementById('history-facets');
+  if (!input || !table || !facets) {
+    return;
+  }
+
+  const DEBOUNCE_MS = 250;
+  const historyUrl = table.dataset.pageUrl;
+  const historyRows = Array.from(table.querySelectorAll('tr[data-cursor]'));
+  let filters = {};
+  let timer = null;
+  let latest = 0;
+
+  function searchUrl() {
+    const params = new URLSearchParams(Object.assign({ q: input.value.trim() }, filters));
+    return input.dataset.searchUrl + '?' + params.toString();
+  }
+
+  function chip(label, count, active, onClick) {
+    const badge = document.createElement('span');
+    badge.className = 'badge ' + (active ? 'badge-primary' : 'badge-secondary');
+    badge.textContent = label + ' (' + count + ')';
+    badge.addEventListener('click', onClick);
+    return badge;
+  }
+
+  function toggle(values) {
+    const active = Object.keys(values).every(key => filters[key] === values[key]);
+    Object.keys(values).forEach(key => {
+      if (active) {
+        delete filters[key];
+      } else {
+        filters[key] = values[key];
+      }
+    });
+    run();
+  }
+
+  function showFacets(counts) {
+    facets.textContent = '';
+    counts.category.forEach(facet => {
+      facets.appendChild(chip(facet.value || 'Uncategorised', facet.count, filters.category === facet.value,
+        () => toggle({ category: facet.value })));
+    });
+    facets.appendChild(document.createElement('br'));
+    counts.month.forEach(facet => {
+      facets.appendChild(chip(facet.value, facet.count, filters.from === facet.from,
+        () => toggle({ from: facet.from, to: facet.to })));
+    });
+  }
+
+  function clearRows() {
+    table.querySelectorAll('tr[data-cursor]').forEach(row => row.remove());
+  }
+
+  function restore() {
+    filters = {};
+    facets.textContent = '';
+    clearRows();
+    historyRows.forEach(row => table.querySelector('tbody').appendChild(row));
+    table.dataset.pageUrl = historyUrl;
+    table.dispatchEvent(new CustomEvent('history:reset', {
+      detail: { cursor: historyRows.length ? historyRows[historyRows.length - 1].dataset.cursor : null }
+    }));
+  }
+
+  function run() {
+    if (!input.value.trim()) {
+      restore();
+      return;
+    }
+    const url = searchUrl();
+    const request = ++latest;
+    fetch(url, { credentials: 'same-origin' })
+      .then(response => response.json())
+      .then(page => {
+        // Answers to queries typed over since are dropped
+        if (request !== latest) {
+          return;
+        }
+        clearRows();
+        table.dataset.pageUrl = url;
+        table.dispatchEvent(new CustomEvent('history:reset', { detail: { transactions: page.transactions, cursor: page.next_cursor } }));
+        showFacets(page.facets);
+      });
+  }
+
+  input.addEventListener('input', () => {
+    clearTimeout(timer);
+    timer = setTimeout(() => {
+      filters = {};
+      run();
+    }, DEBOUNCE_MS);
+  });
+})();
@@ -1,5 +1,6 @@
 $(document).ready(function () {
-	$('.delete-transaction').click(function () {
+	// Delegated so rows appended by the history loader are covered too
+	$(document).on('click', '.delete-transaction', function () {
 		var id = $(this).attr('data-id');
 		var url = $(this).attr('data-url');
 
@@ -0,0 +1,60 @@
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+# The whole run shares one in-memory database on the SQLite backend
+# (sqlite_backend.py). Every test signs in as a user of its own, so tests
+# never see each other's rows and the per-user caches stay valid. Archive
+# files and report images go to a scratch directory.
+os.environ['DATABASE_BACKEND'] = 'sqlite'
+os.environ['SQLITE_PATH'] = ':memory:'
+os.environ['ARCHIVE_DIR'] = tempfile.mkdtemp(prefix='tracker-archive-')
+os.environ['REPORT_CACHE_DIR'] = tempfile.mkdtemp(prefix='tracker-reports-')
+
+_users = itertools.count(1)
+
+
+@pytest.fixture(scope='session')
+def tracker():
+    # The app module, for what the views use (tracker.mysql, tracker.datetime)
+    import app as tracker
+    return tracker
+
+
+@pytest.fixture(scope='session')
+def app(tracker):
+    return tracker.create_app({'TESTING': True})
+
+
+@pytest.fixture
+def run(tracker, app):
+    # Calls function(cur, *args) in an app context of its own and commits,
+    # as a CLI command would
+    def run(function, *args):
+        with app.app_context():
+            with tracker.mysql.connection.cursor() as cur:
+                result = function(cur, *args)
+            tracker.mysql.connection.commit()
+        return result
+    return run
+
+
+@pytest.fixture
+def user_id(tracker, run):
+    username = f'user{next(_users):05d}'
+    # Never checked: tests sign in through the session, not the hashing pool
+    return run(tracker.repository.create_user, 'Test', 'User', f'{username}@example.com', username, '!')
+
+
+@pytest.fixture
+def client(app, user_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session.update(logged_in=True, username=f'user{user_id}', userID=user_id)
+    return client
@@ -0,0 +1,54 @@
+import json
+from datetime import datetime
+
+import pytest
+
+import admin
+import repository
+import rollup
+
+
+@pytest.fixture
+def admin_client(client, run, user_id):
+    run(lambda cur: cur.execute("UPDATE users SET role = 'admin' WHERE id = %s", [user_id]))
+    return client
+
+
+def _result(response):
+    return json.loads(response.get_data(as_text=True).splitlines()[-1])['result']
+
+
+def test_unread_reports_free_their_slot(admin_client):
+    # A server closes the response whether or not it read the body
+    for method in (admin_client.head, admin_client.get):
+        response = method('/admin/analytics/distribution')
+        assert response.status_code == 200
+        response.close()
+    response = admin_client.get('/admin/analytics/distribution')
+    assert response.status_code == 200
+    assert 'transaction_amount' in _result(response)
+
+
+@pytest.mark.parametrize('chunk_rows', [1, 3, admin.CHUNK_ROWS])
+def test_active_users_counts_each_user_once(admin_client, run, user_id, monkeypatch, chunk_rows):
+    now = datetime.now()
+    run(repository.insert_transactions, user_id,
+        [(5, 'tea', category, now.replace(day=1)) for category in ('Food', 'Fun', 'Rent')])
+    run(rollup.rebuild, user_id)
+    window = admin.window(now.date(), admin.DEFAULT_MONTHS)
+
+    def expected(cur):
+        cur.execute("SELECT year * 12 + month AS month, COUNT(DISTINCT user_id) AS users "
+                    "FROM monthly_category_totals WHERE txn_count > 0 AND year * 12 + month BETWEEN %s AND %s "
+                    "GROUP BY year, month", [window.first, window.last])
+        months = {row['month']: row['users'] for row in cur.fetchall()}
+        cur.execute("SELECT COUNT(DISTINCT user_id) AS users FROM monthly_category_totals "
+                    "WHERE txn_count > 0 AND year * 12 + month BETWEEN %s AND %s", [window.first, window.last])
+        return [months.get(month, 0) for month in range(window.first, window.last + 1)], cur.fetchone()['users']
+    months, in_window = run(expected)
+
+    monkeypatch.setattr(admin, 'CHUNK_ROWS', chunk_rows)
+    result = _result(admin_client.get('/admin/analytics/active_users'))
+    assert [month['active_users'] for month in result['months']] == months
+    assert result['active_in_window'] == in_window
+    assert months[-1] >= 1
@@ -0,0 +1,27 @@
+from datetime import datetime
+
+import pytest
+
+
+@pytest.mark.parametrize('url', ['/category', '/yearly_bar', '/monthly_bar'])
+def test_chart_validators_expire_with_the_year(tracker, client, monkeypatch, url):
+    first = client.get(url)
+    assert client.get(url, headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+    assert client.get(url, headers={'If-Modified-Since': first.headers['Last-Modified']}).status_code == 304
+
+    class NextYear(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime(datetime.now().year + 1, 1, 1, 0, 30)
+    monkeypatch.setattr(tracker, 'datetime', NextYear)
+    assert client.get(url, headers={'If-None-Match': first.headers['ETag']}).status_code == 200
+    assert client.get(url, headers={'If-Modified-Since': first.headers['Last-Modified']}).status_code == 200
+
+
+def test_search_validator_covers_the_query_string(client):
+    first = client.get('/api/transactions/search', query_string={'q': 'tea'})
+    etag = first.headers['ETag']
+    assert client.get('/api/transactions/search', query_string={'q': 'tea'},
+                      headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/api/transactions/search', query_string={'q': 'rent'},
+                      headers={'If-None-Match': etag}).status_code == 200
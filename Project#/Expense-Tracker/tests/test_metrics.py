@@ -0,0 +1,46 @@
+import json
+import os
+import subprocess
+import sys
+
+import metrics
+
+
+def test_metrics_need_the_token_or_an_admin(app, client, run, user_id, monkeypatch):
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', 'scrape-me')
+    anonymous = app.test_client()
+    assert anonymous.get('/metrics').status_code == 403
+    assert anonymous.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 403
+    assert anonymous.get('/metrics', headers={'Authorization': 'Bearer scrape-me'}).status_code == 200
+    assert client.get('/metrics').status_code == 403
+
+    run(lambda cur: cur.execute("UPDATE users SET role = 'admin' WHERE id = %s", [user_id]))
+    assert client.get('/metrics').status_code == 200
+
+
+def _dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', ''])
+    process.wait()
+    return process.pid
+
+
+def _entry(kind, value, name='shared_test_total'):
+    return {'name': name, 'help': 'Test', 'kind': kind, 'labels': [['worker', 'any']], 'value': value}
+
+
+def test_shared_directory_adds_up_every_process(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, '_directory', str(tmp_path))
+    metrics.counter('shared_test_total', 'Test', worker='any').inc(1)
+    live, dead = os.getppid(), _dead_pid()
+    for pid, entries in ((live, [_entry('counter', 10), _entry('gauge', 3, 'shared_test_gauge')]),
+                         (dead, [_entry('counter', 100), _entry('gauge', 30, 'shared_test_gauge')])):
+        (tmp_path / f'{pid}.json').write_text(json.dumps(entries))
+
+    # A dead process's counters still count, its gauges do not
+    text = metrics.render()
+    assert 'shared_test_total{worker="any"} 111' in text
+    assert 'shared_test_gauge{worker="any"} 3' in text
+
+    metrics.process_exited(str(tmp_path), dead)
+    assert not (tmp_path / f'{dead}.json').exists()
+    assert metrics.render() == text
@@ -0,0 +1,85 @@
+import socket
+from datetime import datetime, timedelta
+
+import pytest
+
+import outbox
+
+
+def _free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_port(tracker, app, monkeypatch):
+    # Points Flask-Mail at a local port with no TLS or login, as the
+    # `python -m aiosmtpd -n -l localhost:8025` setup in config.py does
+    port = _free_port()
+    monkeypatch.setitem(app.extensions, 'mail', tracker.mail.init_mail(
+        {'MAIL_SERVER': '127.0.0.1', 'MAIL_PORT': port, 'MAIL_USE_TLS': False}))
+    return port
+
+
+def _enqueue(run, recipient):
+    def enqueue(cur):
+        outbox.enqueue(cur, recipient, 'Password Reset Request', 'Follow the link', 'noreply@demo.com')
+        return cur.lastrowid
+    return run(enqueue)
+
+
+def _email(run, email_id):
+    def email(cur):
+        cur.execute("SELECT * FROM email_outbox WHERE id = %s", [email_id])
+        return cur.fetchone()
+    return run(email)
+
+
+def _drain(tracker, app):
+    with app.app_context():
+        return outbox.drain(tracker.mysql.connection, tracker.mail)
+
+
+def test_drain_delivers_and_marks_sent(tracker, app, run, smtp_port):
+    controller_module = pytest.importorskip('aiosmtpd.controller')
+
+    class Inbox:
+        def __init__(self):
+            self.envelopes = []
+
+        async def handle_DATA(self, server, session, envelope):
+            self.envelopes.append(envelope)
+            return '250 Message accepted for delivery'
+
+    inbox = Inbox()
+    controller = controller_module.Controller(inbox, hostname='127.0.0.1', port=smtp_port)
+    controller.start()
+    try:
+        email_id = _enqueue(run, 'delivered@example.com')
+        assert _drain(tracker, app) >= 1
+    finally:
+        controller.stop()
+
+    [envelope] = [envelope for envelope in inbox.envelopes if envelope.rcpt_tos == ['delivered@example.com']]
+    assert envelope.mail_from == 'noreply@demo.com'
+    assert b'Password Reset Request' in envelope.content
+    email = _email(run, email_id)
+    assert email['sent_at'] is not None
+    assert email['attempts'] == 1
+    assert run(outbox.delivery_stats)['sent'] >= 1
+
+
+def test_unreachable_server_schedules_a_retry(tracker, app, run, smtp_port):
+    # Nothing listens on smtp_port
+    email_id = _enqueue(run, 'retried@example.com')
+    assert _drain(tracker, app) == 0
+
+    email = _email(run, email_id)
+    assert email['sent_at'] is None
+    assert email['attempts'] == 1
+    assert email['last_error']
+    assert email['next_attempt_at'] > datetime.now() + timedelta(seconds=outbox.backoff(1) - 5)
+    # Not due again until the backoff has passed
+    assert _drain(tracker, app) == 0
+    assert _email(run, email_id)['attempts'] == 1
@@ -0,0 +1,33 @@
+import time
+
+import pytest
+
+import metrics
+import pools
+
+
+class Busy(Exception):
+    pass
+
+
+def test_full_queue_is_rejected_without_starting_a_pool():
+    pool = pools.BoundedPool('test_pool', 'call', 'Test calls', Busy, max_pending=0)
+    with pytest.raises(Busy):
+        pool.run('sum', sum, [1, 2])
+    assert pool._executor is None
+    assert 'test_pool_rejected_total{call="sum"} 1' in metrics.render()
+
+
+def test_calls_run_in_the_pool_and_free_their_slot():
+    pool = pools.BoundedPool('test_pool', 'call', 'Test calls', Busy, workers=1, max_pending=1, timeout=60)
+    try:
+        assert pool.run('sum', sum, [1, 2]) == 3
+        # The slot is released by the future's callback, just after the result
+        deadline = time.monotonic() + 5
+        while not pool._slots.acquire(blocking=False):
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        pool._slots.release()
+        assert pool.run('sum', sum, [3, 4]) == 7
+    finally:
+        pool._executor.shutdown()
@@ -0,0 +1,46 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+import reports
+
+
+@pytest.mark.parametrize('year, month', [(0, 1), (1, 1), (9999, 12), (2024, 13)])
+def test_report_outside_the_supported_dates_is_not_found(client, year, month):
+    assert client.get(f'/reports/{year}/{month}/heatmap.png').status_code == 404
+
+
+def _on_disk(root):
+    return sum(os.path.getsize(os.path.join(directory, name)) for directory, _, names in os.walk(root) for name in names)
+
+
+def test_disk_cache_stays_within_its_budget(tmp_path):
+    cache = reports.DiskCache(str(tmp_path), 10000)
+    for number in range(50):
+        cache.put(f'{number:064x}', 'png', b'x' * 1000)
+        assert _on_disk(tmp_path) <= cache.max_bytes
+
+    # The most recently written images are the ones kept
+    assert cache.get(f'{49:064x}', 'png') == b'x' * 1000
+    assert cache.get(f'{0:064x}', 'png') is None
+
+
+def test_running_month_validator_expires_with_the_day(tracker, client, monkeypatch):
+    # If-None-Match: * is answered with the current ETag before anything is rendered
+    def etag(url):
+        response = client.get(url, headers={'If-None-Match': '*'})
+        assert response.status_code == 304
+        return response.headers['ETag']
+
+    now = datetime.now()
+    running, past = f'/reports/{now.year}/{now.month}/heatmap.png', f'/reports/{now.year - 2}/1/heatmap.png'
+    today = {url: etag(url) for url in (running, past)}
+
+    class Tomorrow(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return now + timedelta(days=1)
+    monkeypatch.setattr(tracker, 'datetime', Tomorrow)
+    assert etag(past) == today[past]
+    assert etag(running) != today[running]
@@ -0,0 +1,49 @@
+from datetime import datetime
+
+import repository
+import rollup
+import sqlite_backend
+
+
+def test_translate_rewrites_mysql_constructs():
+    translate = sqlite_backend.translate
+    assert translate("SELECT * FROM users WHERE id = %s") == "SELECT * FROM users WHERE id = ?"
+    assert translate("INSERT IGNORE INTO t VALUES (%s)") == "INSERT OR IGNORE INTO t VALUES (?)"
+    assert (translate("INSERT INTO t (a) VALUES (%s) ON DUPLICATE KEY UPDATE a = a + VALUES(a)")
+            == "INSERT INTO t (a) VALUES (?) ON CONFLICT DO UPDATE SET a = a + excluded.a")
+    assert translate("SELECT YEAR(t.date), MONTH(date) FROM t") == (
+        "SELECT CAST(substr(t.date, 1, 4) AS INTEGER), CAST(substr(date, 6, 2) AS INTEGER) FROM t")
+    assert translate("SELECT id FROM t LIMIT 5 FOR UPDATE SKIP LOCKED").strip() == "SELECT id FROM t LIMIT 5"
+
+
+def test_multi_row_insert_returns_each_new_id(run, user_id):
+    # MySQL reports the first id of a multi-row INSERT and sqlite3 the last;
+    # the backend hands back the first, which insert_transactions counts on
+    when = datetime(2024, 3, 5, 12, 0)
+    rows = [(index + 1, f'row {index}', 'Food', when) for index in range(repository.MAX_INSERT_ROWS + 3)]
+    ids = run(repository.insert_transactions, user_id, rows)
+
+    assert len(ids) == len(rows)
+    stored = run(lambda cur: [repository.transaction(cur, transaction_id) for transaction_id in ids])
+    assert [row['description'] for row in stored] == [description for _, description, _, _ in rows]
+
+
+def test_rows_come_back_as_dicts_with_datetimes(run, user_id):
+    when = datetime(2024, 3, 5, 12, 30, 15)
+    transaction_id = run(repository.add_transaction, user_id, 42, 'lunch', 'Food', when)
+    row = run(repository.transaction, transaction_id)
+    assert row['date'] == when
+    assert (row['user_id'], row['amount'], row['description'], row['category']) == (user_id, 42, 'lunch', 'Food')
+
+
+def test_rollup_upsert_accumulates(run, user_id):
+    when = datetime(2024, 3, 5)
+    run(rollup.add_rows, user_id, [(10, 'Food', when), (5, 'Food', when)])
+    run(rollup.add_rows, user_id, [(7, 'Food', when)])
+    assert run(rollup.period_total, user_id, 2024, 3) == 22
+
+
+def test_archived_users_by_year(run, user_id):
+    run(lambda cur: cur.execute("INSERT INTO archived_years (user_id, year, txn_count, total) VALUES (%s, 1990, 3, 30)",
+                                [user_id]))
+    assert run(repository.archived_users_by_year)[1990] >= 1
@@ -0,0 +1,128 @@
+import io
+from datetime import datetime
+
+import history
+import periods
+import repository
+import rollup
+
+
+def _spending(run, user_id):
+    return run(repository.period_spending, user_id, periods.current_month())
+
+
+def _ids(run, user_id):
+    return [row['id'] for row in run(repository.period_transactions, user_id, periods.current_month())]
+
+
+def test_add_edit_delete_keep_the_rollup_in_sync(client, run, user_id):
+    response = client.post('/addTransactions', data={'amount': '120', 'description': 'groceries', 'category': 'Food'})
+    assert response.status_code == 302
+    [transaction_id] = _ids(run, user_id)
+    assert _spending(run, user_id) == 120
+    assert run(rollup.drift, user_id) == []
+
+    response = client.post(f'/editCurrentMonthTransaction/{transaction_id}',
+                           data={'amount': '80', 'description': 'groceries', 'category': 'Food', 'date': 'today'})
+    assert response.status_code == 302
+    assert run(rollup.drift, user_id) == []
+
+    response = client.post(f'/deleteCurrentMonthTransaction/{transaction_id}')
+    assert response.status_code == 302
+    assert _ids(run, user_id) == []
+    assert _spending(run, user_id) == 0
+    assert run(rollup.drift, user_id) == []
+
+
+def test_history_pages_through_every_row_once(client, run, user_id):
+    rows = [(index + 1, f'row {index}', 'Food', datetime(2024, 1 + index % 12, 1 + index % 28, 9, index % 60))
+            for index in range(2 * history.PAGE_SIZE + 17)]
+    ids = run(repository.insert_transactions, user_id, rows)
+
+    seen, sizes, cursor = [], [], ''
+    while True:
+        page = client.get('/transactionHistory/page', query_string={'cursor': cursor}).get_json()
+        seen += page['transactions']
+        sizes.append(len(page['transactions']))
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+
+    assert sizes == [history.PAGE_SIZE, history.PAGE_SIZE, 17]
+    assert sorted(row['id'] for row in seen) == sorted(ids)
+    dates = [datetime.strptime(row['date'], '%d %B, %Y') for row in seen]
+    assert dates == sorted(dates, reverse=True)
+
+
+def test_history_filter_never_fails(client, user_id):
+    for month, year in [('13', '2024'), ('x', '2024'), ('03', 'x'), ('03', '9999'), ('03', '0')]:
+        response = client.post('/transactionHistory', data={'month': month, 'year': year})
+        assert response.status_code == 200
+        response.close()
+
+
+def test_import_stores_the_valid_rows_and_reports_the_rest(client, run, user_id):
+    csv = ('date,amount,category,description\n'
+           '2024-02-01,10,Food,bread\n'
+           '2024-02-03,not a number,Food,milk\n'
+           '2024-02-05,25,Transport,bus\n')
+    response = client.post('/transactions/import', data={'file': (io.BytesIO(csv.encode()), 'rows.csv')})
+    body = response.get_json()
+
+    assert response.status_code == 200
+    assert (body['imported'], body['failed']) == (2, 1)
+    assert body['errors'][0]['line'] == 3
+    assert run(rollup.period_total, user_id, 2024, 2) == 35
+    assert run(rollup.drift, user_id) == []
+
+
+def test_batch_applies_once_per_idempotency_key(client, run, user_id):
+    def batch(key, body):
+        return client.post('/api/transactions/batch', json=body, headers={'Idempotency-Key': key})
+
+    creates = [{'date': '2024-05-02', 'amount': 40, 'category': 'Food', 'description': 'market'},
+               {'date': '2024-05-09', 'amount': 60, 'category': 'Fun', 'description': 'cinema'}]
+    first = batch('create', {'create': creates})
+    assert first.status_code == 200
+    kept, dropped = first.get_json()['created']
+
+    replay = batch('create', {'create': creates})
+    assert replay.headers['Idempotent-Replayed'] == 'true'
+    assert replay.get_json() == first.get_json()
+    assert run(rollup.period_total, user_id, 2024, 5) == 100
+
+    second = batch('change', {'update': [{'id': kept, 'amount': 55, 'category': 'Rent', 'description': 'market'}],
+                              'delete': [dropped, 10 ** 9]}).get_json()
+    assert (second['updated'], second['deleted'], second['missing']) == ([kept], [dropped], [10 ** 9])
+    assert run(repository.transaction, kept)['category'] == 'Rent'
+    assert run(rollup.period_total, user_id, 2024, 5) == 55
+    assert run(rollup.drift, user_id) == []
+
+
+def test_batch_with_a_key_still_in_progress_is_a_conflict(client, run, user_id):
+    # Claimed by another request that has not stored its response yet
+    run(lambda cur: cur.execute("INSERT INTO idempotency_keys (user_id, idempotency_key) VALUES (%s, %s)",
+                                (user_id, 'busy')))
+    response = client.post('/api/transactions/batch', headers={'Idempotency-Key': 'busy'},
+                           json={'create': [{'amount': 5, 'category': 'Food', 'description': 'tea'}]})
+    assert response.status_code == 409
+    assert _ids(run, user_id) == []
+
+
+def test_add_rejects_invalid_input(client, run, user_id):
+    for data in [{'amount': 'ten', 'description': 'tea', 'category': 'Food'},
+                 {'amount': '0', 'description': 'tea', 'category': 'Food'},
+                 {'amount': '10', 'description': '', 'category': 'Food'}]:
+        assert client.post('/addTransactions', data=data).status_code == 200
+    assert _ids(run, user_id) == []
+    assert run(rollup.drift, user_id) == []
+
+
+def test_other_users_transactions_are_not_found(tracker, client, run, user_id):
+    other = run(tracker.repository.create_user, 'Other', 'User', f'other{user_id}@example.com', f'other{user_id}', '!')
+    transaction_id = run(repository.insert_transactions, other, [(30, 'rent', 'Rent', datetime(2024, 7, 1))])[0]
+
+    for url in (f'/deleteTransaction/{transaction_id}', f'/deleteCurrentMonthTransaction/{transaction_id}',
+                f'/editCurrentMonthTransaction/{transaction_id}', '/editCurrentMonthTransaction/999999999'):
+        assert client.post(url, data={'amount': '1', 'description': 'x', 'category': 'Rent', 'date': 'x'}).status_code == 404
+    assert run(repository.transaction, transaction_id)['amount'] == 30
@@ -0,0 +1,47 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+# Every write to a user's transactions bumps a per-user version in
+# user_data_versions, in the same DB transaction as the write. Read-only
+# endpoints derive their ETag/Last-Modified from it, so a client polling an
+# unchanged chart gets a 304. The version is cached in-process for a few
+# seconds and the writer's own session carries the version it produced, so
+# most conditional requests are answered without a query.
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def bump(cur, user_id):
+    modified = datetime.now(timezone.utc).replace(microsecond=0, tzinfo=None)
+    cur.execute("""
+        INSERT INTO user_data_versions (user_id, version, modified_at) VALUES (%s, 1, %s)
+        ON DUPLICATE KEY UPDATE version = version + 1, modified_at = VALUES(modified_at)
+    """, (user_id, modified))
+    cur.execute("SELECT version, modified_at FROM user_data_versions WHERE user_id = %s", [user_id])
+    return _remember(user_id, cur.fetchone())
+
+
+def current(cur_factory, user_id, known_version=0, ttl=5):
+    # cur_factory is only called when the cached version is missing, stale or
+    # older than one the caller has already seen (e.g. from its session).
+    with _lock:
+        cached = _cache.get(user_id)
+    if cached and cached[0] >= known_version and time.monotonic() - cached[2] < ttl:
+        return cached[0], cached[1]
+
+    with cur_factory() as cur:
+        cur.execute("SELECT version, modified_at FROM user_data_versions WHERE user_id = %s", [user_id])
+        return _remember(user_id, cur.fetchone())
+
+
+def _remember(user_id, row):
+    if row:
+        version, modified = row['version'], row['modified_at'].replace(tzinfo=timezone.utc)
+    else:
+        version, modified = 0, EPOCH
+    with _lock:
+        _cache[user_id] = (version, modified, time.monotonic())
+    return version, modified
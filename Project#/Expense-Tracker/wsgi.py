@@ -0,0 +1,70 @@
+import gc
+import importlib
+
+from flask import render_template
+
+# WSGI entry point for pre-fork servers (see gunicorn.conf.py):
+#
+#     gunicorn -c gunicorn.conf.py wsgi:application
+#
+# With preload the master imports this module once, so the app (built by
+# app.create_app()), the modules its views import lazily (PRELOAD_MODULES)
+# and every compiled Jinja template are built before fork and shared
+# copy-on-write by the workers instead of being built again in each of them. Nothing here connects to
+# anything: the DB pool (db.py), the hashing process pool (hashing.py) and
+# the Redis client's connections are all made on first use and rebuilt
+# after a fork. warm_up() opens a DB connection and, when a shared cache is
+# configured, a Redis connection in each worker before it takes traffic, and
+# renders the common templates once. It also starts the worker's metrics
+# writer (metrics.share), which must not run in the master. The hashing pool
+# still starts its processes on the first login or signup.
+#
+# gc.disable() keeps the collector from freeing objects (and leaving holes
+# in pages) while the master loads, and gc.freeze() moves everything loaded
+# into the permanent generation, so collections in the workers never write
+# to the shared objects' headers and copy their pages. The collector is
+# back on once create_app() returns, whether or not a fork follows.
+WARM_UP_TEMPLATES = ['index.html', 'about.html']
+
+
+def create_app():
+    gc.disable()
+    import app as tracker
+    app = tracker.create_app()
+    for name in app.config.get('PRELOAD_MODULES', ()):
+        importlib.import_module(name)
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    # Compile the URL map's matcher now rather than on the first request
+    app.url_map.update()
+    gc.freeze()
+    gc.enable()
+    return app
+
+
+def warm_up(app):
+    # In each worker, after fork and before it accepts requests
+    import metrics
+    if app.config.get('METRICS_DIR'):
+        metrics.share(app.config['METRICS_DIR'], app.config['METRICS_FLUSH_SECONDS'])
+    with app.app_context():
+        try:
+            with app.extensions['mysql'].connection.cursor() as cur:
+                cur.execute("SELECT 1")
+        except Exception:
+            # The pool reconnects on demand, so a worker that starts while
+            # the DB is down still serves once it is back
+            app.logger.warning('warm-up could not reach the database', exc_info=True)
+    shared = app.extensions['dashboard_cache'].shared
+    if shared is not None:
+        try:
+            shared.ping()
+        except Exception:
+            # Shared cache errors are already treated as misses
+            app.logger.warning('warm-up could not reach the shared cache', exc_info=True)
+    with app.test_request_context('/'):
+        for name in WARM_UP_TEMPLATES:
+            render_template(name)
+
+
+application = create_app()